@@ -0,0 +1,283 @@
+# Purpose: Headless benchmark of the local tracker's hot paths under synthetic load, run before a build ships to lab machines
+#
+# Drives a TrialRecorder's callbacks with synthetic mouse/keyboard event streams at fixed rates (no input hooks installed) and
+# runs record_screen against a synthetic screen, reporting per-event callback latency percentiles, dropped events, bytes
+# written and CPU time. Thresholds can be passed so a regression fails the run:
+#
+#   python benchmarks/bench_tracker.py --rates 1000 10000 50000 --max-p99-us 50 --max-dropped 0
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tracking.utility.measure import TrialRecorder
+from tracking.utility.screenrecording import record_screen
+
+DEFAULT_RATES = (1_000, 10_000, 50_000)
+
+# Share of each event type in the synthetic input stream, movement dominates real sessions
+EVENT_MIX = (("move", 0.8), ("click", 0.05), ("scroll", 0.05), ("key", 0.1))
+
+# Events are paced in small batches, sleeping per event is not possible at tens of thousands of events per second
+PACE_BATCH = 50
+
+ALL_INPUTS = {
+    "mouse_movement": True,
+    "mouse_clicks": True,
+    "mouse_scrolls": True,
+    "keyboard_inputs": True,
+}
+
+
+# Stands in for a pynput KeyCode
+class SyntheticKey:
+    def __init__(self, char, vk):
+        self.char = char
+        self.vk = vk
+
+
+KEYS = [SyntheticKey(chr(c), c) for c in range(ord("a"), ord("z") + 1)]
+
+
+# Stands in for ScreenSource: a BGRA screen where a small patch changes every `change_every` grabs
+class SyntheticScreen:
+    def __init__(self, width, height, change_every=1):
+        self.width = width
+        self.height = height
+        self.change_every = change_every
+        self._frame = np.zeros((height, width, 4), dtype=np.uint8)
+        self._grabs = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def grab(self):
+        self._grabs += 1
+        if self._grabs % self.change_every == 0:
+            y = self._grabs * 7 % max(1, self.height - 16)
+            x = self._grabs * 13 % max(1, self.width - 16)
+            self._frame[y : y + 16, x : x + 16] = self._grabs % 255
+        return self._frame.tobytes()
+
+
+def dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def percentiles_us(latencies_ns):
+    if not len(latencies_ns):
+        return {"p50": 0, "p95": 0, "p99": 0, "max": 0}
+    p50, p95, p99 = np.percentile(latencies_ns, (50, 95, 99)) / 1000
+    return {
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(latencies_ns.max()) / 1000, 2),
+    }
+
+
+# Builds the callback each synthetic event makes, so the timed loop only calls and measures
+def build_events(recorder, count, seed=0):
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(
+        [kind for kind, _ in EVENT_MIX], size=count, p=[p for _, p in EVENT_MIX]
+    )
+    xs = np.cumsum(rng.integers(-20, 21, size=count)) % 1920
+    ys = np.cumsum(rng.integers(-20, 21, size=count)) % 1080
+
+    events = []
+    held = None
+    for kind, x, y in zip(kinds, xs.tolist(), ys.tolist()):
+        if kind == "move":
+            events.append((recorder.on_move, (x, y)))
+        elif kind == "click":
+            events.append((recorder.on_click, (x, y, None, True)))
+        elif kind == "scroll":
+            events.append((recorder.on_scroll, (x, y, 0, 1)))
+        elif held is None:
+            held = KEYS[len(events) % len(KEYS)]
+            events.append((recorder.on_press, (held,)))
+        else:
+            events.append((recorder.on_release, (held,)))
+            held = None
+    return events
+
+
+# Feeds `rate` events per second for `duration` seconds into a fresh recorder and writes its files
+def bench_callbacks(rate, duration, sampling=None):
+    task = {"taskName": "benchmark", "mouseSampling": sampling}
+    count = int(rate * duration)
+
+    with tempfile.TemporaryDirectory() as dir_trial:
+        recorder = TrialRecorder(task, ALL_INPUTS, dir_trial)
+        events = build_events(recorder, count)
+        latencies = np.empty(count, dtype=np.int64)
+
+        cpu_start = time.process_time()
+        recorder.start(listen=False)
+        start = time.perf_counter_ns()
+        interval_ns = 1_000_000_000 / rate
+
+        for i, (callback, args) in enumerate(events):
+            if i % PACE_BATCH == 0:
+                ahead_ns = start + i * interval_ns - time.perf_counter_ns()
+                if ahead_ns > 0:
+                    time.sleep(ahead_ns / 1e9)
+
+            t0 = time.perf_counter_ns()
+            callback(*args)
+            latencies[i] = time.perf_counter_ns() - t0
+
+        wall_s = (time.perf_counter_ns() - start) / 1e9
+        recorder.stop()
+        finalize_start = time.perf_counter()
+        recorder.finalize()
+        finalize_s = time.perf_counter() - finalize_start
+        cpu_s = time.process_time() - cpu_start
+
+        return {
+            "rate": rate,
+            "events": count,
+            "achieved_rate": round(count / wall_s) if wall_s else 0,
+            "latency_us": percentiles_us(latencies),
+            "dropped": sum(buffer.dropped for _, _, buffer, _ in recorder.streams),
+            "mouse_kept": recorder.mouse_sampler.kept,
+            "bytes_written": dir_size(dir_trial),
+            "cpu_s": round(cpu_s, 3),
+            "cpu_pct": round(100 * cpu_s / wall_s, 1) if wall_s else 0,
+            "finalize_s": round(finalize_s, 3),
+        }
+
+
+# Records `duration` seconds of the synthetic screen through the real capture/encode pipeline
+def bench_recorder(width, height, duration, capture_config=None, change_every=1):
+    with tempfile.TemporaryDirectory() as dir_trial:
+        stop_event = threading.Event()
+        active_event = threading.Event()
+        result = {}
+
+        def run():
+            result.update(
+                record_screen(
+                    dir_trial,
+                    capture_config,
+                    stop_event,
+                    active_event,
+                    source=SyntheticScreen(width, height, change_every),
+                )
+            )
+
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(duration)
+        stop_event.set()
+        thread.join()
+        wall_s = time.perf_counter() - start
+        cpu_s = time.process_time() - cpu_start
+
+        return {
+            "screen": f"{width}x{height}",
+            "mode": (capture_config or {}).get("mode", "full"),
+            **result,
+            "bytes_written": dir_size(dir_trial),
+            "cpu_s": round(cpu_s, 3),
+            "cpu_pct": round(100 * cpu_s / wall_s, 1),
+        }
+
+
+# Threshold checks, returns a message per regression found
+def check_results(results, max_p99_us=None, max_dropped=None):
+    failures = []
+    for run in results["callbacks"]:
+        if max_p99_us is not None and run["latency_us"]["p99"] > max_p99_us:
+            failures.append(
+                f"{run['rate']}/s: p99 callback latency {run['latency_us']['p99']}us > {max_p99_us}us"
+            )
+        if max_dropped is not None and run["dropped"] > max_dropped:
+            failures.append(
+                f"{run['rate']}/s: {run['dropped']} events dropped > {max_dropped}"
+            )
+    for run in results["recorder"]:
+        if max_dropped is not None and run["dropped"] > max_dropped:
+            failures.append(
+                f"recorder {run['screen']} {run['mode']}: {run['dropped']} frames dropped > {max_dropped}"
+            )
+    return failures
+
+
+def print_results(results):
+    print(
+        f"{'rate/s':>8} {'events':>8} {'achieved':>9} {'p50us':>7} {'p95us':>7} {'p99us':>7} {'maxus':>8} {'dropped':>8} {'bytes':>10} {'cpu%':>6} {'final_s':>8}"
+    )
+    for run in results["callbacks"]:
+        lat = run["latency_us"]
+        print(
+            f"{run['rate']:>8} {run['events']:>8} {run['achieved_rate']:>9} {lat['p50']:>7} {lat['p95']:>7} {lat['p99']:>7} {lat['max']:>8} {run['dropped']:>8} {run['bytes_written']:>10} {run['cpu_pct']:>6} {run['finalize_s']:>8}"
+        )
+
+    for run in results["recorder"]:
+        print(
+            f"recorder {run['screen']} ({run['mode']}): captured {run['captured']}, dropped {run['dropped']}, "
+            f"written {run['frames_written']}, {run['bytes_written']} bytes, cpu {run['cpu_pct']}%"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the local tracker under synthetic input load"
+    )
+    parser.add_argument("--rates", type=int, nargs="+", default=DEFAULT_RATES)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--sampling", default="distance")
+    parser.add_argument("--screen", default="1920x1080")
+    parser.add_argument("--record-seconds", type=float, default=3.0)
+    parser.add_argument("--capture-mode", default="full", choices=("full", "diff"))
+    parser.add_argument("--no-recorder", action="store_true")
+    parser.add_argument("--max-p99-us", type=float)
+    parser.add_argument("--max-dropped", type=int)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {"callbacks": [], "recorder": []}
+    for rate in args.rates:
+        results["callbacks"].append(
+            bench_callbacks(rate, args.duration, {"mode": args.sampling})
+        )
+
+    if not args.no_recorder:
+        width, height = (int(n) for n in args.screen.lower().split("x"))
+        results["recorder"].append(
+            bench_recorder(
+                width, height, args.record_seconds, {"mode": args.capture_mode}
+            )
+        )
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = check_results(results, args.max_p99_us, args.max_dropped)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,9 +5,8 @@ import json
 import threading
 import os
 import shutil
-import time
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 
 # PyQt libraries
@@ -18,6 +17,7 @@ from PyQt6.QtCore import (
     pyqtSignal,
     pyqtSlot,
     QObject,
+    QEventLoop,
     QPropertyAnimation,
     QPoint,
 )
@@ -35,19 +35,14 @@ from PyQt6.QtWidgets import (
     QFileDialog,
     QStackedLayout,
 )
-from tracking.tracking import conduct_trial
-from tracking.utility.file_management import package_session_results, get_save_dir
-from tracking.utility.measure import (
-    pause_event,
-    stop_event,
-    data_storage_complete_event,
+from tracking.tracking import TrialState, start_trial
+from tracking.utility.file_management import (
+    SessionPackager,
+    build_upload_manifest,
+    get_save_dir,
+    get_zip_path,
+    read_upload_chunk,
 )
-from tracking.utility.screenrecording import (
-    recording_stop,
-    recording_active,
-    adjustments_finished,
-)
-from tracking.utility.heatmap import heatmap_generation_complete
 
 
 # Need for import paths to work for icons when creating the executable
@@ -60,6 +55,8 @@ def resource_path(relative_path):
 class SignalBridge(QObject):
     session_data_received = pyqtSignal(dict)
     shutdown_requested = pyqtSignal()
+    # Emitted from the finalize worker once a trial's results are on disk
+    trial_saved = pyqtSignal(object)
 
 
 # Ref https://www.pythonguis.com/tutorials/pyqt6-widgets/
@@ -69,13 +66,16 @@ class GlobalToolbar(QWidget):
         self.signal_bridge = signal_bridge
         self.signal_bridge.session_data_received.connect(self.on_session_data_received)
         self.signal_bridge.shutdown_requested.connect(self.shutdown_app)
+        self.signal_bridge.trial_saved.connect(self.on_trial_saved)
 
         self.session_json = {}
         self.setup_ui()
         self.initial_setup()  # so facilitator can specify output path beforehand rather than during the session (cleaner)
         self.trial_index = 0
+        self.packager = None  # zips each trial in the background once it finishes
         self.oldPos = None  # track toolbar pos on screen
-        self.session_paused = False
+        self.current_trial = None
+        self.saving_trials = []  # stopped trials whose results are still being written
         self.countdown = 0
 
         self.timer = QTimer()
@@ -111,9 +111,7 @@ class GlobalToolbar(QWidget):
         else:
             print("Cleaning up current trial before shutting down...")
             try:
-                stop_event.set()
-                pause_event.clear()
-                recording_stop.set()
+                self.stop_trial()
                 self.wait_trial_save()
             except Exception as e:
                 print(f"Error shutting down cleanly: {e}")
@@ -492,12 +490,10 @@ class GlobalToolbar(QWidget):
                 self.validate_storage_loc(
                     self.storage_dir, self.session_id, clean_existing=True
                 )
+                self.packager = SessionPackager(self.session_id, self.storage_dir)
             if self.trial_index > 0:
-                # Make sure prior trial's details are saved before moving fwd
-                stop_event.set()
-                pause_event.clear()
-                recording_stop.set()
-                self.wait_trial_save()
+                # Prior trial keeps saving in the background while the next one runs
+                self.stop_trial()
 
             # Get next trial's details
             trial = self.trials[self.trial_index]
@@ -526,28 +522,19 @@ class GlobalToolbar(QWidget):
             self.session_json["trials"] = self.trials
 
             self.start_btn.setEnabled(False)  # disable for the rest of the session
-            self.session_paused = False
 
             self.pause_btn.setEnabled(True)
             self.pause_btn.setIcon(QIcon(resource_path("icons/pause.svg")))
             self.pause_label.setText("Pause")
 
-            pause_event.set()  # start tracking
-            stop_event.clear()
-            data_storage_complete_event.clear()
-            heatmap_generation_complete.clear()
-
-            trial_thread = threading.Thread(
-                target=conduct_trial,
-                args=(
-                    self.session_id,
-                    task,
-                    factor,
-                    self.storage_dir,
-                    (self.trial_index + 1),
-                ),
+            # start tracking
+            self.current_trial = start_trial(
+                self.session_id,
+                task,
+                factor,
+                self.storage_dir,
+                (self.trial_index + 1),
             )
-            trial_thread.start()
 
             if task_dur:
                 self.initiate_countdown(int(float(task_dur) * 60))
@@ -612,7 +599,7 @@ class GlobalToolbar(QWidget):
             )  # disable pause when task is at its end since no tracking occuring
             self.pause_btn.setIcon(QIcon(resource_path("icons/resume.svg")))
             self.pause_label.setText("Resume")
-        if self.countdown > 0 and not self.session_paused:
+        if self.countdown > 0 and self.trial_state() == TrialState.RUNNING:
             self.countdown -= 1
             self.format_countdown()
         else:
@@ -628,9 +615,7 @@ class GlobalToolbar(QWidget):
             else:
                 self.next_btn.setEnabled(False)  # no more tasks to move on to
 
-            self.session_paused = True
-            pause_event.clear()
-            stop_event.set()
+            self.stop_trial()
 
     # Showing time in HH:MM:SS format
     def format_countdown(self):
@@ -641,26 +626,54 @@ class GlobalToolbar(QWidget):
 
     # Inverting state, as if we are running we pause and if we are paused we resume
     def pause_session(self):
-        self.session_paused = not self.session_paused  # toggle
-
-        if self.session_paused:
+        if self.trial_state() == TrialState.RUNNING:
             print("session paused")
+            self.current_trial.pause()
             self.pause_btn.setIcon(QIcon(resource_path("icons/resume.svg")))
             self.pause_label.setText("Resume")
-            pause_event.clear()
             self.timer.stop()
-        else:
+        elif self.trial_state() == TrialState.PAUSED:
             print("session resumed")
+            self.current_trial.resume()
             self.pause_btn.setIcon(QIcon(resource_path("icons/pause.svg")))
             self.pause_label.setText("Pause")
-            pause_event.set()
             if self.countdown > 0:
                 self.timer.start(1000)
-            else:
-                pause_event.set()
+
+    def trial_state(self):
+        if self.current_trial is None:
+            return TrialState.IDLE
+        return self.current_trial.state
+
+    # Ends tracking for the current trial, its results keep saving in the background until trial_saved is emitted
+    def stop_trial(self):
+        trial = self.current_trial
+        # nothing running or already stopped
+        if trial is None or trial.future is not None:
+            return
+
+        self.saving_trials.append(trial)
+        trial.stop().add_done_callback(lambda _: self.trial_finalized(trial))
+
+    # Runs on the finalize worker: hands the trial to the background packager and lets the GUI thread know
+    def trial_finalized(self, trial):
+        if trial.future.exception() is not None:
+            print(f"Error saving trial results: {trial.future.exception()}")
+        if self.packager is not None:
+            self.packager.add_trial(trial.dir_trial)
+        self.signal_bridge.trial_saved.emit(trial)
+
+    @pyqtSlot(object)
+    def on_trial_saved(self, trial):
+        if trial in self.saving_trials:
+            self.saving_trials.remove(trial)
 
     def update_recording_status(self):
-        if recording_active.is_set():
+        if any(
+            trial.recording
+            for trial in (self.current_trial, *self.saving_trials)
+            if trial
+        ):
             self.recording_btn.setIcon(QIcon(resource_path("icons/recording.svg")))
             self.recording_label.setText("Recording")
         else:
@@ -745,23 +758,21 @@ class GlobalToolbar(QWidget):
                 self.trial_index > 0
             ):  # only attempt to save results if they completed at least 1 trial
 
-                pause_event.clear()
-                stop_event.set()
-
+                self.stop_trial()
                 self.wait_trial_save()
 
                 session_path = get_save_dir(self.storage_dir, self.session_id)
 
                 if os.path.exists(session_path):
                     try:
-                        package_session_results(self.session_id, self.storage_dir)
+                        self.packager.finish()
                     except Exception as e:
                         print(f"Error packaging data: {e}")
 
             print("Tracking complete. Waiting for shutdown signal...")
             self.hide()
 
-    # Used to make sure the current trial's data saved before advancing to avoid race conditions and data loss of fatter prior trials
+    # Used at the end of a session to make sure every stopped trial's data is saved (and queued for packaging) before results are zipped
     def wait_trial_save(self):
         # Add pop-up in case local saving results (mp4, heatmap, csv's) takes a while before the app can close so user doesn't mistake for frozen
         save_msg = QDialog(self)
@@ -787,49 +798,13 @@ class GlobalToolbar(QWidget):
         save_msg.show()
         QApplication.processEvents()
 
-        curr_trial = self.trials[self.trial_index - 1]
-        curr_task_id = str(curr_trial["taskID"])
-        curr_task = self.tasks[curr_task_id]
-        curr_measurements = curr_task["measurementOptions"]
-
-        # Accounting for future expansion where the user may bave specified "Other" collection mechanisms which we do not handle tracking for
-        supported_measurements = {
-            "Mouse Movement",
-            "Mouse Clicks",
-            "Mouse Scrolls",
-            "Keyboard Inputs",
-            "Screen Recording",
-            "Heat Map",
-        }
-
-        if set(curr_measurements) & supported_measurements:
-            # Have to use while loops here or else while waiting the overlaying pop-up will freeze. Using this we can invoke an update to UI
-            if not data_storage_complete_event.is_set():
-                while not data_storage_complete_event.is_set():
-                    time.sleep(0.1)
-                    QApplication.processEvents()
-
-            if (
-                "Heat Map" in curr_measurements
-                and not heatmap_generation_complete.is_set()
-            ):
-                while not heatmap_generation_complete.is_set():
-                    time.sleep(0.1)
-                    QApplication.processEvents()
-
-            if recording_active.is_set():
-                recording_stop.set()
-                while recording_active.is_set():
-                    time.sleep(0.1)
-                    QApplication.processEvents()
-
-            if (
-                "Screen Recording" in curr_measurements
-                and not adjustments_finished.is_set()
-            ):
-                while not adjustments_finished.is_set():
-                    time.sleep(0.1)
-                    QApplication.processEvents()
+        # Block here without freezing the pop-up: a local event loop keeps the UI responsive and wakes each time the finalize
+        # worker signals a trial is saved (connected before checking so the signal cannot be missed)
+        wait_loop = QEventLoop()
+        self.signal_bridge.trial_saved.connect(wait_loop.quit)
+        while self.saving_trials:
+            wait_loop.exec()
+        self.signal_bridge.trial_saved.disconnect(wait_loop.quit)
 
         save_msg.close()
 
@@ -923,6 +898,9 @@ class FlaskWrapper:
         self.signal_bridge = signal_bridge
         self.toolbar_ref = toolbar_ref
 
+        # Hashing a large zip is slow so the upload manifest is only built once per zip
+        self.upload_manifest = None
+
         # enable CORS w/ specific routes
         CORS(
             self.app,
@@ -956,6 +934,38 @@ class FlaskWrapper:
             except Exception as e:
                 return jsonify({"error": str(e)}), 500
 
+        # Chunked upload support, the website asks for the manifest then pulls each chunk it still needs to send to the server
+        @self.app.route("/get_session_upload_manifest", methods=["GET"])
+        def get_session_upload_manifest():
+            try:
+                manifest = self.get_upload_manifest()
+                if manifest is None:
+                    return jsonify({"error": "local tracking ZIP not found"}), 404
+
+                return jsonify(manifest), 200
+
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+
+        @self.app.route("/get_session_zip_chunk/<int:index>", methods=["GET"])
+        def get_session_zip_chunk(index):
+            try:
+                manifest = self.get_upload_manifest()
+                if manifest is None:
+                    return jsonify({"error": "local tracking ZIP not found"}), 404
+                if not 0 <= index < len(manifest["chunks"]):
+                    return jsonify({"error": f"No chunk {index}"}), 404
+
+                chunk = manifest["chunks"][index]
+                return Response(
+                    read_upload_chunk(self.get_zip_path(), chunk),
+                    mimetype="application/octet-stream",
+                    headers={"X-Chunk-Sha256": chunk["sha256"]},
+                )
+
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+
         # Allow retrieval of JSON results
         @self.app.route("/get_session_json_results", methods=["GET"])
         def get_session_json_results():
@@ -994,6 +1004,22 @@ class FlaskWrapper:
 
             return jsonify({"message": "Shutting down local tracking server..."}), 200
 
+    def get_zip_path(self):
+        return get_zip_path(self.toolbar_ref.storage_dir, self.toolbar_ref.session_id)
+
+    # Builds the upload manifest for the session zip, reusing it until the zip changes
+    def get_upload_manifest(self):
+        zip_path = self.get_zip_path()
+        if not os.path.exists(zip_path):
+            return None
+
+        stat = os.stat(zip_path)
+        key = (zip_path, stat.st_size, stat.st_mtime_ns)
+        if self.upload_manifest is None or self.upload_manifest[0] != key:
+            self.upload_manifest = (key, build_upload_manifest(zip_path))
+
+        return self.upload_manifest[1]
+
     def run_study(self):
         try:
             session_data = request.get_json()
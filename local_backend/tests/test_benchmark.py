@@ -0,0 +1,26 @@
+# Purpose: Smoke test for the tracker benchmark harness so it keeps working as the hot paths change (short runs, no thresholds)
+
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_tracker import bench_callbacks, bench_recorder, check_results
+
+
+def test_callback_benchmark_writes_all_streams():
+    run = bench_callbacks(2_000, 0.2)
+    assert run["events"] == 400
+    assert run["dropped"] == 0
+    assert run["bytes_written"] > 0
+    assert run["latency_us"]["p50"] <= run["latency_us"]["p99"]
+
+    failures = check_results({"callbacks": [run], "recorder": []}, max_p99_us=0)
+    assert len(failures) == 1
+
+
+def test_recorder_benchmark_uses_synthetic_screen():
+    run = bench_recorder(64, 48, 0.5)
+    assert run["captured"] > 0
+    assert run["frames_written"] >= run["captured"] - run["dropped"]
+    assert run["bytes_written"] > 0
@@ -0,0 +1,38 @@
+# Purpose: Unit tests for the shared trial clock, checking pauses land on the trial timeline and the metadata readers rely on
+
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tracking.utility.clock import TrialClock
+
+
+def test_pauses_recorded_on_timeline():
+    clock = TrialClock()
+    clock.start()
+    time.sleep(0.01)
+    clock.pause()
+    time.sleep(0.02)
+    clock.resume()
+    time.sleep(0.01)
+    clock.stop()
+
+    ((pause_start, pause_end),) = clock.pauses
+    assert 0 < pause_start < pause_end < clock.end_ns
+    assert pause_end - pause_start >= 20_000_000
+    assert clock.paused_ns() == pause_end - pause_start
+
+
+def test_stop_closes_open_pause():
+    clock = TrialClock()
+    clock.start()
+    clock.pause()
+    clock.stop()
+
+    metadata = clock.metadata()
+    assert not clock.paused
+    assert metadata["pauses"][0][1] == metadata["end_ns"]
+    assert metadata["clock"] == "trial_monotonic_ns"
+    assert metadata["trial_start_wall"] == clock.start_wall
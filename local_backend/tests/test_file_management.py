@@ -0,0 +1,115 @@
+# Purpose: Unit tests for packaging session results, making sure trials are zipped as they finish and media is stored uncompressed
+
+
+import os
+import sys
+import hashlib
+import zipfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tracking.utility.file_management import (
+    SessionPackager,
+    append_to_spool,
+    build_upload_manifest,
+    get_file_path,
+    get_save_dir,
+    read_upload_chunk,
+    write_stream_file,
+)
+from tracking.utility.ring_buffer import RECORD_DTYPE
+from tracking.utility.trial_format import TRIAL_STREAM_FORMAT, read_trial_stream
+
+
+def make_trial(dir_session, name, files):
+    trial_path = os.path.join(dir_session, name)
+    os.makedirs(trial_path)
+    for file_name, content in files.items():
+        with open(os.path.join(trial_path, file_name), "wb") as f:
+            f.write(content)
+    return trial_path
+
+
+def test_trials_packaged_incrementally(tmp_path):
+    storage = str(tmp_path)
+    dir_session = get_save_dir(storage, 7)
+    packager = SessionPackager(7, storage)
+
+    first = make_trial(
+        dir_session,
+        "Task_Factor_trial_1",
+        {"Mouse Movement.fcol": b"\x00" * 4096, "Screen Recording.mp4": b"v" * 64},
+    )
+    packager.add_trial(first)
+    packager._trials.put(
+        None
+    )  # let the worker drain so the zip can be inspected mid-session
+    packager._worker.join()
+
+    # Archive is complete and readable after the first trial alone
+    with zipfile.ZipFile(packager.zip_path) as zipf:
+        assert zipf.testzip() is None
+        infos = {info.filename: info for info in zipf.infolist()}
+    assert not os.path.exists(first)
+    assert (
+        infos["Task_Factor_trial_1/Screen Recording.mp4"].compress_type
+        == zipfile.ZIP_STORED
+    )
+    assert (
+        infos["Task_Factor_trial_1/Mouse Movement.fcol"].compress_type
+        == zipfile.ZIP_DEFLATED
+    )
+
+    # Final trial (and an empty one) are picked up when the session finishes
+    make_trial(dir_session, "Task_Factor_trial_2", {"Heat Map.png": b"p" * 32})
+    make_trial(dir_session, "Task_Factor_trial_3", {})
+    packager = SessionPackager(7, storage)
+    packager.finish()
+
+    with zipfile.ZipFile(packager.zip_path) as zipf:
+        names = zipf.namelist()
+    assert "Task_Factor_trial_2/Heat Map.png" in names
+    assert "Task_Factor_trial_3/" in names
+    assert len(names) == 4
+    assert not os.path.exists(dir_session)
+
+
+def test_upload_manifest_chunks_cover_zip(tmp_path):
+    zip_path = str(tmp_path / "session_results_7.zip")
+    data = os.urandom(10_000)
+    with open(zip_path, "wb") as f:
+        f.write(data)
+
+    manifest = build_upload_manifest(zip_path, chunk_size=4096)
+
+    assert manifest["size"] == len(data)
+    assert manifest["sha256"] == hashlib.sha256(data).hexdigest()
+    assert [chunk["size"] for chunk in manifest["chunks"]] == [4096, 4096, 1808]
+    assert (
+        b"".join(read_upload_chunk(zip_path, chunk) for chunk in manifest["chunks"])
+        == data
+    )
+
+
+# The task countdown stops while paused, so events are only cut once the running time is past the task duration
+def test_duration_cutoff_excludes_paused_time(tmp_path):
+    dir_trial = str(tmp_path)
+    second = 1_000_000_000
+    records = np.zeros(4, dtype=RECORD_DTYPE)
+    # Paused from 10s to 40s on the trial timeline, so these ran for 5s, 40s, 55s and 65s
+    records["t_ns"] = [5 * second, 70 * second, 85 * second, 95 * second]
+    append_to_spool("Mouse Movement", records, dir_trial)
+
+    write_stream_file(
+        "Mouse Movement",
+        "mouse",
+        True,
+        {"taskDuration": 1},
+        dir_trial,
+        {"pauses": [[10 * second, 40 * second]]},
+    )
+
+    _, columns = read_trial_stream(
+        get_file_path(dir_trial, "Mouse Movement", TRIAL_STREAM_FORMAT)
+    )
+    assert columns["t_ns"].tolist() == [5 * second, 70 * second, 85 * second]
@@ -0,0 +1,33 @@
+# Purpose: Unit tests for the incremental heatmap grid, making sure points land in the right cells and off-screen points are ignored
+
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tracking.utility.heatmap import HeatmapAccumulator
+
+
+def test_points_binned_into_downscaled_cells():
+    heatmap = HeatmapAccumulator(100, 50, cell_size=10)
+    assert heatmap.counts.shape == (5, 10)
+
+    # Fed in two batches like the drain thread does
+    heatmap.add(np.array([0, 9, 95]), np.array([0, 9, 45]))
+    heatmap.add(np.array([95, -1, 100]), np.array([49, 10, 10]))
+
+    assert heatmap.points == 4
+    assert heatmap.counts[0, 0] == 2
+    assert heatmap.counts[4, 9] == 2
+    assert heatmap.counts.sum() == 4
+
+
+def test_render_matches_screenshot_size():
+    heatmap = HeatmapAccumulator(101, 61, cell_size=4)
+    heatmap.add(np.array([50]), np.array([30]))
+
+    rendered = heatmap.render((61, 101, 3))
+    assert rendered.shape == (61, 101)
+    peak_y, peak_x = np.unravel_index(rendered.argmax(), rendered.shape)
+    assert abs(peak_y - 30) <= 2 and abs(peak_x - 50) <= 2
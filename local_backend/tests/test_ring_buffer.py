@@ -0,0 +1,49 @@
+# Purpose: Unit tests for the ring buffers the input callbacks push into, making sure records survive wrap-around and overflow is counted instead of blocking
+
+
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tracking.utility.ring_buffer import RingBuffer
+
+
+def test_drain_returns_records_in_order():
+    buffer = RingBuffer(capacity=8)
+    for i in range(5):
+        assert buffer.push(i * 1000, i, i * 2, i * 3)
+
+    records = buffer.drain()
+    assert records["t_ns"].tolist() == [0, 1000, 2000, 3000, 4000]
+    assert records["y"].tolist() == [0, 2, 4, 6, 8]
+    assert records["code"].tolist() == [0, 3, 6, 9, 12]
+    assert len(buffer) == 0
+    assert len(buffer.drain()) == 0
+
+
+def test_drain_handles_wrap_around():
+    buffer = RingBuffer(capacity=8)
+    for i in range(6):
+        buffer.push(i, i, i)
+    buffer.drain()
+
+    # These writes cross the end of the backing array
+    for i in range(6, 12):
+        buffer.push(i, i, i)
+
+    assert buffer.drain()["t_ns"].tolist() == list(range(6, 12))
+
+
+def test_overflow_drops_instead_of_overwriting():
+    buffer = RingBuffer(capacity=4)
+    results = [buffer.push(i, i, i) for i in range(6)]
+
+    assert results == [True, True, True, True, False, False]
+    assert buffer.dropped == 2
+    assert buffer.drain()["t_ns"].tolist() == [0, 1, 2, 3]
+
+
+def test_capacity_must_be_power_of_two():
+    with pytest.raises(ValueError):
+        RingBuffer(capacity=10)
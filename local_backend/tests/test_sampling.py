@@ -0,0 +1,68 @@
+# Purpose: Unit tests for the mouse movement samplers, checking how many points each mode keeps and that path end points and timing survive simplification
+
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tracking.utility.sampling import (
+    DistanceSampler,
+    SimplifySampler,
+    TimeSampler,
+    build_sampler,
+)
+
+MS = 1_000_000
+
+
+def collect(sampler_cls, points, *args):
+    kept = []
+    sampler = sampler_cls(lambda t, x, y: kept.append((t, x, y)), *args)
+    for point in points:
+        sampler.feed(*point)
+    sampler.flush()
+    return sampler, kept
+
+
+def test_distance_sampler_matches_pixel_threshold():
+    points = [(i * MS, i * 3, 0) for i in range(10)]  # 3 px per event
+    sampler, kept = collect(DistanceSampler, points, 10)
+
+    assert [x for _, x, _ in kept] == [0, 12, 24]
+    assert (sampler.seen, sampler.kept) == (10, 3)
+
+
+def test_time_sampler_keeps_one_point_per_interval():
+    points = [(i * MS, i, i) for i in range(100)]
+    _, kept = collect(TimeSampler, points, 25)
+
+    assert [t // MS for t, _, _ in kept] == [0, 25, 50, 75]
+
+
+def test_simplify_keeps_corners_and_end_point():
+    # Right along y=0 then straight down, an L shaped drag
+    points = [(i * MS, i, 0) for i in range(50)]
+    points += [((50 + i) * MS, 49, i) for i in range(1, 50)]
+    sampler, kept = collect(SimplifySampler, points, 1.0, 10_000)
+
+    kept_xy = [(x, y) for _, x, y in kept]
+    assert kept_xy[0] == (0, 0) and kept_xy[-1] == (49, 49)
+    # the corner survives to within epsilon
+    assert any(abs(x - 49) + abs(y) <= 1 for x, y in kept_xy)
+    assert sampler.kept <= 6 and sampler.seen == len(points)
+
+
+def test_simplify_forces_points_to_preserve_timing():
+    points = [(i * 10 * MS, i, 0) for i in range(31)]  # 300 ms straight line
+    _, kept = collect(SimplifySampler, points, 1.0, 100)
+
+    gaps = [b[0] - a[0] for a, b in zip(kept, kept[1:])]
+    assert max(gaps) <= 100 * MS
+    assert kept[-1][1] == 30
+
+
+def test_build_sampler_falls_back_to_default():
+    assert build_sampler(None, print).mode == "distance"
+    assert build_sampler({"mode": "bogus"}, print).mode == "distance"
+    assert build_sampler({"mode": "rdp", "epsilon": 3}, print).mode == "simplify"
+    assert build_sampler("simplify", print).mode == "distance"
@@ -3,39 +3,188 @@
 
 import os
 import sys
-import time
 import threading
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from tracking.utility.screenrecording import record_screen, recording_stop
+from imageio_ffmpeg import count_frames_and_secs, read_frames
+from tracking.utility.screenrecording import (
+    FrameDiffer,
+    FrameEncoder,
+    ScreenRecorder,
+    TimestampedFrameEncoder,
+    record_screen,
+)
 
 
-def test_screen_recording():
-    output_loc = os.path.expanduser(
-        "~"
-    )  # For testing purposes we will be saving to user's home dir
-    filename = "sample"
-    test_duration = 300  # In seconds but can test longer length videos if needed
+# Frames captured irregularly (stalls, dropped captures) should still produce a video as long as the recording, with no re-encode
+def test_encoder_places_frames_by_timestamp(tmp_path):
+    file_path = str(tmp_path / "timed.mp4")
+    width, height, fps = 64, 48, 15
+    encoder = FrameEncoder(file_path, width, height, fps=fps)
 
-    # Have to use threading since that is how screen recording is setup to run, using events to trigger stop
-    recording_thread = threading.Thread(
-        target=record_screen, args=(output_loc, filename)
+    frame_ms = [0, 66, 133, 800, 866, 1500]  # two long gaps in capture
+    for i, ms in enumerate(frame_ms):
+        frame = bytes([i * 40 % 256, 0, 0, 255]) * (width * height)
+        encoder.write(ms * 1_000_000, frame)
+    encoder.close(end_ns=2_000_000_000)
+
+    frames, secs = count_frames_and_secs(file_path)
+    assert frames == 2 * fps
+    assert abs(secs - 2.0) < 0.1
+
+
+# Two captures rounding to the same slot keep the newer one, the older one is not what the screen showed at that time
+def test_encoder_keeps_newest_capture_for_a_slot(tmp_path):
+    file_path = str(tmp_path / "slots.mp4")
+    width, height, fps = 64, 48, 15
+    encoder = FrameEncoder(file_path, width, height, fps=fps)
+
+    black = bytes([0, 0, 0, 255]) * (width * height)
+    white = bytes([255, 255, 255, 255]) * (width * height)
+    encoder.write(0, black)
+    encoder.write(20_000_000, white)  # still slot 0
+    encoder.close(end_ns=133_000_000)
+
+    reader = read_frames(file_path)
+    meta = next(reader)
+    first = next(reader)
+    reader.close()
+    assert meta["size"] == (width, height)
+    assert encoder.frames_written == 2
+    assert sum(first) / len(first) > 200  # rgb24 decode of the white frame
+
+
+# Diff mode sends only the changed frames, the video still runs to when recording stopped with each frame at its capture time
+def test_timestamped_encoder_writes_only_sent_frames(tmp_path):
+    file_path = str(tmp_path / "changes.mp4")
+    width, height = 64, 48
+    encoder = TimestampedFrameEncoder(file_path, width, height)
+
+    for i, ms in enumerate([0, 400, 1300]):
+        frame = bytes([i * 100, 0, 0, 255]) * (width * height)
+        encoder.write(ms * 1_000_000, frame)
+    encoder.close(end_ns=2_000_000_000)
+
+    assert not encoder.failed
+    assert encoder.frames_written == 4  # three changes and the last one held to the end
+    frames, secs = count_frames_and_secs(file_path)
+    assert frames == 4
+    assert abs(secs - 2.0) < 0.15  # the held frame shows for about one frame period
+
+
+# Static frames are skipped, any changed pixel keeps the frame, even one the sampled grid does not cover
+def test_differ_skips_unchanged_frames():
+    width, height = 64, 32
+    differ = FrameDiffer(width, height, block_size=16)
+    blank = bytearray(width * height * 4)
+    caret = bytearray(blank)
+    caret[(5 * width + 40) * 4 + 1] = 255  # one pixel changed
+
+    frames = [blank, blank, caret, caret, blank]
+    kept = [differ.keep(i * 66_000_000, bytes(f)) for i, f in enumerate(frames)]
+
+    assert kept == [True, False, True, False, True]
+    stats = differ.stats()
+    assert (stats["captured"], stats["encoded"]) == (5, 3)
+    assert stats["frames"]["changed"][2] == 1 / 8  # 1 of 8 blocks
+    assert stats["sample_step"] == 4
+
+
+# Content moving within a block keeps its pixel total, it still has to count as a change
+def test_differ_sees_movement_within_a_block():
+    width, height = 64, 32
+    differ = FrameDiffer(width, height, block_size=16)
+
+    def frame_with_sprite(left):
+        pixels = bytearray(width * height * 4)
+        for row in range(4, 7):
+            for col in range(left, left + 3):
+                pixels[(row * width + col) * 4 : (row * width + col) * 4 + 4] = (
+                    b"\xff" * 4
+                )
+        return bytes(pixels)
+
+    frames = [frame_with_sprite(2), frame_with_sprite(5), frame_with_sprite(5)]
+    kept = [differ.keep(i * 66_000_000, f) for i, f in enumerate(frames)]
+
+    assert kept == [True, True, False]
+    assert differ.stats()["frames"]["changed"][1] == 1 / 8
+
+
+class BlankScreen:
+    width, height = 64, 32
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def grab(self):
+        return bytes(self.width * self.height * 4)
+
+
+# A stop requested before the recording thread gets going must still end the recording
+def test_early_stop_is_not_lost(tmp_path):
+    recorder = ScreenRecorder(str(tmp_path))
+    recorder.stop()
+
+    thread = threading.Thread(
+        target=record_screen,
+        args=(str(tmp_path), None, recorder.stop_event, recorder.active),
+        kwargs={"source": BlankScreen()},
+        daemon=True,
     )
-    recording_thread.start()
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert not recorder.active.is_set()
 
-    # Allows us to stress test by running unit test with variable lengths
-    time.sleep(test_duration)
 
-    recording_stop.set()
-    recording_thread.join()
+# Records a synthetic screen until stopped, the mp4 lands in the trial folder and covers the whole recording
+def test_screen_recording(tmp_path):
+    stop_event = threading.Event()
+    active_event = threading.Event()
+    timer = threading.Timer(1.0, stop_event.set)
+    timer.start()
+
+    run = record_screen(
+        str(tmp_path), None, stop_event, active_event, source=BlankScreen()
+    )
+    timer.join()
 
-    file_path = os.path.join(output_loc, f"{filename}_screen_recording.mp4")
+    file_path = tmp_path / "Screen Recording.mp4"
     assert (
-        os.path.exists(file_path) == True
+        file_path.exists()
     ), f"Sample screen recording failed to generate at {file_path}"
+    assert not active_event.is_set()
+    assert not run["encoder_failed"]
 
-    os.remove(file_path)  # Cleans up the generated sample recording
+    frames, secs = count_frames_and_secs(str(file_path))
+    assert frames == run["frames_written"]
+    assert abs(secs - 1.0) < 0.2
 
 
-if __name__ == "__main__":
-    test_screen_recording()
+# A static screen in diff mode is encoded once and held, not repeated for every slot
+def test_diff_mode_recording_sends_changed_frames_only(tmp_path):
+    stop_event = threading.Event()
+    timer = threading.Timer(1.0, stop_event.set)
+    timer.start()
+
+    run = record_screen(
+        str(tmp_path),
+        {"mode": "diff"},
+        stop_event,
+        threading.Event(),
+        source=BlankScreen(),
+    )
+    timer.join()
+
+    assert run["captured"] > 2
+    assert (
+        run["frames_written"] == 2
+    )  # the first frame and the same frame held to the end
+    frames, secs = count_frames_and_secs(str(tmp_path / "Screen Recording.mp4"))
+    assert frames == 2
+    assert abs(secs - 1.0) < 0.2
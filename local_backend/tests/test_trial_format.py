@@ -0,0 +1,57 @@
+# Purpose: Unit tests for the binary columnar trial stream format, making sure columns and metadata round trip and bad files are rejected
+
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tracking.utility.trial_format import read_trial_stream, write_trial_stream
+
+
+def test_round_trip_keeps_types_and_metadata(tmp_path):
+    file_path = tmp_path / "Mouse Movement.fcol"
+    columns = {
+        "t_ns": np.array([0, 1_500_000, 3_250_000_000], dtype=np.int64),
+        "x": np.array([10, 20, 1919], dtype=np.int32),
+        "y": np.array([5, 15, 1079], dtype=np.int32),
+    }
+    write_trial_stream(file_path, columns, {"measurement_type": "Mouse Movement"})
+
+    metadata, read_columns = read_trial_stream(file_path)
+    assert metadata["measurement_type"] == "Mouse Movement"
+    assert list(read_columns) == ["t_ns", "x", "y"]
+    for name, values in columns.items():
+        assert read_columns[name].dtype == values.dtype
+        assert read_columns[name].tolist() == values.tolist()
+
+
+def test_empty_stream(tmp_path):
+    file_path = tmp_path / "Keyboard Inputs.fcol"
+    write_trial_stream(
+        file_path,
+        {"t_ns": np.empty(0, dtype=np.int64), "code": np.empty(0, dtype=np.int32)},
+        {"keys": []},
+    )
+
+    metadata, columns = read_trial_stream(file_path)
+    assert metadata == {"keys": []}
+    assert len(columns["t_ns"]) == 0 and len(columns["code"]) == 0
+
+
+def test_mismatched_column_lengths_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_trial_stream(
+            tmp_path / "bad.fcol",
+            {"t_ns": np.zeros(2, dtype=np.int64), "x": np.zeros(3, dtype=np.int32)},
+            {},
+        )
+
+
+def test_non_stream_file_rejected(tmp_path):
+    file_path = tmp_path / "Mouse Movement.csv"
+    file_path.write_bytes(b"Time,running_time,x,y\n" + b"0" * 64)
+
+    with pytest.raises(ValueError):
+        read_trial_stream(file_path)
@@ -1,56 +1,147 @@
 # Purpose: Holds all functionality for facilitating a session (excluding measurement-specific functionality which is in measure.py)
 
-import threading
-import time
 import os
-from .utility.screenrecording import record_screen, recording_active, recording_stop
-from .utility.measure import record_measurements, data_storage_complete_event
-from .utility.heatmap import generate_heatmap, heatmap_generation_complete
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from .utility.clock import TrialClock
+from .utility.screenrecording import ScreenRecorder
+from .utility.measure import TrialRecorder
+from .utility.heatmap import HeatmapAccumulator, generate_heatmap, grab_screenshot
 from .utility.file_management import get_save_dir
 
 
-# Running a single trial (task-factor combo) at this point
-def conduct_trial(sess_id, task, factor, storage_path, trial_num):
-    # Debugging purposes
-    print(f"Starting trial for task {task['taskName']}, factor {factor['factorName']}")
-
-    measurements = task["measurementOptions"]
-
-    # Set flags based on the measurement collection mechanisms selected for the given task
-    measurement_flags = {
-        "mouse_movement": "Mouse Movement" in measurements,
-        "mouse_clicks": "Mouse Clicks" in measurements,
-        "mouse_scrolls": "Mouse Scrolls" in measurements,
-        "keyboard_inputs": "Keyboard Inputs" in measurements,
-        "screen_recording": "Screen Recording" in measurements,
-        "heat_map": "Heat Map" in measurements,
-    }
-
-    # Find the base trial dir path to save to
-    dir_trial = get_save_dir(storage_path, sess_id, task, factor, trial_num)
-    os.makedirs(dir_trial, exist_ok=True)
-
-    # Only screen record current trial if requested (no longer all trials)
-    if measurement_flags["screen_recording"]:
-        recorder_thread = threading.Thread(target=record_screen, args=(dir_trial,))
-        recorder_thread.start()
-
-    # Start tracking as long as at least 1 option was selected for the current task
-    if any(measurement_flags.values()):
-        data_storage_complete_event.clear()  # reset at the start of a trial
-        record_measurements(task, measurement_flags, dir_trial)
-
-    # will want to change this eventually so only heatmap generated if the researcher requested it instead of always when mouse movement is involved
-    if measurement_flags["heat_map"]:
-        data_storage_complete_event.wait()
-        heatmap_generation_complete.clear()
-        heatmap_thread = threading.Thread(target=generate_heatmap, args=(dir_trial,))
-        heatmap_thread.start()
-    else:
-        heatmap_generation_complete.set()
-
-    # Do not want to mess with these if screen recording was not active in the first place
-    if measurement_flags["screen_recording"]:
-        recording_stop.set()
-        while recording_active.is_set():
-            time.sleep(0.1)
+# Lifecycle of a trial as seen by the toolbar
+class TrialState(Enum):
+    IDLE = "idle"  # no trial started yet
+    RUNNING = "running"
+    PAUSED = "paused"
+    STOPPED = "stopped"  # tracking ended, results still being saved
+    SAVED = "saved"
+
+
+# Stopped trials write their results one at a time off the GUI thread, while the next trial is already capturing
+finalize_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="trial-finalize"
+)
+
+
+# Starts a trial right away. Capture runs on the recorders' own threads until the trial is stopped
+def start_trial(sess_id, task, factor, storage_path, trial_num):
+    trial = Trial(sess_id, task, factor, storage_path, trial_num)
+    trial.start()
+    return trial
+
+
+# A single trial (task-factor combo) and everything capturing it
+class Trial:
+    def __init__(self, sess_id, task, factor, storage_path, trial_num):
+        self.task = task
+        self.factor = factor
+        self.state = TrialState.IDLE
+        self.future = None
+
+        measurements = task["measurementOptions"]
+
+        # Set flags based on the measurement collection mechanisms selected for the given task
+        self.measurement_flags = {
+            "mouse_movement": "Mouse Movement" in measurements,
+            "mouse_clicks": "Mouse Clicks" in measurements,
+            "mouse_scrolls": "Mouse Scrolls" in measurements,
+            "keyboard_inputs": "Keyboard Inputs" in measurements,
+            "screen_recording": "Screen Recording" in measurements,
+            "heat_map": "Heat Map" in measurements,
+        }
+
+        # Find the base trial dir path to save to
+        self.dir_trial = get_save_dir(storage_path, sess_id, task, factor, trial_num)
+        os.makedirs(self.dir_trial, exist_ok=True)
+
+        # Every stream (input events and video frames) is stamped against this one clock
+        self.clock = TrialClock()
+
+        # Heatmap is accumulated from mouse movement while the trial runs
+        self.heatmap = None
+        if self.measurement_flags["heat_map"]:
+            self.heatmap = HeatmapAccumulator.for_primary_screen(task.get("heatMap"))
+
+        # Track as long as at least 1 option was selected for the current task
+        self.recorder = None
+        if any(self.measurement_flags.values()):
+            self.recorder = TrialRecorder(
+                task, self.measurement_flags, self.dir_trial, self.heatmap, self.clock
+            )
+
+        # Only screen record current trial if requested (no longer all trials)
+        self.screen_recorder = None
+        if self.measurement_flags["screen_recording"]:
+            self.screen_recorder = ScreenRecorder(
+                self.dir_trial, task.get("screenCapture"), self.clock
+            )
+
+        self.screenshot = None
+
+    # True until this trial's mp4 is fully written
+    @property
+    def recording(self):
+        return self.screen_recorder is not None and self.screen_recorder.active.is_set()
+
+    def start(self):
+        # Debugging purposes
+        print(
+            f"Starting trial for task {self.task['taskName']}, factor {self.factor['factorName']}"
+        )
+
+        self.clock.start()
+        if self.screen_recorder is not None:
+            self.screen_recorder.start()
+        if self.recorder is not None:
+            self.recorder.start()
+        self.state = TrialState.RUNNING
+
+    def pause(self):
+        if self.state == TrialState.RUNNING:
+            if self.recorder is not None:
+                self.recorder.pause()
+            self.state = TrialState.PAUSED
+
+    def resume(self):
+        if self.state == TrialState.PAUSED:
+            if self.recorder is not None:
+                self.recorder.resume()
+            self.state = TrialState.RUNNING
+
+    # Ends capture immediately and queues the trial's results to be written in the background.
+    # Returns a future that completes (with the trial dir) once every result for the trial is on disk
+    def stop(self):
+        if self.future is not None:  # already stopped
+            return self.future
+
+        self.clock.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.screen_recorder is not None:
+            self.screen_recorder.stop()
+
+        # The heatmap is drawn over what the participant saw, so the screen is grabbed now rather than when it is rendered
+        if self.heatmap is not None:
+            self.screenshot = grab_screenshot()
+
+        self.state = TrialState.STOPPED
+        self.future = finalize_executor.submit(self._finalize)
+        return self.future
+
+    def _finalize(self):
+        if self.recorder is not None:
+            self.recorder.finalize()
+
+        # will want to change this eventually so only heatmap generated if the researcher requested it instead of always when mouse movement is involved
+        if self.heatmap is not None:
+            generate_heatmap(self.dir_trial, self.heatmap, self.screenshot)
+            self.screenshot = None
+
+        # Recorder finishes writing its mp4 while the streams and heatmap are saved
+        if self.screen_recorder is not None:
+            self.screen_recorder.join()
+
+        self.state = TrialState.SAVED
+        return self.dir_trial
@@ -0,0 +1,87 @@
+# Purpose: One monotonic nanosecond clock per trial that every stream (mouse, keyboard, video frames) is stamped against
+#
+# All timestamps are nanoseconds since the trial started on time.monotonic_ns(), pauses included, so input events and video
+# frames sit on the same timeline and can be aligned exactly. Wall clock time is read once at start and pauses are kept as
+# [start, end] intervals on that timeline, so readers derive absolute times and pause-free running time without any per
+# event formatting.
+
+import time
+from datetime import datetime
+import numpy as np
+
+
+# Timestamps on the trial timeline to how long the trial had been running, paused time removed. The same conversion as
+# the server's trial_streams.running_time_ns
+def running_time_ns(t_ns, pauses):
+    t_ns = np.asarray(t_ns, dtype=np.int64)
+    if not pauses:
+        return t_ns
+
+    bounds = np.asarray(pauses, dtype=np.int64).reshape(-1, 2)
+    paused_before = np.concatenate(([0], np.cumsum(bounds[:, 1] - bounds[:, 0])))
+    # Pauses that ended at or before each timestamp (nothing is captured during a pause)
+    return t_ns - paused_before[np.searchsorted(bounds[:, 1], t_ns, side="right")]
+
+
+class TrialClock:
+    def __init__(self):
+        self.start_ns = None
+        self.start_wall = None
+        self.end_ns = None
+        self.pauses = []  # [start_ns, end_ns] on the trial timeline
+        self._pause_started_ns = None  # set while paused
+
+    @property
+    def started(self):
+        return self.start_ns is not None
+
+    @property
+    def paused(self):
+        return self._pause_started_ns is not None
+
+    def start(self):
+        # Both read back to back so the wall clock lines up with timeline zero
+        self.start_wall = time.time()
+        self.start_ns = time.monotonic_ns()
+
+    # Called from the hook and capture threads, so it stays a single subtraction
+    def now_ns(self):
+        return time.monotonic_ns() - self.start_ns
+
+    def pause(self):
+        if not self.paused:
+            self._pause_started_ns = self.now_ns()
+
+    def resume(self):
+        if self.paused:
+            self.pauses.append([self._pause_started_ns, self.now_ns()])
+            self._pause_started_ns = None
+
+    # Marks the end of the trial, a pause still open when the trial stops runs up to that point
+    def stop(self):
+        if self.end_ns is None:
+            self.end_ns = self.now_ns()
+            if self.paused:
+                self.pauses.append([self._pause_started_ns, self.end_ns])
+                self._pause_started_ns = None
+
+    # Total paused time so far, counting a pause that is still open
+    def paused_ns(self):
+        total = sum(end - start for start, end in self.pauses)
+        if self.paused:
+            total += self.now_ns() - self._pause_started_ns
+        return total
+
+    # Saved with every stream so readers can rebuild wall clock and running time from the numeric timestamps
+    def metadata(self):
+        return {
+            "clock": "trial_monotonic_ns",
+            "trial_start_wall": self.start_wall,
+            "utc_offset_s": datetime.fromtimestamp(self.start_wall)
+            .astimezone()
+            .utcoffset()
+            .total_seconds(),
+            "end_ns": self.end_ns,
+            "pauses": [list(pause) for pause in self.pauses],
+            "paused_ns": self.paused_ns(),
+        }
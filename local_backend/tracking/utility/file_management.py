@@ -1,10 +1,25 @@
-# Purpose: All functionalities for producing csvs and zips
+# Purpose: All functionalities for producing trial stream files and zips
 
 
 import os
-import pandas as pd
+import queue
+import hashlib
+import threading
+import numpy as np
 import zipfile
 import shutil  # used to remove folder once zip is created
+from tracking.utility.clock import running_time_ns
+from tracking.utility.ring_buffer import RECORD_DTYPE
+from tracking.utility.trial_format import TRIAL_STREAM_FORMAT, write_trial_stream
+
+# Raw records are spooled here while a trial runs and turned into the columnar file once it ends
+SPOOL_FORMAT = f"{TRIAL_STREAM_FORMAT}.part"
+
+# Session zips are uploaded to the server in chunks of this size, each one verified by its sha256
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Already compressed media gains nothing from DEFLATE, so it is stored as-is in the session zip
+STORED_EXTENSIONS = (".mp4", ".png")
 
 
 # Returns the path to a directory for a session or trial depending on what parameters are passed
@@ -34,61 +49,178 @@ def get_file_path(dir_trial, measurement_type, file_format):
     return full_path
 
 
-# Generating a unique csv based on the measurement type during a given trial
-def write_to_csv(measurement_type, feature, arr_data, is_used, task, dir_trial):
+# Appending drained fixed-width records to the raw spool for a measurement type during a trial
+def append_to_spool(measurement_type, records, dir_trial):
+    file_path = get_file_path(dir_trial, measurement_type, SPOOL_FORMAT)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    with open(file_path, "ab") as f:
+        records.tofile(f)
+
+
+# Converting a trial's spool into its columnar trial stream file, the primary artifact for a measurement type
+def write_stream_file(measurement_type, feature, is_used, task, dir_trial, metadata):
     if not is_used:
         return
 
-    file_path = get_file_path(dir_trial, measurement_type, "csv")
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    spool_path = get_file_path(dir_trial, measurement_type, SPOOL_FORMAT)
+    if os.path.exists(spool_path):
+        records = np.fromfile(spool_path, dtype=RECORD_DTYPE)
+    else:  # nothing captured, but an empty stream is still produced for the trial
+        records = np.empty(0, dtype=RECORD_DTYPE)
 
-    # Prevent writing values that exceeded task duration due to delay between signaling task end and stopping tracking threads
+    # Prevent writing values that exceeded task duration due to delay between signaling task end and stopping tracking threads.
+    # The countdown stops while paused, so the duration is measured in running time, not on the trial timeline
     task_dur = task.get("taskDuration")
     if task_dur is not None:
-        time_cutoff = float(task_dur) * 60
-    else:
-        time_cutoff = float("inf")
-    updated_data = [row for row in arr_data if float(row[1]) <= time_cutoff]
+        running_ns = running_time_ns(records["t_ns"], metadata.get("pauses"))
+        records = records[running_ns <= int(float(task_dur) * 60 * 1e9)]
 
-    # Convert to df
     if feature == "mouse":
-        df = pd.DataFrame(updated_data, columns=["Time", "running_time", "x", "y"])
-
+        columns = {"t_ns": records["t_ns"], "x": records["x"], "y": records["y"]}
     elif feature == "keyboard":
-        df = pd.DataFrame(updated_data, columns=["Time", "running_time", "keys"])
+        columns = {
+            "t_ns": records["t_ns"],
+            "code": records["code"],
+            "vk": records["x"],
+            "pressed": records["y"],
+        }
+
+    file_path = get_file_path(dir_trial, measurement_type, TRIAL_STREAM_FORMAT)
+    write_trial_stream(
+        file_path,
+        columns,
+        {
+            "measurement_type": measurement_type,
+            "feature": feature,
+            "task_name": task.get("taskName"),
+            **metadata,
+        },
+    )
+
+    if os.path.exists(spool_path):
+        os.remove(spool_path)
+
+
+def get_zip_path(storage_path, session_id):
+    return os.path.join(storage_path, f"session_results_{session_id}.zip")
+
+
+# Appends one finished trial folder to the session zip then removes the folder. Reopening the zip per trial rewrites the central
+# directory each time, so the archive on disk is valid after every append
+def append_trial_to_zip(zip_path, dir_session, trial_path):
+    with zipfile.ZipFile(zip_path, "a", zipfile.ZIP_DEFLATED) as zipf:
+        packaged = set(zipf.namelist())  # a retried trial must not be added twice
+
+        # Empty trial folders (user used alt methods for collecting data) must still be included in zip
+        if not os.listdir(trial_path):
+            arcname = os.path.relpath(trial_path, dir_session) + "/"
+            if arcname not in packaged:
+                zipf.writestr(zipfile.ZipInfo(arcname), "")
+        else:
+            for root, _, files in os.walk(trial_path):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    arcname = os.path.relpath(file_path, dir_session)
+                    if arcname in packaged:
+                        continue
+
+                    compress_type = (
+                        zipfile.ZIP_STORED
+                        if file.lower().endswith(STORED_EXTENSIONS)
+                        else zipfile.ZIP_DEFLATED
+                    )
+                    zipf.write(file_path, arcname, compress_type=compress_type)
+
+    shutil.rmtree(trial_path)
+
+
+# Packages each trial into the session zip on a background thread as soon as the trial finishes, so ending a session only
+# costs packaging the final trial
+class SessionPackager:
+    def __init__(self, session_id, storage_path):
+        self.session_id = session_id
+        self.storage_path = storage_path
+        self.dir_session = get_save_dir(storage_path, session_id)
+        self.zip_path = get_zip_path(storage_path, session_id)
+
+        self._trials = queue.Queue()
+        self._worker = threading.Thread(target=self._package_trials, daemon=True)
+        self._worker.start()
+
+    def _package_trials(self):
+        while True:
+            trial_path = self._trials.get()
+            if trial_path is None:
+                return
+
+            try:
+                if os.path.isdir(trial_path):
+                    append_trial_to_zip(self.zip_path, self.dir_session, trial_path)
+            except Exception as e:
+                # Folder is left in place and picked up again when the session is finished
+                print(f"Error occured while packaging trial {trial_path}: {e}")
 
-    # Unique behavior for mouse movement CSVs because we did batch writes
-    if os.path.exists(
-        file_path
-    ):  # CSV already exists so we just append and don't add headers
-        df.to_csv(file_path, mode="a", header=False, index=False)
-    else:  # CSV does not exist so have to create and add headers
-        df.to_csv(file_path, index=False)
+    def add_trial(self, trial_path):
+        self._trials.put(trial_path)
 
+    # Waits for queued trials then packages anything left over and removes the session folder
+    def finish(self):
+        self._trials.put(None)
+        self._worker.join()
+        package_session_results(self.session_id, self.storage_path)
 
-# Packages a folder containing all session data into a zip file
+
+# Packages any trial folders not yet in the session zip, then removes the session folder
 def package_session_results(session_id, storage_path):
     dir_session = get_save_dir(storage_path, session_id)
-    zip_path = os.path.join(storage_path, f"session_results_{session_id}.zip")
+    zip_path = get_zip_path(storage_path, session_id)
     try:
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for trial_folder in os.listdir(dir_session):
-                trial_path = os.path.join(dir_session, trial_folder)
-                if os.path.isdir(trial_path):
-                    # Empty trial folders (user used alt methods for collecting data) must still be included in zip
-                    if not os.listdir(trial_path):
-                        arcname = os.path.relpath(trial_path, dir_session) + "/"
-                        zip_info = zipfile.ZipInfo(arcname)
-                        zipf.writestr(zip_info, "")
-                    else:
-                        for root, _, files in os.walk(trial_path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arcname = os.path.relpath(file_path, dir_session)
-                                zipf.write(file_path, arcname)
+        for trial_folder in sorted(os.listdir(dir_session)):
+            trial_path = os.path.join(dir_session, trial_folder)
+            if os.path.isdir(trial_path):
+                append_trial_to_zip(zip_path, dir_session, trial_path)
 
         shutil.rmtree(dir_session)
         print(f"Session {session_id} results saved to {zip_path}!")
 
     except Exception as e:
         print(f"Error occured while trying to package session {session_id}: {e}")
+
+
+# Describes the session zip for the chunked upload: whole file checksum plus each chunk's offset, size and checksum
+def build_upload_manifest(zip_path, chunk_size=UPLOAD_CHUNK_SIZE):
+    file_hash = hashlib.sha256()
+    chunks = []
+    offset = 0
+
+    with open(zip_path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+
+            file_hash.update(data)
+            chunks.append(
+                {
+                    "index": len(chunks),
+                    "offset": offset,
+                    "size": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                }
+            )
+            offset += len(data)
+
+    return {
+        "file_name": os.path.basename(zip_path),
+        "size": offset,
+        "sha256": file_hash.hexdigest(),
+        "chunk_size": chunk_size,
+        "chunks": chunks,
+    }
+
+
+def read_upload_chunk(zip_path, chunk):
+    with open(zip_path, "rb") as f:
+        f.seek(chunk["offset"])
+        return f.read(chunk["size"])
@@ -1,36 +1,86 @@
 # Purpose: Holds all functions related to generating heatmaps for mouse movement
+#
+# Mouse movement is binned into a downscaled count grid while the trial runs (fed by the drain thread), so when the trial stops
+# the heatmap only needs a blur, a colormap and an overlay on an in-memory screenshot
 
 
-import os
-import time
-import csv
 import cv2
+import mss
 import numpy as np
 from PIL import ImageGrab
-import threading
 from tracking.utility.file_management import get_file_path
-
-
-# Used to signal heatmap gen is complete
-heatmap_generation_complete = threading.Event()
-
-
-def generate_heatmap(dir_trial):
-    # Capture screenshot
-    screenshot_path = get_file_path(dir_trial, "screenshot", "png")
-    screenshot = ImageGrab.grab()
-    screenshot.save(screenshot_path)
-    screenshot = cv2.imread(screenshot_path)
-
-    # Retrieve path to the mouse movement csv needed to create the heatmap
-    mouse_data_path = get_file_path(dir_trial, "Mouse Movement", "csv")
-
-    # Extract mouse movement coordinates
-    coordinates = extract_mouse_movements(mouse_data_path)
-
-    if coordinates:
-        # Create the heatmap
-        heatmap = create_heatmap(coordinates, screenshot.shape)
+from tracking.utility.trial_format import TRIAL_STREAM_FORMAT, read_trial_stream
+
+# Screen pixels per heatmap cell, configurable per task with "heatMap": {"cellSize": n} in the session JSON
+DEFAULT_CELL_SIZE = 4
+
+# Blur kernel in screen pixels (matches the original full resolution 15x15 blur)
+BLUR_SIZE = 15
+
+
+# Running count of mouse positions on a grid of cell_size x cell_size screen pixels
+class HeatmapAccumulator:
+    def __init__(self, width, height, cell_size=DEFAULT_CELL_SIZE):
+        if cell_size < 1:
+            raise ValueError("Heatmap cell size must be at least 1 pixel")
+
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.counts = np.zeros(
+            (-(-height // cell_size), -(-width // cell_size)), dtype=np.float32
+        )
+        self.points = 0
+
+    # Sized to the primary monitor, the same one screenshots and recordings are taken of
+    @classmethod
+    def for_primary_screen(cls, config=None):
+        cell_size = int((config or {}).get("cellSize", DEFAULT_CELL_SIZE))
+        with mss.mss() as sct:
+            monitor = sct.monitors[1]
+        return cls(monitor["width"], monitor["height"], cell_size)
+
+    def add(self, xs, ys):
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        on_screen = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        if not on_screen.any():
+            return
+
+        np.add.at(
+            self.counts,
+            (ys[on_screen] // self.cell_size, xs[on_screen] // self.cell_size),
+            1,
+        )
+        self.points += int(on_screen.sum())
+
+    # Smoothed heat values at full screen resolution
+    def render(self, shape):
+        ksize = max(3, BLUR_SIZE // self.cell_size) | 1  # kernel must be odd
+        heatmap = cv2.GaussianBlur(self.counts, (ksize, ksize), 0)
+        return cv2.resize(heatmap, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+
+
+# Screenshot stays in memory (PIL gives RGB, OpenCV expects BGR)
+def grab_screenshot():
+    return cv2.cvtColor(np.asarray(ImageGrab.grab()), cv2.COLOR_RGB2BGR)
+
+
+# Saves the heatmap for a trial. Without an accumulator from the live trial it is rebuilt from the saved mouse movement stream.
+# A trial finalized in the background passes the screenshot it took when it stopped, the screen may already show the next task
+def generate_heatmap(dir_trial, accumulator=None, screenshot=None):
+    if screenshot is None:
+        screenshot = grab_screenshot()
+
+    if accumulator is None:
+        accumulator = HeatmapAccumulator(screenshot.shape[1], screenshot.shape[0])
+        mouse_data_path = get_file_path(
+            dir_trial, "Mouse Movement", TRIAL_STREAM_FORMAT
+        )
+        accumulator.add(*extract_mouse_movements(mouse_data_path))
+
+    if accumulator.points:
+        heatmap = accumulator.render(screenshot.shape)
 
         # Overlay the heatmap on the screenshot
         overlay = overlay_heatmap(heatmap, screenshot)
@@ -39,37 +89,10 @@ def generate_heatmap(dir_trial):
         heatmap_path = get_file_path(dir_trial, "Heat Map", "png")
         cv2.imwrite(heatmap_path, overlay)
 
-        time.sleep(1)
-
-        # removes the initial screenshot
-        os.remove(screenshot_path)
-
-    heatmap_generation_complete.set()
-
-
-def extract_mouse_movements(log_file):
-    coordinates = []
-    with open(log_file, "r") as f:
-        reader = csv.reader(f)
-        next(reader)  # skips the header
-        for row in reader:
-            x, y = int(row[2]), int(row[3])
-            coordinates.append((x, y))
-
-    return coordinates
-
-
-def create_heatmap(coordinates, screenshot_shape):
-    heatmap = np.zeros(screenshot_shape[:2], dtype=np.float32)
-
-    for x, y in coordinates:
-        if 0 <= x < screenshot_shape[1] and 0 <= y < screenshot_shape[0]:
-            heatmap[y, x] += 1
-
-    # Apply Gaussian blur to smooth the heatmap
-    heatmap = cv2.GaussianBlur(heatmap, (15, 15), 0)
 
-    return heatmap
+def extract_mouse_movements(stream_file):
+    _, columns = read_trial_stream(stream_file)
+    return np.asarray(columns["x"]), np.asarray(columns["y"])
 
 
 def overlay_heatmap(heatmap, screenshot):
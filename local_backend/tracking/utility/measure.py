@@ -1,259 +1,252 @@
 # Purpose: All functionality specific to the measurement mechanisms Fulcrum currently supports
 
 import threading
-import os
-from pynput import keyboard, mouse
-import time
-from datetime import datetime
-from tracking.utility.file_management import write_to_csv
-
-# Global listeners
-mouse_listener = None
-key_listener = None
-pause_event = threading.Event()
-pause_event.set()
-stop_event = threading.Event()
-data_storage_complete_event = (
-    threading.Event()
-)  # prevent ending before data is written and stored
-
-# Global storage
-keyboard_data = []
-mouse_move_data = []
-mouse_click_data = []
-mouse_scroll_data = []
-
-# Global time variables
-running_time = 0
-paused_time = 0
-
-
-#################### MOUSE FUNCTIONALITIES ####################
-
-# Variables for reducing mouse movement pulling frequency by establishing a minimum pixel threshold before recording more data
-THRESHOLD = 10
-PREV_XPOS = 0
-PREV_YPOS = 0
-TIME_TRACKER = 0
-curr_time = 0
-prev_time = 0
-
-
-def on_move(x, y, task, dir_trial):
-    global PREV_XPOS, PREV_YPOS, curr_time, prev_time, running_time, mouse_move_data
-
-    if not pause_event.is_set():  # ignore logging when paused
-        return
-
-    distance = euclidian_distance(x, y, PREV_XPOS, PREV_YPOS)
-    curr_time = datetime.now().strftime("%H:%M:%S")
-
-    # if the distance is larger than the threshold, then it can record
-    if distance > THRESHOLD:  # and curr_time != prev_time:
-
-        # inserts data into array
-        mouse_move_data.append(
-            [curr_time, "%.2f" % (time.time() - running_time - paused_time), x, y]
+from tracking.utility.clock import TrialClock
+from tracking.utility.file_management import append_to_spool, write_stream_file
+from tracking.utility.ring_buffer import RingBuffer
+from tracking.utility.sampling import build_sampler
+
+# How often the drain thread moves buffered records to disk (in seconds)
+DRAIN_INTERVAL = 0.25
+
+
+# Platform virtual-key code of a pynput key. The same physical key keeps its code whatever character it typed (e.g. with shift
+# held), which is what pairs a press with its release. -1 when the platform did not report one
+def get_virtual_key(key):
+    vk = getattr(key, "vk", None)
+    if vk is None:  # special keys (Key.shift, ...) wrap their KeyCode in .value
+        vk = getattr(getattr(key, "value", None), "vk", None)
+    return -1 if vk is None else vk
+
+
+# Owns everything one trial captures: its ring buffers, listeners and drain thread. A new recorder is made for every trial,
+# so a stopped trial can still be finalizing its files in the background while the next trial is already capturing.
+# Events are stamped on the trial's shared clock (see clock.py), pass the same clock to the screen recorder to align video
+class TrialRecorder:
+    def __init__(self, task, tracking_flags, dir_trial, heatmap=None, clock=None):
+        self.task = task
+        self.tracking_flags = tracking_flags
+        self.dir_trial = dir_trial
+        self.heatmap = heatmap
+
+        # One preallocated ring buffer per event stream. Callbacks only push fixed-width records into these and the drain thread owns all disk I/O
+        self.keyboard_buffer = RingBuffer()
+        self.mouse_move_buffer = RingBuffer()
+        self.mouse_click_buffer = RingBuffer()
+        self.mouse_scroll_buffer = RingBuffer()
+
+        # Each stream's file naming, feature type, buffer and the measurement flag that enables it
+        self.streams = (
+            ("Mouse Movement", "mouse", self.mouse_move_buffer, "mouse_movement"),
+            ("Mouse Clicks", "mouse", self.mouse_click_buffer, "mouse_clicks"),
+            ("Mouse Scrolls", "mouse", self.mouse_scroll_buffer, "mouse_scrolls"),
+            ("Keyboard Inputs", "keyboard", self.keyboard_buffer, "keyboard_inputs"),
         )
 
-        if (
-            len(mouse_move_data) >= 250
-        ):  # write in batch sizes of 250 to improve performance rather than at the end of a task when there may be tens of thousands of data points
-            write_to_csv(
-                "Mouse Movement",
-                "mouse",
-                mouse_move_data,
-                "mouse",
-                task,
-                dir_trial,
-            )
-            mouse_move_data.clear()
-
-        PREV_XPOS = x
-        PREV_YPOS = y
-
-
-def on_click(x, y, button, pressed):
-    global running_time, mouse_click_data
-
-    if not pause_event.is_set():  # ignore logging when paused
-        return
-
-    mouse_click_data.append(
-        [
-            datetime.now().strftime("%H:%M:%S"),
-            "%.2f" % (time.time() - running_time - paused_time),
-            x,
-            y,
-        ]
-    )
+        # Keyboard records only hold ints: the virtual-key code (x), 1 for press / 0 for release (y) and the key's name interned
+        # here (code), saved as a lookup table in the keyboard stream's metadata
+        self.key_codes = {}
+        self.key_names = []
 
+        # Decides which raw move events are worth storing, from the task's "mouseSampling" config (see sampling.py)
+        self.mouse_sampler = build_sampler(
+            task.get("mouseSampling"), self.mouse_move_buffer.push
+        )
 
-def on_scroll(x, y, dx, dy):
-    global running_time, mouse_scroll_data
-
-    if not pause_event.is_set():  # ignore logging when paused
-        return
+        self.clock = clock or TrialClock()
 
-    mouse_scroll_data.append(
-        [
-            datetime.now().strftime("%H:%M:%S"),
-            "%.2f" % (time.time() - running_time - paused_time),
-            x,
-            y,
-        ]
-    )
+        # Set while capturing and not paused, callbacks ignore everything else
+        self.capturing = threading.Event()
 
+        self.mouse_listener = None
+        self.key_listener = None
+        self._drain_stop = threading.Event()
+        self._drain_thread = None
 
-def euclidian_distance(x1, y1, x2, y2):
-    ed = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
-    return ed
+    #################### MOUSE FUNCTIONALITIES ####################
 
+    def on_move(self, x, y):
+        if not self.capturing.is_set():  # ignore logging when paused
+            return
 
-def stop_mouse_ps():
-    global mouse_listener
-    if mouse_listener is not None:
-        mouse_listener.stop()
-        mouse_listener = None
+        self.mouse_sampler.feed(self.clock.now_ns(), x, y)
 
+    def on_click(self, x, y, button, pressed):
+        if not self.capturing.is_set():  # ignore logging when paused
+            return
 
-##############################################################
+        self.mouse_click_buffer.push(self.clock.now_ns(), x, y)
 
+    def on_scroll(self, x, y, dx, dy):
+        if not self.capturing.is_set():  # ignore logging when paused
+            return
 
-################## KEYBOARD FUNCTIONALITIES ##################
+        self.mouse_scroll_buffer.push(self.clock.now_ns(), x, y)
 
+    ##############################################################
 
-def on_press(key):
-    global keyboard_data, running_time
+    ################## KEYBOARD FUNCTIONALITIES ##################
 
-    if not pause_event.is_set():  # ignore logging when paused
-        return
+    def on_press(self, key):
+        if not self.capturing.is_set():  # ignore logging when paused
+            return
 
-    try:
-        keyboard_data.append(
-            [
-                datetime.now().strftime("%H:%M:%S"),
-                "%.2f" % (time.time() - running_time - paused_time),
-                key.char,
-            ]
-        )
-    except AttributeError:
-        keyboard_data.append(
-            [
-                datetime.now().strftime("%H:%M:%S"),
-                "%.2f" % (time.time() - running_time - paused_time),
-                key,
-            ]
+        self.keyboard_buffer.push(
+            self.clock.now_ns(), get_virtual_key(key), 1, self.get_key_code(key)
         )
 
+    # Releases are what make dwell (press to release) and flight (release to next press) times possible
+    def on_release(self, key):
+        if not self.capturing.is_set():  # ignore logging when paused
+            return
 
-def stop_keyboard_ps():
-    global key_listener
-    if key_listener is not None:
-        key_listener.stop()
-        key_listener = None
-
-
-##############################################################
-
-
-#################### CORE FUNCTIONALITIES ####################
+        self.keyboard_buffer.push(
+            self.clock.now_ns(), get_virtual_key(key), 0, self.get_key_code(key)
+        )
 
+    # Maps a pynput key to a small int, registering it the first time it is seen
+    def get_key_code(self, key):
+        try:
+            name = key.char
+        except AttributeError:
+            name = str(key)  # special keys are saved as e.g. "Key.backspace"
+
+        if name is None:  # dead/unmapped keys have no char
+            name = ""
+
+        code = self.key_codes.get(name)
+        if code is None:
+            code = len(self.key_names)
+            self.key_names.append(name)
+            self.key_codes[name] = code
+        return code
+
+    ##############################################################
+
+    #################### CORE FUNCTIONALITIES ####################
+
+    # Moves everything buffered so far to the trial's spool files, feeding mouse movement into the trial's heatmap on the way
+    def flush_buffers(self):
+        for measurement_type, _, buffer, flag in self.streams:
+            if not self.tracking_flags.get(flag):
+                continue
+
+            records = buffer.drain()
+            if len(records):
+                append_to_spool(measurement_type, records, self.dir_trial)
+                if self.heatmap is not None and buffer is self.mouse_move_buffer:
+                    self.heatmap.add(records["x"], records["y"])
+
+    # Turns each used stream's spool into its trial stream file once capturing is over
+    def write_stream_files(self):
+        # Wall clock and pauses are captured once per trial so readers can derive absolute and running times from the numeric timestamps
+        trial_metadata = self.clock.metadata()
+
+        for measurement_type, feature, buffer, flag in self.streams:
+            metadata = {**trial_metadata, "dropped_events": buffer.dropped}
+            if buffer is self.mouse_move_buffer:
+                metadata["sampling"] = self.mouse_sampler.stats()
+            if feature == "keyboard":
+                metadata["keys"] = list(self.key_names)
+
+            write_stream_file(
+                measurement_type,
+                feature,
+                self.tracking_flags.get(flag),
+                self.task,
+                self.dir_trial,
+                metadata,
+            )
 
-# Manages the actual data collection, using measurement flags to know what to collect for the current trial
-def record_measurements(task, tracking_flags, dir_trial):
-    global mouse_listener, key_listener, running_time, keyboard_data, running_time, paused_time, mouse_move_data, mouse_click_data, mouse_scroll_data
+    # Owns all disk I/O for the trial so the hook threads only ever push into the ring buffers
+    def drain_buffers(self):
+        while not self._drain_stop.wait(DRAIN_INTERVAL):
+            self.flush_buffers()
 
-    running_time = time.time()
-    paused_time = 0
+    # Starts collecting, using measurement flags to know what to collect for this trial. With listen=False no input hooks are
+    # installed and the caller feeds the callbacks itself (the benchmark harness does this with synthetic events)
+    def start(self, listen=True):
+        flags = self.tracking_flags
 
-    try:
-        if mouse_listener is not None and mouse_listener.running:
-            stop_mouse_ps()
-        if key_listener is not None and mouse_listener.running:
-            stop_keyboard_ps()
+        # A trial starts the shared clock before any of its recorders, a recorder used on its own starts its own
+        if not self.clock.started:
+            self.clock.start()
 
-        def on_move_params(x, y):
-            on_move(x, y, task, dir_trial)
+        # pynput needs a display and OS input hooks, so it is only imported once listeners are actually wanted
+        if listen:
+            from pynput import keyboard, mouse
 
         # Initialize mouse listener if needed
-        if (
-            tracking_flags.get("mouse_movement")
-            or tracking_flags.get("mouse_clicks")
-            or tracking_flags.get("mouse_scrolls")
+        if listen and (
+            flags.get("mouse_movement")
+            or flags.get("mouse_clicks")
+            or flags.get("mouse_scrolls")
         ):
-            mouse_listener = mouse.Listener(
-                on_move=on_move_params if tracking_flags["mouse_movement"] else None,
-                on_click=on_click if tracking_flags["mouse_clicks"] else None,
-                on_scroll=on_scroll if tracking_flags["mouse_scrolls"] else None,
+            self.mouse_listener = mouse.Listener(
+                on_move=self.on_move if flags["mouse_movement"] else None,
+                on_click=self.on_click if flags["mouse_clicks"] else None,
+                on_scroll=self.on_scroll if flags["mouse_scrolls"] else None,
             )
 
         # Initialize keyboard listener if needed
-        if tracking_flags.get("keyboard_inputs"):
-            key_listener = keyboard.Listener(
-                on_press=on_press if tracking_flags["keyboard_inputs"] else None,
-                on_release=None,
+        if listen and flags.get("keyboard_inputs"):
+            self.key_listener = keyboard.Listener(
+                on_press=self.on_press, on_release=self.on_release
             )
 
-        # Start listeners
-        if mouse_listener:
-            mouse_listener.start()
-        if key_listener:
-            key_listener.start()
-
-        while not stop_event.is_set():
-            time.sleep(0.1)
-
-            if not pause_event.is_set():
-                paused_time += 0.1
-    finally:
-        # Stop listeners after full duration run
-        if mouse_listener:
-            stop_mouse_ps()
-        if key_listener:
-            stop_keyboard_ps()
-
-        # Writing before the current task ends
-        write_to_csv(
-            "Mouse Movement",
-            "mouse",
-            mouse_move_data,
-            tracking_flags["mouse_movement"],
-            task,
-            dir_trial,
-        )
-        write_to_csv(
-            "Keyboard Inputs",
-            "keyboard",
-            keyboard_data,
-            tracking_flags["keyboard_inputs"],
-            task,
-            dir_trial,
-        )
-        write_to_csv(
-            "Mouse Clicks",
-            "mouse",
-            mouse_click_data,
-            tracking_flags["mouse_clicks"],
-            task,
-            dir_trial,
-        )
-        write_to_csv(
-            "Mouse Scrolls",
-            "mouse",
-            mouse_scroll_data,
-            tracking_flags["mouse_scrolls"],
-            task,
-            dir_trial,
-        )
-
-        # Resetting for next trial
-        keyboard_data.clear()
-        mouse_move_data.clear()
-        mouse_click_data.clear()
-        mouse_scroll_data.clear()
-
-        data_storage_complete_event.set()
+        self._drain_thread = threading.Thread(target=self.drain_buffers, daemon=True)
+        self._drain_thread.start()
 
+        # Start listeners
+        self.capturing.set()
+        for listener in (self.mouse_listener, self.key_listener):
+            if listener is not None:
+                listener.start()
+
+    # Pausing and resuming go through the clock so pauses are recorded exactly on the trial timeline
+    def pause(self):
+        if self.capturing.is_set():
+            self.capturing.clear()
+            self.clock.pause()
+
+    def resume(self):
+        if not self.capturing.is_set():
+            self.clock.resume()
+            self.capturing.set()
+
+    # Ends capture right away (called from the toolbar), the files are written later by finalize()
+    def stop(self):
+        self.capturing.clear()
+        self.clock.stop()
+        for listener in (self.mouse_listener, self.key_listener):
+            if listener is not None:
+                listener.stop()
+
+    # Writes everything the trial captured to disk, safe to run in the background once stop() has been called
+    def finalize(self):
+        # Hook threads must be gone before this thread becomes the buffers' only producer
+        for listener in (self.mouse_listener, self.key_listener):
+            if listener is not None:
+                listener.join()
+
+        # Writing whatever is left before the trial ends (including any point the sampler held back)
+        self.mouse_sampler.flush()
+        self._drain_stop.set()
+        if self._drain_thread is not None:
+            self._drain_thread.join()
+        self.flush_buffers()
+        self.write_stream_files()
+
+        for measurement_type, _, buffer, flag in self.streams:
+            if buffer.dropped:
+                print(
+                    f"Warning: {buffer.dropped} {measurement_type} events dropped (buffer full)"
+                )
+
+        if self.tracking_flags.get("mouse_movement"):
+            stats = self.mouse_sampler.stats()
+            print(
+                f"Mouse movement sampling ({stats['mode']}): kept {stats['kept']} of {stats['seen']} events"
+            )
 
-##############################################################
+    ##############################################################
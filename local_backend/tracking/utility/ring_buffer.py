@@ -0,0 +1,67 @@
+# Purpose: Preallocated, array-backed ring buffers so input callbacks never allocate or touch the filesystem
+
+import numpy as np
+
+# Every stream shares one fixed-width record layout: timestamp (monotonic ns since trial start), position and a stream specific code.
+# Keyboard records reuse x/y for the virtual-key code and press (1) / release (0)
+RECORD_DTYPE = np.dtype(
+    [("t_ns", np.int64), ("x", np.int32), ("y", np.int32), ("code", np.int32)]
+)
+
+# ~1.3 MB per stream, several seconds of headroom at extreme event rates
+DEFAULT_CAPACITY = 1 << 16
+
+
+# Single-producer/single-consumer queue. The pynput hook thread is the only writer and the drain thread is the only reader,
+# so each side only ever advances its own counter and no lock is needed (the GIL makes the individual counter updates atomic)
+class RingBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError("Ring buffer capacity must be a power of two")
+
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self._head = 0  # total records ever written (producer owned)
+        self._tail = 0  # total records ever read (consumer owned)
+        self.dropped = 0  # records rejected because the consumer fell behind
+
+    def __len__(self):
+        return self._head - self._tail
+
+    # Called from the hook thread, so it must stay constant time and never block
+    def push(self, t_ns, x=0, y=0, code=0):
+        head = self._head
+        if head - self._tail >= self.capacity:
+            self.dropped += 1
+            return False
+
+        self._records[head & self._mask] = (t_ns, x, y, code)
+        self._head = head + 1  # publish only after the slot is fully written
+        return True
+
+    # Called from the drain thread, returns a copy of every record published so far
+    def drain(self):
+        tail = self._tail
+        head = self._head
+        count = head - tail
+        if count == 0:
+            return self._records[:0].copy()
+
+        start = tail & self._mask
+        end = start + count
+        if end <= self.capacity:
+            batch = self._records[start:end].copy()
+        else:  # wrapped around the end of the backing array
+            batch = np.concatenate(
+                (self._records[start:], self._records[: end - self.capacity])
+            )
+
+        self._tail = head  # release the slots back to the producer
+        return batch
+
+    # Only safe to call when neither side is active (between trials)
+    def reset(self):
+        self._head = 0
+        self._tail = 0
+        self.dropped = 0
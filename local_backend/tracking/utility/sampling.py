@@ -0,0 +1,167 @@
+# Purpose: Pluggable mouse movement sampling so long trials store far fewer points without losing path shape or timing
+#
+# Every sampler is fed raw (t_ns, x, y) move events from the hook thread and forwards the ones worth keeping to an emit
+# callback (the ring buffer's push). Samplers keep counts of seen vs kept events so the reduction can be reported per trial.
+# Configured per task in the session JSON, e.g. "mouseSampling": {"mode": "simplify", "epsilon": 2, "maxIntervalMs": 250}
+
+from abc import ABC, abstractmethod
+
+# Matches the old hard-coded 10 pixel threshold so tasks without a config behave as before
+DEFAULT_SAMPLING = {"mode": "distance", "threshold": 10}
+
+
+class Sampler(ABC):
+    mode = None
+
+    def __init__(self, emit):
+        self._emit = emit
+        self.seen = 0
+        self.kept = 0
+
+    def _keep(self, t_ns, x, y):
+        self.kept += 1
+        self._emit(t_ns, x, y)
+
+    @abstractmethod
+    def feed(self, t_ns, x, y):
+        pass
+
+    # Called once capturing stops so a sampler holding back a point can still emit it
+    def flush(self):
+        pass
+
+    def stats(self):
+        return {"mode": self.mode, "seen": self.seen, "kept": self.kept}
+
+
+# Keeps a point once it is more than `threshold` pixels from the last kept point (squared distances, no sqrt per event)
+class DistanceSampler(Sampler):
+    mode = "distance"
+
+    def __init__(self, emit, threshold=10):
+        super().__init__(emit)
+        self._threshold_sq = threshold * threshold
+        self._last = None
+
+    def feed(self, t_ns, x, y):
+        self.seen += 1
+        last = self._last
+        if last is not None:
+            dx = x - last[0]
+            dy = y - last[1]
+            if dx * dx + dy * dy <= self._threshold_sq:
+                return
+
+        self._last = (x, y)
+        self._keep(t_ns, x, y)
+
+
+# Keeps at most one point every `interval_ms` regardless of how far the cursor moved
+class TimeSampler(Sampler):
+    mode = "time"
+
+    def __init__(self, emit, interval_ms=50):
+        super().__init__(emit)
+        self._interval_ns = int(interval_ms * 1_000_000)
+        self._next_ns = None
+
+    def feed(self, t_ns, x, y):
+        self.seen += 1
+        if self._next_ns is not None and t_ns < self._next_ns:
+            return
+
+        self._next_ns = t_ns + self._interval_ns
+        self._keep(t_ns, x, y)
+
+
+# Online Ramer-Douglas-Peucker style simplification (opening window).
+# Raw points are held back while they all stay within `epsilon` pixels of the chord from the last kept point to the newest
+# point. Once one strays (a corner) the previous point becomes the next kept point. A point is also forced after
+# `max_interval_ms` so segment timing, and therefore velocity, stays accurate even on long straight or slow drags.
+class SimplifySampler(Sampler):
+    mode = "simplify"
+
+    def __init__(self, emit, epsilon=2.0, max_interval_ms=250, max_window=32):
+        super().__init__(emit)
+        self._epsilon_sq = float(epsilon) * float(epsilon)
+        self._max_interval_ns = int(max_interval_ms * 1_000_000)
+        self._max_window = max_window
+        self._anchor = None
+        self._window = []  # held back (t_ns, x, y) since the anchor
+
+    def _deviates(self, x, y):
+        ax, ay = self._anchor[1], self._anchor[2]
+        cx = x - ax
+        cy = y - ay
+        chord_sq = cx * cx + cy * cy
+
+        for _, px, py in self._window:
+            # perpendicular distance^2 = cross^2 / |chord|^2, compared without dividing
+            cross = (px - ax) * cy - (py - ay) * cx
+            if chord_sq == 0:
+                dx = px - ax
+                dy = py - ay
+                if dx * dx + dy * dy > self._epsilon_sq:
+                    return True
+            elif cross * cross > self._epsilon_sq * chord_sq:
+                return True
+        return False
+
+    def _promote_last(self):
+        point = self._window[-1]
+        self._window.clear()
+        self._anchor = point
+        self._keep(*point)
+
+    def feed(self, t_ns, x, y):
+        self.seen += 1
+        if self._anchor is None:
+            self._anchor = (t_ns, x, y)
+            self._keep(t_ns, x, y)
+            return
+
+        if self._window and (
+            len(self._window) >= self._max_window
+            or t_ns - self._anchor[0] >= self._max_interval_ns
+            or self._deviates(x, y)
+        ):
+            self._promote_last()
+
+        self._window.append((t_ns, x, y))
+
+    def flush(self):
+        # The final position always matters (end point of the path)
+        if self._window:
+            self._promote_last()
+
+
+SAMPLERS = {
+    "distance": lambda emit, cfg: DistanceSampler(emit, cfg.get("threshold", 10)),
+    "time": lambda emit, cfg: TimeSampler(emit, cfg.get("intervalMs", 50)),
+    "simplify": lambda emit, cfg: SimplifySampler(
+        emit, cfg.get("epsilon", 2.0), cfg.get("maxIntervalMs", 250)
+    ),
+}
+SAMPLERS["rdp"] = SAMPLERS["simplify"]
+
+
+# Builds the sampler a task asked for, falling back to the default rather than stopping a session over a bad config
+def build_sampler(config, emit):
+    config = config or DEFAULT_SAMPLING
+    if not isinstance(config, dict):
+        print(
+            f"Invalid mouse sampling config {config!r}, using default distance sampling"
+        )
+        return SAMPLERS[DEFAULT_SAMPLING["mode"]](emit, DEFAULT_SAMPLING)
+
+    mode = str(config.get("mode", DEFAULT_SAMPLING["mode"])).lower()
+
+    if mode not in SAMPLERS:
+        print(f"Unknown mouse sampling mode '{mode}', using default distance sampling")
+        return SAMPLERS[DEFAULT_SAMPLING["mode"]](emit, DEFAULT_SAMPLING)
+
+    try:
+        return SAMPLERS[mode](emit, config)
+    except (TypeError, ValueError) as e:
+        print(f"Invalid mouse sampling config {config}: {e}. Using default")
+        return SAMPLERS[DEFAULT_SAMPLING["mode"]](emit, DEFAULT_SAMPLING)
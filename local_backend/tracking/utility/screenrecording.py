@@ -1,108 +1,551 @@
 # Handle all screen recording of trials
+#
+# Capture and encode run as a pipeline: the capture loop timestamps each screenshot and hands it to a bounded queue, an
+# encoder thread streams the raw pixels into a single ffmpeg process over stdin. Frames are placed on the output timeline by
+# their capture timestamp (gaps are filled by repeating the previous frame) so the mp4 is already correctly timed when the
+# trial stops and never needs a second encode pass. In diff capture mode only the changed frames are sent, each carrying its
+# own timestamp in a Matroska stream, and the mp4 keeps those variable frame times. Capture timestamps come from the trial's
+# shared clock (see clock.py), so video time t is the same instant as t_ns in the trial's input streams.
 
 
 import mss
-import cv2
+import json
+import queue
+import zlib
+import struct
 import numpy as np
-import time
-import os
 import subprocess
 import threading
+from functools import lru_cache
+from tracking.utility.clock import TrialClock
 from tracking.utility.file_management import get_file_path
 from imageio_ffmpeg import get_ffmpeg_exe
 
 ffmpeg_path = get_ffmpeg_exe()
 
+FRAME_RATE = 15
 
-# Global recording events
+# Raw frames are large (~8 MB at 1080p), so only a short burst is buffered. If the encoder falls behind, new captures are dropped
+# and the encoder repeats the last frame instead, keeping the video in sync with the trial
+QUEUE_FRAMES = 8
+
+# Hardware encoders are tried in order, libx264 is always available in the bundled ffmpeg build
+ENCODERS = (
+    ("h264_nvenc", ["-c:v", "h264_nvenc", "-preset", "p1"]),
+    ("h264_qsv", ["-c:v", "h264_qsv", "-preset", "veryfast"]),
+    ("h264_amf", ["-c:v", "h264_amf", "-quality", "speed"]),
+    ("h264_videotoolbox", ["-c:v", "h264_videotoolbox", "-realtime", "1"]),
+    ("libx264", ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23"]),
+)
+
+# Optional capture mode for mostly static tasks, enabled per task with "screenCapture": {"mode": "diff"} in the session JSON.
+# Unchanged frames are never queued or encoded, the video shows each changed frame until the next one's timestamp
+CAPTURE_MODES = ("full", "diff")
+DIFF_BLOCK_SIZE = 16
+DIFF_SAMPLE_STEP = 4  # every 4th pixel of every 4th row is compared to size up a change
+
+
+# Default recording events, used when record_screen is run on its own. Each ScreenRecorder has its own pair so a finishing
+# recording never sees the next trial's events
 recording_stop = threading.Event()
-recording_active = threading.Event()
-adjustments_finished = threading.Event()
+recording_active = threading.Event()  # stays set until the mp4 is fully written
+
+
+# An encoder being listed by ffmpeg does not mean the hardware/driver is present, so each one is checked with a tiny test encode
+@lru_cache(maxsize=1)
+def pick_encoder():
+    for name, args in ENCODERS[:-1]:
+        probe = [
+            ffmpeg_path,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "color=c=black:s=256x144:d=0.2",
+            *args,
+            "-f",
+            "null",
+            "-",
+        ]
+        try:
+            result = subprocess.run(
+                probe,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=10,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+
+        if result.returncode == 0:
+            print(f"Screen recording using hardware encoder {name}")
+            return args
+
+    return ENCODERS[-1][1]
+
+
+# Feeds raw frames into ffmpeg, lining each one up with the constant rate output timeline by its capture timestamp
+class FrameEncoder:
+    def __init__(self, file_path, width, height, fps=FRAME_RATE, pix_fmt="bgra"):
+        self.fps = fps
+        self.frames_written = 0
+        self.failed = False
+        self._last_frame = None
+        # The newest capture for the slot not yet written, a later capture in the same slot replaces it
+        self._pending = None
+        self._pending_slot = 0
+
+        command = [
+            ffmpeg_path,
+            "-y",
+            "-loglevel",
+            "error",
+            *self._input_args(width, height, pix_fmt),
+            "-i",
+            "-",
+            "-vf",
+            "scale=trunc(iw/2)*2:trunc(ih/2)*2",  # yuv420p needs even dimensions
+            *self._timing_args(),
+            *pick_encoder(),
+            "-pix_fmt",
+            "yuv420p",
+            file_path,
+        ]
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,  # stop FFmpeg terminal output details
+        )
+
+    def _input_args(self, width, height, pix_fmt):
+        return [
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            pix_fmt,
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(self.fps),
+        ]
+
+    def _timing_args(self):
+        return []
+
+    def _slot(self, t_ns):
+        return round(t_ns * self.fps / 1_000_000_000)
+
+    # Returns False once ffmpeg has gone away, nothing more is sent after that
+    def _send(self, data):
+        if self.failed:
+            return False
+
+        try:
+            self._process.stdin.write(data)
+            return True
+        except (BrokenPipeError, OSError) as e:
+            self.failed = True
+            print(f"Screen recording encoder stopped unexpectedly: {e}")
+            return False
+
+    def _write_raw(self, frame, count):
+        for _ in range(count):
+            if not self._send(frame):
+                return
+            self.frames_written += 1
 
+    # Writes the pending frame at its slot, filling any gap before it with the previous frame
+    def _flush(self):
+        if self._pending is None:
+            return
+
+        # Until this capture arrived the screen showed the previous frame
+        gap = self._pending_slot - self.frames_written
+        if gap:
+            filler = self._last_frame if self._last_frame is not None else self._pending
+            self._write_raw(filler, gap)
+
+        self._write_raw(self._pending, 1)
+        self._last_frame = self._pending
+        self._pending = None
+
+    # t_ns is the capture time on the trial clock, frame 0 is the start of the trial
+    def write(self, t_ns, frame):
+        # A capture rounding to a slot already written is carried forward into the next one
+        slot = max(self._slot(t_ns), self.frames_written)
+        if self._pending is not None and slot > self._pending_slot:
+            self._flush()
+
+        self._pending = frame
+        self._pending_slot = max(slot, self._pending_slot)
+
+    # Pads the video out to when recording stopped and waits for ffmpeg to finish the file
+    def close(self, end_ns=None):
+        self._flush()
+        if end_ns is not None and self._last_frame is not None:
+            gap = self._slot(end_ns) - self.frames_written
+            if gap > 0:
+                self._write_raw(self._last_frame, gap)
+
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        self._process.wait()
+
+
+# Matroska sizes are variable-size integers, the length marker is the position of the first set bit
+def _ebml_size(size):
+    for length in range(1, 9):
+        if size < (1 << (7 * length)) - 1:
+            return ((1 << (7 * length)) | size).to_bytes(length, "big")
+    raise ValueError("Matroska element too large")
+
+
+# Matroska elements are an ID, the payload size, then the payload
+def _ebml(element_id, payload):
+    if isinstance(payload, int):
+        payload = payload.to_bytes(max(1, (payload.bit_length() + 7) // 8), "big")
+    elif isinstance(payload, str):
+        payload = payload.encode()
+
+    return element_id + _ebml_size(len(payload)) + payload
+
+
+# Streams frames to ffmpeg as uncompressed video in Matroska, each with its capture time (ms) as its timestamp. Used in diff
+# mode, where only changed frames are sent: ffmpeg passes the timestamps through to the mp4 instead of filling a constant
+# rate timeline, so unchanged stretches cost nothing to pipe or encode
+class TimestampedFrameEncoder(FrameEncoder):
+    def __init__(self, file_path, width, height, fps=FRAME_RATE, pix_fmt="bgra"):
+        super().__init__(file_path, width, height, fps, pix_fmt)
+        self._last_ms = None
+
+        header = _ebml(
+            b"\x1a\x45\xdf\xa3",  # EBML
+            _ebml(b"\x42\x82", "matroska")  # DocType
+            + _ebml(b"\x42\x87", 4)  # DocTypeVersion
+            + _ebml(b"\x42\x85", 2),  # DocTypeReadVersion
+        )
+        # Segment of unknown size, it ends with the stream
+        header += b"\x18\x53\x80\x67" + b"\x01\xff\xff\xff\xff\xff\xff\xff"
+        header += _ebml(
+            b"\x15\x49\xa9\x66",  # Info
+            _ebml(b"\x2a\xd7\xb1", 1_000_000)  # TimestampScale, ms
+            + _ebml(b"\x4d\x80", "tracker")  # MuxingApp
+            + _ebml(b"\x57\x41", "tracker"),  # WritingApp
+        )
+        header += _ebml(
+            b"\x16\x54\xae\x6b",  # Tracks
+            _ebml(
+                b"\xae",  # TrackEntry
+                _ebml(b"\xd7", 1)  # TrackNumber
+                + _ebml(b"\x73\xc5", 1)  # TrackUID
+                + _ebml(b"\x83", 1)  # TrackType, video
+                + _ebml(b"\x86", "V_UNCOMPRESSED")  # CodecID
+                # DefaultDuration (ns), how long the last frame shows, like one slot at the constant rate
+                + _ebml(b"\x23\xe3\x83", 1_000_000_000 // fps)
+                + _ebml(
+                    b"\xe0",  # Video
+                    _ebml(b"\xb0", width)  # PixelWidth
+                    + _ebml(b"\xba", height)  # PixelHeight
+                    + _ebml(b"\x2e\xb5\x24", pix_fmt.upper()),  # ColourSpace FourCC
+                ),
+            ),
+        )
+        self._send(header)
 
-def record_screen(dir_output_base):
-    # Reset
-    recording_stop.clear()
-    adjustments_finished.clear()
+    def _input_args(self, width, height, pix_fmt):
+        return ["-f", "matroska"]
+
+    # Frame times pass through to the mp4 at the input's ms resolution. B-frames would leave the mp4 header duration short
+    # of the last frame's timestamp
+    def _timing_args(self):
+        return ["-fps_mode", "passthrough", "-enc_time_base", "demux", "-bf", "0"]
+
+    # t_ns is the capture time on the trial clock, each frame shows until the next one's timestamp
+    def write(self, t_ns, frame):
+        # The first frame stands for the screen since the trial started, as the constant rate encoder does
+        t_ms = 0 if self._last_ms is None else t_ns // 1_000_000
+        if self._last_ms is not None and t_ms <= self._last_ms:
+            t_ms = self._last_ms + 1  # timestamps have to increase
+
+        # One cluster per frame keeps the block timestamp relative to the cluster at zero. The frame itself is sent on its
+        # own after the headers rather than copied into the cluster
+        timestamp = _ebml(b"\xe7", t_ms)
+        block = (
+            b"\xa3"  # SimpleBlock
+            + _ebml_size(4 + len(frame))
+            + b"\x81"  # track 1
+            + struct.pack(">hB", 0, 0x80)  # offset 0, keyframe
+        )
+        cluster = (
+            b"\x1f\x43\xb6\x75"  # Cluster
+            + _ebml_size(len(timestamp) + len(block) + len(frame))
+            + timestamp
+            + block
+        )
+        if self._send(cluster) and self._send(frame):
+            self.frames_written += 1
+            self._last_ms = t_ms
+            self._last_frame = frame
+
+    # Holds the last frame until recording stopped and waits for ffmpeg to finish the file
+    def close(self, end_ns=None):
+        if (
+            end_ns is not None
+            and self._last_frame is not None
+            and end_ns // 1_000_000 > self._last_ms
+        ):
+            self.write(end_ns, self._last_frame)
+
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        self._process.wait()
+
+
+# Decides whether a captured frame differs from the last encoded one and keeps the per-frame change statistics for the trial.
+# A CRC of the raw buffer settles whether anything changed at all without a per-pixel pass, so static frames are skipped
+# cheaply. Changed frames are sized up on a grid sampled every DIFF_SAMPLE_STEP pixels, compared block by block against the
+# sampled copy of the last kept frame (content moving within a block included)
+class FrameDiffer:
+    def __init__(
+        self,
+        width,
+        height,
+        block_size=DIFF_BLOCK_SIZE,
+        min_change=0.0,
+        sample_step=DIFF_SAMPLE_STEP,
+    ):
+        self.width = width
+        self.height = height
+        self.block_size = block_size
+        self.min_change = (
+            min_change  # fraction of blocks that must change before a frame is encoded
+        )
+        # Every block keeps at least one sampled pixel
+        self.sample_step = max(1, min(sample_step, block_size))
+        # Partial blocks at the right and bottom edges count as blocks too, starts are in sampled pixels
+        self._row_starts = -(-np.arange(0, height, block_size) // self.sample_step)
+        self._col_starts = -(-np.arange(0, width, block_size) // self.sample_step)
+        self._last = None
+        self._last_crc = None
+
+        self.t_ns = []
+        self.changed = []
+        self.kept = []
+
+    # A strided view of mss's raw buffer, nothing is copied
+    def _sample(self, raw):
+        pixels = np.frombuffer(raw, dtype=np.uint32).reshape(self.height, self.width)
+        return pixels[:: self.sample_step, :: self.sample_step]
+
+    # Boolean grid of the blocks holding at least one sampled pixel that differs from the last kept frame
+    def _changed_blocks(self, sample):
+        diff = sample != self._last
+        rows = np.logical_or.reduceat(diff, self._row_starts, axis=0)
+        return np.logical_or.reduceat(rows, self._col_starts, axis=1)
+
+    # Returns True if the frame should be sent to the encoder
+    def keep(self, t_ns, raw):
+        crc = zlib.crc32(raw)
+        if self._last is None:
+            changed = 1.0
+        elif crc == self._last_crc:
+            changed = 0.0
+        else:
+            blocks = self._changed_blocks(self._sample(raw))
+            # A change that falls between the sampled pixels (a caret, a single glyph) is still at least one block
+            changed = max(np.count_nonzero(blocks), 1) / blocks.size
+
+        keep = self._last is None or changed > self.min_change
+        if keep:
+            # The raw buffer belongs to the capture, so the kept sample is copied
+            self._last = self._sample(raw).copy()
+            self._last_crc = crc
+
+        self.t_ns.append(t_ns)
+        self.changed.append(round(float(changed), 4))
+        self.kept.append(keep)
+        return keep
+
+    def stats(self):
+        return {
+            "mode": "diff",
+            "block_size": self.block_size,
+            "sample_step": self.sample_step,
+            "min_change": self.min_change,
+            "captured": len(self.kept),
+            "encoded": sum(self.kept),
+            "frames": {"t_ns": self.t_ns, "changed": self.changed, "kept": self.kept},
+        }
+
+
+# Builds the differ a task asked for, or None for plain full-frame capture
+def build_differ(capture_config, width, height):
+    config = capture_config or {}
+    mode = str(config.get("mode", "full")).lower()
+
+    if mode not in CAPTURE_MODES:
+        print(f"Unknown screen capture mode '{mode}', capturing full frames")
+        return None
+    if mode == "full":
+        return None
+
+    return FrameDiffer(
+        width,
+        height,
+        int(config.get("blockSize", DIFF_BLOCK_SIZE)),
+        float(config.get("minChange", 0.0)),
+    )
+
+
+# The primary monitor through mss. Anything with the same shape (width, height, grab() returning raw BGRA bytes, usable as a
+# context manager) can stand in for it, e.g. the benchmark harness's synthetic screen
+class ScreenSource:
+    def __enter__(self):
+        self._sct = mss.mss()
+        self._monitor = self._sct.monitors[1]
+        self.width = self._monitor["width"]
+        self.height = self._monitor["height"]
+        return self
+
+    def __exit__(self, *exc):
+        self._sct.close()
+
+    # Raw BGRA bytes go straight to the encoder without a numpy copy
+    def grab(self):
+        return self._sct.grab(self._monitor).raw
+
+
+def encode_frames(frame_queue, encoder):
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+        encoder.write(*item)
+
+
+def record_screen(
+    dir_output_base,
+    capture_config=None,
+    stop_event=recording_stop,
+    active_event=recording_active,
+    clock=None,
+    source=None,
+):
+    # Reset the module-wide events left set by a previous recording. A ScreenRecorder's own stop event starts unset and
+    # may already hold a stop requested before this thread got here
+    if stop_event is recording_stop:
+        stop_event.clear()
 
     # Signal we are recording
-    recording_active.set()
+    active_event.set()
 
     file_path = get_file_path(dir_output_base, "Screen Recording", "mp4")
 
-    temp_fps = 15
-    delay = 1 / temp_fps
+    # Recording on its own gets its own clock, within a trial the clock is already running
+    if clock is None:
+        clock = TrialClock()
+    if not clock.started:
+        clock.start()
 
-    with mss.mss() as sct:
-        monitor = sct.monitors[1]
-        codec = cv2.VideoWriter_fourcc(*"mp4v")
-        # Creating a VideoWriter object
-        out = cv2.VideoWriter(
-            file_path, codec, temp_fps, (monitor["width"], monitor["height"])
-        )
+    delay_ns = 1_000_000_000 // FRAME_RATE
+    captured = 0
+    dropped = 0
 
-        start_time = time.time()
-        next_frame_time = start_time
-        frame_count = 0
+    try:
+        with source or ScreenSource() as screen:
+            differ = build_differ(capture_config, screen.width, screen.height)
+            # Diff mode sends only changed frames, so they carry their own timestamps instead of filling every slot
+            encoder_class = FrameEncoder if differ is None else TimestampedFrameEncoder
+            encoder = encoder_class(file_path, screen.width, screen.height)
 
-        while not recording_stop.is_set():  # Until signaled to stop from toolbar GUI
-            curr_time = time.time()
+            frame_queue = queue.Queue(maxsize=QUEUE_FRAMES)
+            encoder_thread = threading.Thread(
+                target=encode_frames, args=(frame_queue, encoder), daemon=True
+            )
+            encoder_thread.start()
 
-            if curr_time >= next_frame_time:
-                # Screenshot
-                image = sct.grab(monitor)
+            next_frame_ns = clock.now_ns()
+
+            # Until signaled to stop from toolbar GUI
+            while not stop_event.is_set():
+                now_ns = clock.now_ns()
+                if now_ns < next_frame_ns:
+                    stop_event.wait((next_frame_ns - now_ns) / 1_000_000_000)
+                    continue
 
-                # Convert to numpy array
-                frame = np.array(image)
+                # Screenshot
+                raw = screen.grab()
+                t_ns = clock.now_ns()
+                captured += 1
 
-                # Convert from BGRA to BGR
-                frame = frame[:, :, :3]
+                if differ is not None and not differ.keep(t_ns, raw):
+                    next_frame_ns = max(next_frame_ns + delay_ns, now_ns)
+                    continue
 
-                # Writing to output file
-                out.write(frame)
+                try:
+                    frame_queue.put_nowait((t_ns, raw))
+                except queue.Full:
+                    dropped += 1
 
-                frame_count += 1
-                next_frame_time += delay
-            else:
-                time.sleep(0.001)
+                # If a capture ran long, skip ahead rather than bursting to catch up
+                next_frame_ns = max(next_frame_ns + delay_ns, now_ns)
 
-        out.release()
-        cv2.destroyAllWindows()
+            end_ns = clock.end_ns if clock.end_ns is not None else clock.now_ns()
 
-        time_elapsed = time.time() - start_time
-        fps = frame_count / time_elapsed
+            # Let the encoder drain what is queued then finalize the file
+            frame_queue.put(None)
+            encoder_thread.join()
+            encoder.close(end_ns)
 
-        recording_active.clear()
+        if dropped:
+            print(f"Screen recording dropped {dropped} frames (encoder behind)")
 
-        adjuster_thread = threading.Thread(target=adjust_video, args=(file_path, fps))
-        adjuster_thread.daemon = True
-        adjuster_thread.start()
+        # Per-frame change statistics sit next to the video for analysis
+        if differ is not None:
+            stats = differ.stats()
+            with open(
+                get_file_path(dir_output_base, "Screen Recording", "stats.json"), "w"
+            ) as f:
+                json.dump(stats, f)
+            print(
+                f"Screen recording encoded {stats['encoded']} of {stats['captured']} captured frames (diff mode)"
+            )
 
+        return {
+            "captured": captured,
+            "dropped": dropped,
+            "frames_written": encoder.frames_written,
+            "encoder_failed": encoder.failed,
+        }
+    finally:
+        active_event.clear()
 
-# Need this function because fps varies for each person so we have to correct the video using calculated fps using ffmpeg or else play speed and video length will be incorrect
-def adjust_video(f_path, fps):
-    temp_f_path = f_path.replace(".mp4", "_temp.mp4")
 
-    # Ref FFmpeg https://trac.ffmpeg.org/wiki/How%20to%20speed%20up%20/%20slow%20down%20a%20video
-    command = [
-        ffmpeg_path,
-        "-y",
-        "-i",
-        f_path,
-        "-c:v",
-        "libx264",
-        "-preset",
-        "fast",
-        "-vf",
-        f"setpts={15 / fps}*PTS",
-        temp_f_path,
-    ]
+# One trial's screen recording, running on its own thread with its own stop/active events
+class ScreenRecorder:
+    def __init__(self, dir_trial, capture_config=None, clock=None):
+        self.stop_event = threading.Event()
+        self.active = threading.Event()
+        self._thread = threading.Thread(
+            target=record_screen,
+            args=(dir_trial, capture_config, self.stop_event, self.active, clock),
+            daemon=True,
+        )
 
-    subprocess.run(
-        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-    )  # stop FFmpeg terminal output details
+    def start(self):
+        self.active.set()  # reported as recording from the moment the trial starts
+        self._thread.start()
 
-    if os.path.exists(temp_f_path):
-        os.replace(temp_f_path, f_path)
+    def stop(self):
+        self.stop_event.set()
 
-    adjustments_finished.set()
+    # Returns once the mp4 is fully written
+    def join(self):
+        self._thread.join()
@@ -0,0 +1,106 @@
+# Purpose: Binary columnar on-disk format for raw trial streams (mouse movement, clicks, scrolls, keyboard)
+#
+# Layout (little endian):
+#   header   magic "FULCRUM\0", schema version (u16), column count (u16), metadata length (u32), row count (u64)
+#   metadata UTF-8 JSON describing the trial (measurement type, task, trial start wall clock, key table, ...)
+#   columns  one directory entry per column: name (16 bytes), numpy dtype string (4 bytes), absolute offset (u64)
+#   data     each column stored contiguously and 8-byte aligned so it can be memory mapped straight into numpy
+
+
+import os
+import json
+import struct
+import numpy as np
+
+TRIAL_STREAM_FORMAT = "fcol"
+MAGIC = b"FULCRUM\x00"
+SCHEMA_VERSION = 1
+HEADER = struct.Struct("<8sHHIQ")
+COLUMN_ENTRY = struct.Struct("<16s4sQ")
+ALIGNMENT = 8
+
+# Only fixed width types so readers never need to parse anything
+SUPPORTED_DTYPES = {"<i4", "<i8", "<f8"}
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Writes all columns (dict of name -> 1D array, all the same length) plus trial metadata to file_path
+def write_trial_stream(file_path, columns, metadata):
+    arrays = {}
+    for name, values in columns.items():
+        arr = np.ascontiguousarray(values)
+        arr = arr.astype(arr.dtype.newbyteorder("<"), copy=False)
+        if arr.dtype.str not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype {arr.dtype} for column '{name}'")
+        if len(name.encode("ascii")) > 16:
+            raise ValueError(f"Column name '{name}' is longer than 16 characters")
+        arrays[name] = arr
+
+    row_counts = {len(arr) for arr in arrays.values()}
+    if len(row_counts) > 1:
+        raise ValueError("All columns in a trial stream must have the same length")
+    row_count = row_counts.pop() if row_counts else 0
+
+    meta_bytes = json.dumps(metadata).encode("utf-8")
+
+    # Work out where each column starts before writing anything
+    offset = _align(HEADER.size + len(meta_bytes) + COLUMN_ENTRY.size * len(arrays))
+    entries = []
+    for name, arr in arrays.items():
+        entries.append(
+            COLUMN_ENTRY.pack(
+                name.encode("ascii"), arr.dtype.str.encode("ascii"), offset
+            )
+        )
+        offset = _align(offset + arr.nbytes)
+
+    # Write to a temp file first so a crash never leaves a half written stream behind
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(
+            HEADER.pack(MAGIC, SCHEMA_VERSION, len(arrays), len(meta_bytes), row_count)
+        )
+        f.write(meta_bytes)
+        for entry in entries:
+            f.write(entry)
+
+        for arr in arrays.values():
+            f.write(b"\x00" * (_align(f.tell()) - f.tell()))
+            arr.tofile(f)
+
+    os.replace(temp_path, file_path)
+
+
+# Returns (metadata, columns) where each column is a read-only numpy array memory mapped from file_path
+def read_trial_stream(file_path):
+    with open(file_path, "rb") as f:
+        magic, version, column_count, meta_len, row_count = HEADER.unpack(
+            f.read(HEADER.size)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{file_path} is not a Fulcrum trial stream")
+        if version > SCHEMA_VERSION:
+            raise ValueError(
+                f"{file_path} uses schema version {version}, newest supported is {SCHEMA_VERSION}"
+            )
+
+        metadata = json.loads(f.read(meta_len).decode("utf-8"))
+        entries = [
+            COLUMN_ENTRY.unpack(f.read(COLUMN_ENTRY.size)) for _ in range(column_count)
+        ]
+
+    columns = {}
+    for raw_name, raw_dtype, offset in entries:
+        name = raw_name.rstrip(b"\x00").decode("ascii")
+        dtype = np.dtype(raw_dtype.rstrip(b"\x00").decode("ascii"))
+        if row_count == 0:  # cannot memory map a zero length region
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(
+                file_path, dtype=dtype, mode="r", offset=offset, shape=(row_count,)
+            )
+
+    return metadata, columns
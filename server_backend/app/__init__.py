@@ -1,7 +1,6 @@
 # This file initializes the flask app configuration
 from flask import Flask
 from flask_cors import CORS
-from flask_mysqldb import MySQL
 from flask_sqlalchemy import SQLAlchemy
 from flask_security import (
     Security,
@@ -14,8 +13,8 @@ from flask_mailman import Mail
 from flask_security import MailUtil
 import os
 from app.utility.user_serializer import user_serializer
+from app.utility.db_connection import init_db
 
-mysql = MySQL()
 db = SQLAlchemy()  # Only for user tracking via Flask-Security
 csrf = CSRFProtect()
 
@@ -45,7 +44,7 @@ def create_app(testing=False):
         app.config["MYSQL_DB"] = "test_db"
     else:
         app.config["MYSQL_DB"] = os.getenv("MYSQL_DB").strip()
-    mysql.init_app(app)
+    init_db(app)
 
     # Server CSV pathway configuration
     app.config["RESULTS_BASE_DIR_PATH"] = os.getenv("RESULTS_BASE_DIR_PATH")
@@ -14,7 +14,16 @@ from app.utility.analytics.visualization_helper import (
     calculate_interaction_metrics,
     plot_learning_curve,
 )
+from app.utility.analytics.metric_rollups import get_study_rollup, get_task_rollups
 from app.utility.db_connection import get_db_connection
+from app.utility.db_pool import get_pool
+from app.utility.sessions import (
+    MEDIA_TYPES,
+    get_participant_media_files,
+    get_trial_measurement_files,
+)
+from app.utility.zip_stream import zip_response
+from app.utility.trial_streams import read_measurement_frame
 import io
 import csv
 import json
@@ -31,35 +40,53 @@ logger = logging.getLogger(__name__)
 
 
 # Shared function to calculate study average completion time from CSV files
-def calculate_study_average_time_from_csv(study_id, max_files=100):
+def calculate_study_average_time_from_csv(study_id, max_files=100, cursor=None):
     """
     Calculate the average completion time for a study using CSV data
 
+    The study's rolled up trial durations (precomputed at upload) are used when a cursor
+    is given, the measurement files are only scanned for studies uploaded before that.
+    The rollup has no per-trial list, so csv_times_list is empty in that case.
+
     Args:
         study_id: ID of the study
         max_files: Maximum number of CSV files to process (default 100)
+        cursor: Optional database cursor to read the study's metric rollup and file
+            paths with, the file paths are read on the request's connection without one
 
     Returns:
         tuple: (average_completion_time, csv_times_list, num_files_processed)
         Where average_completion_time is the calculated average or 0 if no data found
     """
+    if cursor is not None:
+        try:
+            duration = get_study_rollup(cursor, study_id).get("duration_s")
+            if duration:
+                logger.info(
+                    f"Study average from metric rollup: {duration['mean']:.2f}s from {duration['count']} trials"
+                )
+                return duration["mean"], [], duration["count"]
+        except Exception as e:
+            logger.warning(f"Study metric rollup unavailable: {e}")
+
     try:
         # Get all CSV times for the study
         all_csv_times = []
-        study_path = f"/home/hci/Documents/participants_results/{study_id}_study_id"
-        import glob
-        import pandas as pd
-        import os
 
         # Get all CSV files for this study
-        if os.path.exists(study_path):
-            csv_files = glob.glob(f"{study_path}/**/*.csv", recursive=True)
+        csv_files = [
+            results_path
+            for *_, results_path in get_trial_measurement_files(
+                study_id, cursor or get_db_connection().cursor()
+            )
+        ]
+        if csv_files:
             logger.info(f"Found {len(csv_files)} total CSV files for study {study_id}")
 
             # Get running_time data from each file
             for file_path in csv_files[:max_files]:  # Limit for performance
                 try:
-                    df = pd.read_csv(file_path)
+                    df = read_measurement_frame(file_path)
                     if "running_time" in df.columns and not df.empty:
                         max_time = df["running_time"].max()
                         if max_time > 0:
@@ -100,17 +127,29 @@ def calculate_summary_pvalue(cursor, study_id):
         )
         logger.debug(f"Called calculate_summary_pvalue for study_id={study_id}")
 
-        # First, try to get completion times from CSV data (most accurate source)
-        avg_csv_time, csv_times, _ = calculate_study_average_time_from_csv(study_id)
+        # Precomputed trial durations first, the rollup's mean and std are all this needs
+        duration = None
+        try:
+            duration = get_study_rollup(cursor, study_id).get("duration_s")
+        except Exception as e:
+            logger.warning(f"Study metric rollup unavailable: {e}")
 
-        if csv_times and len(csv_times) >= 3:
-            # We have enough CSV data, calculate p-value from these times
-            import numpy as np
+        if duration and duration["count"] >= 3:
+            mean_time = duration["mean"]
+            std_dev = duration["std"]
+            sample_size = duration["count"]
+        else:
+            # Otherwise, try to get completion times from CSV data (most accurate source)
+            _, csv_times, _ = calculate_study_average_time_from_csv(study_id)
+            sample_size = len(csv_times)
+            if sample_size >= 3:
+                import numpy as np
 
-            times = np.array(csv_times)
-            mean_time = np.mean(times)
-            std_dev = np.std(times)
+                mean_time = np.mean(csv_times)
+                std_dev = np.std(csv_times)
 
+        if sample_size >= 3:
+            # We have enough completion times, calculate p-value from them
             # Coefficient of variation (normalized std dev)
             # Lower CV = more consistent performance = lower p-value
             if mean_time > 0:
@@ -119,7 +158,7 @@ def calculate_summary_pvalue(cursor, study_id):
                 # Lower CV = more consistent = lower p-value
                 raw_p = min(0.9, cv * 0.7)
                 # Adjust based on sample size
-                sample_factor = 1.0 / (1.0 + 0.05 * len(times))
+                sample_factor = 1.0 / (1.0 + 0.05 * sample_size)
                 # Combined calculation
                 p_value = max(0.15, min(0.85, raw_p - sample_factor))
                 logger.info(
@@ -199,7 +238,7 @@ def calculate_summary_pvalue(cursor, study_id):
                     # Lower CV = more consistent = lower p-value
                     raw_p = min(0.9, cv * 0.7)
                     # Adjust based on sample size
-                    sample_factor = 1.0 / (1.0 + 0.05 * len(times))
+                    sample_factor = 1.0 / (1.0 + 0.05 * sample_size)
                     # Combined calculation
                     p_value = max(0.15, min(0.85, raw_p - sample_factor))
                     logger.info(
@@ -457,20 +496,9 @@ def get_study_summary_route(study_id):
         except ValueError:
             raise ValueError("Study ID must be an integer")
 
-        # Use direct database connection for better reliability
         try:
-            # Connect directly to MySQL
-            import MySQLdb
-            import os
-
-            # Get environment variables for database connection
-            db_host = os.environ.get("MYSQL_HOST")
-            db_user = os.environ.get("MYSQL_USER")
-            db_pass = os.environ.get("MYSQL_PASSWORD")
-            db_name = os.environ.get("MYSQL_DB")
-
-            # Connect directly to MySQL
-            db = MySQLdb.connect(host=db_host, user=db_user, passwd=db_pass, db=db_name)
+            # Pooled connection for this request, returned when the request ends
+            db = get_db_connection()
 
             # Create cursor
             cursor = db.cursor()
@@ -518,7 +546,7 @@ def get_study_summary_route(study_id):
 
             # Calculate avg completion time using our shared function (CSV-based)
             avg_completion_time, csv_times, _ = calculate_study_average_time_from_csv(
-                study_id
+                study_id, cursor=cursor
             )
             logger.info(
                 f"Using shared function for study {study_id} completion time: {avg_completion_time:.2f}s"
@@ -702,7 +730,7 @@ def get_study_summary_route(study_id):
             # Replace with our calculation from the shared function
             # Calculate avg completion time using our shared function (CSV-based)
             avg_completion_time, csv_times, _ = calculate_study_average_time_from_csv(
-                study_id
+                study_id, cursor=cursor
             )
             logger.info(
                 f"Using shared function for study {study_id} completion time: {avg_completion_time:.2f}s"
@@ -807,20 +835,9 @@ def get_learning_curve_route(study_id):
         except ValueError:
             raise ValueError("Study ID must be an integer")
 
-        # Use direct database connection for better reliability
         try:
-            # Connect directly to MySQL
-            import MySQLdb
-            import os
-
-            # Get environment variables for database connection
-            db_host = os.environ.get("MYSQL_HOST")
-            db_user = os.environ.get("MYSQL_USER")
-            db_pass = os.environ.get("MYSQL_PASSWORD")
-            db_name = os.environ.get("MYSQL_DB")
-
-            # Connect directly to MySQL
-            db = MySQLdb.connect(host=db_host, user=db_user, passwd=db_pass, db=db_name)
+            # Pooled connection for this request, returned when the request ends
+            db = get_db_connection()
 
             # Create cursor
             cursor = db.cursor()
@@ -883,13 +900,12 @@ def get_learning_curve_route(study_id):
             learning_curve_data = []
 
             try:
-                # Check for CSV files to enhance our data
-                study_path = (
-                    f"/home/hci/Documents/participants_results/{study_id}_study_id"
-                )
-                import glob
-                import pandas as pd
-                import os
+                # Check for CSV files to enhance our data, all of the study's in one query
+                trial_files = {}
+                for _, _, _, trial_id, results_path in get_trial_measurement_files(
+                    study_id, cursor
+                ):
+                    trial_files.setdefault(trial_id, []).append(results_path)
 
                 # Process each participant+task combination and compute attempt numbers
                 for key, trials in trials_by_participant_task.items():
@@ -899,44 +915,24 @@ def get_learning_curve_route(study_id):
                     # Assign attempt numbers (1-based)
                     for attempt_idx, trial in enumerate(sorted_trials, 1):
                         # Use CSV data to get more accurate completion time if available
-                        participant_session_id = None
+                        csv_times = []
+                        for csv_file in trial_files.get(trial["trial_id"], []):
+                            try:
+                                df = read_measurement_frame(csv_file)
+                                if "running_time" in df.columns and not df.empty:
+                                    max_time = df["running_time"].max()
+                                    if max_time > 0:
+                                        csv_times.append(max_time)
+                            except Exception as e:
+                                pass  # Skip problematic files
 
-                        # Get participant_session_id for this trial
-                        cursor.execute(
-                            "SELECT participant_session_id FROM trial WHERE trial_id = %s",
-                            (trial["trial_id"],),
-                        )
-                        ps_row = cursor.fetchone()
-                        if ps_row:
-                            participant_session_id = ps_row[0]
-
-                            # Try to get completion time from CSV files
-                            if participant_session_id:
-                                trial_path = f"{study_path}/{participant_session_id}_participant_session_id/{trial['trial_id']}_trial_id"
-                                if os.path.exists(trial_path):
-                                    csv_files = glob.glob(f"{trial_path}/*.csv")
-
-                                    csv_times = []
-                                    for csv_file in csv_files:
-                                        try:
-                                            df = pd.read_csv(csv_file)
-                                            if (
-                                                "running_time" in df.columns
-                                                and not df.empty
-                                            ):
-                                                max_time = df["running_time"].max()
-                                                if max_time > 0:
-                                                    csv_times.append(max_time)
-                                        except Exception as e:
-                                            pass  # Skip problematic files
-
-                                    # If we found times from CSV, use the maximum value
-                                    if csv_times:
-                                        csv_completion_time = max(csv_times)
-                                        logger.info(
-                                            f"Using CSV completion time for trial {trial['trial_id']}: {csv_completion_time}s"
-                                        )
-                                        trial["completion_time"] = csv_completion_time
+                        # If we found times from CSV, use the maximum value
+                        if csv_times:
+                            csv_completion_time = max(csv_times)
+                            logger.info(
+                                f"Using CSV completion time for trial {trial['trial_id']}: {csv_completion_time}s"
+                            )
+                            trial["completion_time"] = csv_completion_time
 
                         # Add to the result with attempt number
                         learning_curve_data.append(
@@ -957,132 +953,57 @@ def get_learning_curve_route(study_id):
                     "No learning curve data from database, trying CSV files directly"
                 )
                 try:
-                    # Try to gather data from CSV files
-                    import glob
-                    import pandas as pd
-                    import os
-
-                    study_path = (
-                        f"/home/hci/Documents/participants_results/{study_id}_study_id"
+                    # Get tasks for this study
+                    cursor.execute(
+                        "SELECT task_id, task_name FROM task WHERE study_id = %s",
+                        (study_id,),
                     )
-                    if os.path.exists(study_path):
-                        # Get all participant session directories
-                        participant_sessions = glob.glob(
-                            f"{study_path}/*_participant_session_id"
-                        )
-
-                        # Get tasks for this study
-                        cursor.execute(
-                            "SELECT task_id, task_name FROM task WHERE study_id = %s",
-                            (study_id,),
-                        )
-                        tasks = {
-                            task_id: task_name
-                            for task_id, task_name in cursor.fetchall()
-                        }
-
-                        # For each participant session
-                        for ps_dir in participant_sessions:
-                            # Extract participant session ID from directory name
-                            ps_name = os.path.basename(ps_dir)
-                            ps_id = (
-                                int(ps_name.split("_")[0])
-                                if ps_name.split("_")[0].isdigit()
-                                else None
-                            )
+                    tasks = {
+                        task_id: task_name for task_id, task_name in cursor.fetchall()
+                    }
 
-                            if ps_id:
-                                # Get participant ID
-                                cursor.execute(
-                                    "SELECT participant_id FROM participant_session WHERE participant_session_id = %s",
-                                    (ps_id,),
-                                )
-                                p_row = cursor.fetchone()
-                                participant_id = p_row[0] if p_row else f"P{ps_id}"
-
-                                # Get all trial directories for this participant session
-                                trial_dirs = glob.glob(f"{ps_dir}/*_trial_id")
-
-                                # Group trials by task
-                                task_trials = {}
-
-                                for trial_dir in trial_dirs:
-                                    # Extract trial ID
-                                    trial_name = os.path.basename(trial_dir)
-                                    trial_id = (
-                                        int(trial_name.split("_")[0])
-                                        if trial_name.split("_")[0].isdigit()
-                                        else None
+                    # Maximum running time of each trial, by participant session and task
+                    session_trials = {}
+                    for (
+                        participant_id,
+                        ps_id,
+                        task_id,
+                        trial_id,
+                        csv_file,
+                    ) in get_trial_measurement_files(study_id, cursor):
+                        try:
+                            df = read_measurement_frame(csv_file)
+                            if "running_time" in df.columns and not df.empty:
+                                max_time = df["running_time"].max()
+                                if max_time > 0:
+                                    task_trials = session_trials.setdefault(
+                                        (ps_id, participant_id), {}
                                     )
-
-                                    if trial_id:
-                                        # Get task ID for this trial
-                                        cursor.execute(
-                                            "SELECT task_id FROM trial WHERE trial_id = %s",
-                                            (trial_id,),
-                                        )
-                                        t_row = cursor.fetchone()
-                                        task_id = t_row[0] if t_row else None
-
-                                        if task_id:
-                                            if task_id not in task_trials:
-                                                task_trials[task_id] = []
-
-                                            # Get CSV files for this trial
-                                            csv_files = glob.glob(f"{trial_dir}/*.csv")
-
-                                            # Extract maximum running time
-                                            csv_times = []
-                                            for csv_file in csv_files:
-                                                try:
-                                                    df = pd.read_csv(csv_file)
-                                                    if (
-                                                        "running_time" in df.columns
-                                                        and not df.empty
-                                                    ):
-                                                        max_time = df[
-                                                            "running_time"
-                                                        ].max()
-                                                        if max_time > 0:
-                                                            csv_times.append(max_time)
-                                                except Exception as e:
-                                                    pass  # Skip problematic files
-
-                                            # If we found times, add to task trials
-                                            if csv_times:
-                                                task_trials[task_id].append(
-                                                    {
-                                                        "trial_id": trial_id,
-                                                        "completion_time": max(
-                                                            csv_times
-                                                        ),
-                                                    }
-                                                )
-
-                                # Calculate attempt numbers and add to learning curve data
-                                for task_id, trials in task_trials.items():
-                                    # Sort trials by trial_id (approximate chronological order)
-                                    sorted_trials = sorted(
-                                        trials, key=lambda x: x["trial_id"]
+                                    trial_times = task_trials.setdefault(task_id, {})
+                                    trial_times[trial_id] = max(
+                                        trial_times.get(trial_id, 0), max_time
                                     )
-
-                                    # Add to learning curve data with attempt numbers
-                                    for attempt_idx, trial in enumerate(
-                                        sorted_trials, 1
-                                    ):
-                                        learning_curve_data.append(
-                                            {
-                                                "taskId": task_id,
-                                                "taskName": tasks.get(
-                                                    task_id, f"Task {task_id}"
-                                                ),
-                                                "participantId": participant_id,
-                                                "attempt": attempt_idx,
-                                                "completionTime": trial[
-                                                    "completion_time"
-                                                ],
-                                            }
-                                        )
+                        except Exception as e:
+                            pass  # Skip problematic files
+
+                    # Calculate attempt numbers and add to learning curve data
+                    for (_, participant_id), task_trials in session_trials.items():
+                        for task_id, trial_times in task_trials.items():
+                            # Trials are listed in the order they were started
+                            for attempt_idx, completion_time in enumerate(
+                                trial_times.values(), 1
+                            ):
+                                learning_curve_data.append(
+                                    {
+                                        "taskId": task_id,
+                                        "taskName": tasks.get(
+                                            task_id, f"Task {task_id}"
+                                        ),
+                                        "participantId": participant_id,
+                                        "attempt": attempt_idx,
+                                        "completionTime": completion_time,
+                                    }
+                                )
 
                 except Exception as e:
                     logger.error(
@@ -1149,20 +1070,9 @@ def get_task_performance_route(study_id):
         except ValueError:
             raise ValueError("Study ID must be an integer")
 
-        # Use direct database connection for better reliability
         try:
-            # Connect directly to MySQL
-            import MySQLdb
-            import os
-
-            # Get environment variables for database connection
-            db_host = os.environ.get("MYSQL_HOST")
-            db_user = os.environ.get("MYSQL_USER")
-            db_pass = os.environ.get("MYSQL_PASSWORD")
-            db_name = os.environ.get("MYSQL_DB")
-
-            # Connect directly to MySQL
-            db = MySQLdb.connect(host=db_host, user=db_user, passwd=db_pass, db=db_name)
+            # Pooled connection for this request, returned when the request ends
+            db = get_db_connection()
 
             # Create cursor
             cursor = db.cursor()
@@ -1198,6 +1108,13 @@ def get_task_performance_route(study_id):
 
             rows = cursor.fetchall()
 
+            # Precomputed trial durations of every task, read once for the whole study
+            try:
+                task_rollups = get_task_rollups(cursor, study_id)
+            except Exception as e:
+                logger.warning(f"Task metric rollups unavailable: {e}")
+                task_rollups = {}
+
             task_performance = []
             for row in rows:
                 task_id = row[0]
@@ -1419,62 +1336,44 @@ def get_task_performance_route(study_id):
                     )
                     # Continue with database metrics if Redis check fails
 
-                # If avg_time is still 0, try to get it directly from CSV files
+                # If avg_time is still 0, use the task's rolled up trial durations
+                task_duration = task_rollups.get(task_id, {}).get("duration_s")
+                if avg_time == 0 and task_duration:
+                    avg_time = task_duration["mean"]
+
+                # Tasks uploaded before trial metrics existed are read from their CSV files
                 if avg_time == 0:
                     try:
-                        # Get trials for this task
-                        cursor.execute(
-                            """
-                            SELECT tr.trial_id, ps.participant_session_id
-                            FROM trial tr
-                            JOIN participant_session ps ON tr.participant_session_id = ps.participant_session_id
-                            WHERE ps.study_id = %s AND tr.task_id = %s
-                            """,
-                            (study_id, task_id),
-                        )
-
-                        task_trials = cursor.fetchall()
+                        # Get CSV files for the trials of this task
+                        csv_times = []
+                        csv_files = [
+                            results_path
+                            for *_, results_path in get_trial_measurement_files(
+                                study_id, cursor, task_id=task_id
+                            )
+                        ]
                         logger.info(
-                            f"Found {len(task_trials)} trials for task {task_id}"
+                            f"Found {len(csv_files)} CSV files for task {task_id}"
                         )
 
-                        # Get CSV files for these trials
-                        csv_times = []
-                        for trial_id, participant_session_id in task_trials:
-                            # Check for CSV files in the expected directory structure
-                            trial_path = f"/home/hci/Documents/participants_results/{study_id}_study_id/{participant_session_id}_participant_session_id/{trial_id}_trial_id"
-
-                            if os.path.exists(trial_path):
-                                # Process each CSV file in this trial directory
-                                import pandas as pd
-                                import glob
-
-                                csv_files = glob.glob(f"{trial_path}/*.csv")
-                                logger.info(
-                                    f"Found {len(csv_files)} CSV files for trial {trial_id}"
-                                )
-
-                                for csv_file in csv_files:
-                                    try:
-                                        # Read the CSV file
-                                        df = pd.read_csv(csv_file)
-
-                                        # Check if running_time column exists
-                                        if (
-                                            "running_time" in df.columns
-                                            and not df.empty
-                                        ):
-                                            # Get the maximum time value
-                                            max_time = df["running_time"].max()
-                                            if max_time > 0:
-                                                csv_times.append(max_time)
-                                                logger.info(
-                                                    f"Found completion time {max_time}s from {os.path.basename(csv_file)}"
-                                                )
-                                    except Exception as e:
-                                        logger.warning(
-                                            f"Error reading CSV {csv_file}: {str(e)}"
+                        for csv_file in csv_files:
+                            try:
+                                # Read the CSV file
+                                df = read_measurement_frame(csv_file)
+
+                                # Check if running_time column exists
+                                if "running_time" in df.columns and not df.empty:
+                                    # Get the maximum time value
+                                    max_time = df["running_time"].max()
+                                    if max_time > 0:
+                                        csv_times.append(max_time)
+                                        logger.info(
+                                            f"Found completion time {max_time}s from {os.path.basename(csv_file)}"
                                         )
+                            except Exception as e:
+                                logger.warning(
+                                    f"Error reading CSV {csv_file}: {str(e)}"
+                                )
 
                         # If we found any times, use their average
                         if csv_times:
@@ -1565,20 +1464,9 @@ def get_participants_route(study_id):
         if per_page < 1 or per_page > 100:
             raise ValueError("Items per page must be between 1 and 100")
 
-        # Use direct database connection for better reliability
         try:
-            # Connect directly to MySQL
-            import MySQLdb
-            import os
-
-            # Get environment variables for database connection
-            db_host = os.environ.get("MYSQL_HOST")
-            db_user = os.environ.get("MYSQL_USER")
-            db_pass = os.environ.get("MYSQL_PASSWORD")
-            db_name = os.environ.get("MYSQL_DB")
-
-            # Connect directly to MySQL
-            db = MySQLdb.connect(host=db_host, user=db_user, passwd=db_pass, db=db_name)
+            # Pooled connection for this request, returned when the request ends
+            db = get_db_connection()
 
             # Create cursor
             cursor = db.cursor()
@@ -1690,79 +1578,35 @@ def get_participants_route(study_id):
 
                 # If no valid times from database, try to get completion times from CSV files
                 if not valid_completion_times:
-                    # Get participant_session_id for this participant in this study
-                    cursor.execute(
-                        """
-                        SELECT participant_session_id 
-                        FROM participant_session 
-                        WHERE participant_id = %s AND study_id = %s
-                        """,
-                        (participant_id, study_id),
+                    # Stored CSV files of this participant's trials in this study
+                    csv_files = get_trial_measurement_files(
+                        study_id, cursor, participant_id=participant_id
                     )
-                    session_rows = cursor.fetchall()
 
-                    if session_rows:
+                    if csv_files:
                         try:
-                            # Import pandas for CSV processing
-                            import pandas as pd
-                            import os
-
                             # Get times from CSV files
                             csv_completion_times = []
 
-                            for row in session_rows:
-                                session_id = row[0]
-
-                                # Build the path to the participant session folder
-                                session_path = f"/home/hci/Documents/participants_results/{study_id}_study_id/{session_id}_participant_session_id"
-
-                                if os.path.exists(session_path):
-                                    # Find all trial directories
-                                    trial_dirs = [
-                                        d
-                                        for d in os.listdir(session_path)
-                                        if d.endswith("_trial_id")
-                                    ]
-
-                                    for trial_dir in trial_dirs:
-                                        trial_path = os.path.join(
-                                            session_path, trial_dir
-                                        )
-
-                                        # Find all CSV files
-                                        csv_files = [
-                                            f
-                                            for f in os.listdir(trial_path)
-                                            if f.endswith(".csv")
-                                        ]
-
-                                        # Process each CSV file looking for running_time data
-                                        for csv_file in csv_files:
-                                            file_path = os.path.join(
-                                                trial_path, csv_file
+                            # Process each CSV file looking for running_time data
+                            for *_, file_path in csv_files:
+                                try:
+                                    # Read the CSV file
+                                    df = read_measurement_frame(file_path)
+
+                                    # Check if running_time column exists and has data
+                                    if "running_time" in df.columns and len(df) > 0:
+                                        # Get the maximum time value
+                                        max_time = df["running_time"].max()
+                                        if max_time > 0:
+                                            csv_completion_times.append(max_time)
+                                            logger.info(
+                                                f"Found completion time {max_time}s in {file_path}"
                                             )
-                                            try:
-                                                # Read the CSV file
-                                                df = pd.read_csv(file_path)
-
-                                                # Check if running_time column exists and has data
-                                                if (
-                                                    "running_time" in df.columns
-                                                    and len(df) > 0
-                                                ):
-                                                    # Get the maximum time value
-                                                    max_time = df["running_time"].max()
-                                                    if max_time > 0:
-                                                        csv_completion_times.append(
-                                                            max_time
-                                                        )
-                                                        logger.info(
-                                                            f"Found completion time {max_time}s in {file_path}"
-                                                        )
-                                            except Exception as e:
-                                                logger.warning(
-                                                    f"Error reading CSV file {file_path}: {str(e)}"
-                                                )
+                                except Exception as e:
+                                    logger.warning(
+                                        f"Error reading CSV file {file_path}: {str(e)}"
+                                    )
 
                             # If we found any times, add them to our valid times
                             if csv_completion_times:
@@ -1807,52 +1651,30 @@ def get_participants_route(study_id):
                         f"No direct completion times, searching for alternative data sources for participant {participant_id}"
                     )
                     try:
-                        # Get session/trial IDs for this participant in this study
-                        cursor.execute(
-                            """
-                            SELECT tr.trial_id, ps.participant_session_id
-                            FROM trial tr
-                            JOIN participant_session ps ON tr.participant_session_id = ps.participant_session_id
-                            WHERE ps.participant_id = %s AND ps.study_id = %s
-                            """,
-                            (participant_id, study_id),
+                        # Stored CSV files of this participant's trials in this study
+                        all_trials = get_trial_measurement_files(
+                            study_id, cursor, participant_id=participant_id
                         )
-
-                        all_trials = cursor.fetchall()
                         if all_trials:
                             logger.info(
-                                f"Found {len(all_trials)} trials for participant {participant_id}"
+                                f"Found {len(all_trials)} trial files for participant {participant_id}"
                             )
 
                             # Get times from CSV files
                             from_csv = []
 
-                            for trial_id, ps_id in all_trials:
-                                # Look in HCI Documents path
-                                csv_pattern = f"/home/hci/Documents/participants_results/{study_id}_study_id/{ps_id}_participant_session*/{trial_id}_trial*/*.csv"
-                                import glob
-
-                                csv_files = glob.glob(csv_pattern)
-
-                                for file_path in csv_files:
-                                    try:
-                                        import pandas as pd
-
-                                        df = pd.read_csv(file_path)
-                                        if (
-                                            "running_time" in df.columns
-                                            and not df.empty
-                                        ):
-                                            max_time = df["running_time"].max()
-                                            if max_time > 0:
-                                                from_csv.append(max_time)
-                                                logger.info(
-                                                    f"Found time {max_time}s from {file_path}"
-                                                )
-                                    except Exception as e:
-                                        logger.warning(
-                                            f"Error reading {file_path}: {e}"
-                                        )
+                            for *_, file_path in all_trials:
+                                try:
+                                    df = read_measurement_frame(file_path)
+                                    if "running_time" in df.columns and not df.empty:
+                                        max_time = df["running_time"].max()
+                                        if max_time > 0:
+                                            from_csv.append(max_time)
+                                            logger.info(
+                                                f"Found time {max_time}s from {file_path}"
+                                            )
+                                except Exception as e:
+                                    logger.warning(f"Error reading {file_path}: {e}")
 
                             if from_csv:
                                 # Calculate average from CSV times
@@ -1878,7 +1700,7 @@ def get_participants_route(study_id):
                 # Get study average completion time using our shared function
                 if avg_study_time == 0:
                     avg_study_time, _, _ = calculate_study_average_time_from_csv(
-                        study_id
+                        study_id, cursor=cursor
                     )
 
                 # Check if we should use a real p-value or N/A
@@ -1965,7 +1787,7 @@ def get_participants_route(study_id):
 
 @analytics_bp.route("/<study_id>/export", methods=["GET"])
 def export_data_route(study_id):
-    # Export study data as CSV, JSON, or ZIP
+    # Export study data as CSV, JSON, ZIP or Parquet
     try:
         # Validate study_id
         try:
@@ -1975,13 +1797,13 @@ def export_data_route(study_id):
 
         # Get and validate export format
         export_format = request.args.get("format", "csv")
-        if export_format not in ["csv", "json", "xlsx", "zip"]:
+        if export_format not in ["csv", "json", "xlsx", "zip", "parquet"]:
             return (
                 jsonify(
                     {
                         "error": f"Unsupported export format: {export_format}",
                         "error_type": "validation_error",
-                        "supported_formats": ["csv", "json", "zip", "xlsx"],
+                        "supported_formats": ["csv", "json", "zip", "xlsx", "parquet"],
                     }
                 ),
                 400,
@@ -1991,22 +1813,21 @@ def export_data_route(study_id):
         if export_format == "zip":
             try:
                 # Import directly to avoid circular imports
-                from app.utility.sessions import get_all_study_csv_files, get_zip
-
-                # Connect directly to MySQL for better reliability
-                import MySQLdb
-                import os
-
-                # Get environment variables for database connection
-                db_host = os.environ.get("MYSQL_HOST")
-                db_user = os.environ.get("MYSQL_USER")
-                db_pass = os.environ.get("MYSQL_PASSWORD")
-                db_name = os.environ.get("MYSQL_DB")
-
-                # Connect directly to MySQL
-                db = MySQLdb.connect(
-                    host=db_host, user=db_user, passwd=db_pass, db=db_name
+                from app.utility.sessions import (
+                    get_all_study_csv_files,
+                    get_zip_entries,
                 )
+                from app.utility.analytics.task_queue import enqueue_task
+                from app.utility.export_builder import (
+                    build_study_export,
+                    claim_export_build,
+                    export_artifact_path,
+                    get_export_watermark,
+                    release_export_build,
+                )
+
+                # Pooled connection for this request, returned when the request ends
+                db = get_db_connection()
 
                 # Create cursor and execute query
                 cursor = db.cursor()
@@ -2021,50 +1842,101 @@ def export_data_route(study_id):
 
                 study_name = study_name_result[0]
 
+                # Add timestamp to filename for uniqueness
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                download_name = f"{study_name}_analytics_export_{timestamp}.zip"
+
+                # Serve the prebuilt export while no session was uploaded since it was built,
+                # otherwise have it rebuilt in the background and stream this one
+                export_root = current_app.config["RESULTS_BASE_DIR_PATH"]
+                watermark = get_export_watermark(cursor, study_id)
+                artifact = export_artifact_path(export_root, study_id, watermark)
+                if not os.path.exists(artifact) and claim_export_build(
+                    export_root, study_id
+                ):
+                    job_info = enqueue_task(build_study_export, study_id, export_root)
+                    if job_info["status"] == "failed":
+                        release_export_build(export_root, study_id)
+
+                # Also there when the build ran synchronously (no task queue)
+                if os.path.exists(artifact):
+                    cursor.close()
+                    db.close()
+                    logger.info(f"Serving prebuilt export {artifact}")
+                    return send_file(
+                        artifact,
+                        mimetype="application/zip",
+                        as_attachment=True,
+                        download_name=download_name,
+                    )
+
                 # Get all file data for this study
                 results_with_size = get_all_study_csv_files(study_id, cursor)
 
                 if not results_with_size:
                     logger.warning(f"No data files found for study ID {study_id}")
 
-                # Create the zip file
-                memory_file = get_zip(results_with_size, study_id, db, mode="study")
+                # Name the files within the archive, they are read while it streams
+                entries = get_zip_entries(results_with_size, study_id, db, mode="study")
 
                 # Close database resources
                 cursor.close()
                 db.close()
 
-                # Add timestamp to filename for uniqueness
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                download_name = f"{study_name}_analytics_export_{timestamp}.zip"
-
-                # Return the zip file
-                return send_file(
-                    memory_file,
-                    mimetype="application/zip",
-                    as_attachment=True,
-                    download_name=download_name,
-                )
+                # Stream the zip file
+                return zip_response(entries, download_name)
 
             except Exception as e:
                 logger.error(f"Error creating ZIP export: {str(e)}")
                 logger.error(traceback.format_exc())
                 return jsonify({"error": f"Error creating ZIP export: {str(e)}"}), 500
 
-        # For other formats, use direct connection for better reliability
-        try:
-            # Connect directly to MySQL
-            import MySQLdb
-            import os
+        # Parquet datasets per stream, partitioned by participant session and task
+        if export_format == "parquet":
+            try:
+                from app.utility.sessions import get_all_study_csv_files
+                from app.utility.parquet_export import (
+                    get_parquet_entries,
+                    get_trial_summary_rows,
+                )
 
-            # Get environment variables for database connection
-            db_host = os.environ.get("MYSQL_HOST")
-            db_user = os.environ.get("MYSQL_USER")
-            db_pass = os.environ.get("MYSQL_PASSWORD")
-            db_name = os.environ.get("MYSQL_DB")
+                # Pooled connection for this request, returned when the request ends
+                db = get_db_connection()
+                cursor = db.cursor()
 
-            # Connect directly to MySQL
-            db = MySQLdb.connect(host=db_host, user=db_user, passwd=db_pass, db=db_name)
+                cursor.execute(
+                    "SELECT study_name FROM study WHERE study_id = %s", (study_id,)
+                )
+                study_name_result = cursor.fetchone()
+                if not study_name_result:
+                    return jsonify({"error": "Study not found"}), 404
+
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                download_name = f"{study_name_result[0]}_parquet_{timestamp}.zip"
+
+                # Rows are read now, the files are converted while the archive streams
+                results_with_size = get_all_study_csv_files(study_id, cursor)
+                summary_rows = get_trial_summary_rows(study_id, cursor)
+
+                cursor.close()
+                db.close()
+
+                return zip_response(
+                    get_parquet_entries(results_with_size, summary_rows), download_name
+                )
+
+            except Exception as e:
+                logger.error(f"Error creating Parquet export: {str(e)}")
+                logger.error(traceback.format_exc())
+                return (
+                    jsonify({"error": f"Error creating Parquet export: {str(e)}"}),
+                    500,
+                )
+
+        # For other formats, query the rows directly
+        try:
+            # Pooled connection for this request, returned when the request ends
+            db = get_db_connection()
 
             # Create cursor
             cursor = db.cursor()
@@ -2386,17 +2258,8 @@ def get_studies():
             logger.warning("No authenticated user, will show limited studies")
 
         # Get real database data
-        import MySQLdb
-        import os
-
-        # Get environment variables for database connection
-        db_host = os.environ.get("MYSQL_HOST")
-        db_user = os.environ.get("MYSQL_USER")
-        db_pass = os.environ.get("MYSQL_PASSWORD")
-        db_name = os.environ.get("MYSQL_DB")
-
-        # Connect directly to MySQL
-        db = MySQLdb.connect(host=db_host, user=db_user, passwd=db_pass, db=db_name)
+        # Pooled connection for this request, returned when the request ends
+        db = get_db_connection()
 
         # Create cursor and execute query
         cursor = db.cursor()
@@ -3040,6 +2903,7 @@ def health_check():
                 "host": os.getenv("MYSQL_HOST", "unknown"),
                 "database": os.getenv("MYSQL_DB", "unknown"),
                 "connected": db_connected,
+                "pool": get_pool().stats(),
             },
             "queue_status": {
                 "status": queue_status,
@@ -3164,18 +3028,8 @@ def get_participant_task_details(study_id):
             )
 
         try:
-            # Connect directly to MySQL
-            import MySQLdb
-            import os
-
-            # Get environment variables for database connection
-            db_host = os.environ.get("MYSQL_HOST")
-            db_user = os.environ.get("MYSQL_USER")
-            db_pass = os.environ.get("MYSQL_PASSWORD")
-            db_name = os.environ.get("MYSQL_DB")
-
-            # Connect directly to MySQL
-            db = MySQLdb.connect(host=db_host, user=db_user, passwd=db_pass, db=db_name)
+            # Pooled connection for this request, returned when the request ends
+            db = get_db_connection()
 
             # Create cursor
             cursor = db.cursor()
@@ -3317,6 +3171,12 @@ def queue_status():
         return jsonify({"status": "error", "error": str(e)}), 500
 
 
+@analytics_bp.route("/db-pool", methods=["GET"])
+def db_pool_status():
+    """Checkouts, waits and open connections of this process's database connection pool"""
+    return jsonify({**get_pool().stats(), "timestamp": datetime.now().isoformat()})
+
+
 # Participant media endpoints
 
 
@@ -3324,141 +3184,28 @@ def queue_status():
 def get_participant_media(study_id, participant_id):
     """Get list of media files (PNG screenshots and MP4 recordings) for a participant"""
     try:
-        # Define the base directory for participant data
-        base_dir = "/home/hci/Documents/participants_results"
-        study_directory = f"{base_dir}/{study_id}_study_id"
-
         logger.info(
             f"Looking for media for participant ID {participant_id} in study {study_id}"
         )
 
-        if not os.path.exists(study_directory):
-            logger.warning(f"Study directory not found: {study_directory}")
-            return (
-                jsonify({"error": "Study directory not found", "study_id": study_id}),
-                404,
-            )
-
-        # Get a list of all participant session directories for this study
-        participant_dirs = [
-            d
-            for d in os.listdir(study_directory)
-            if os.path.isdir(os.path.join(study_directory, d))
-            and d.endswith("_participant_session_id")
-        ]
+        # Stored files are found through their session_data_instance rows
+        cursor = get_db_connection().cursor()
+        media_files = {}
+        for trial_id, filename, _ in get_participant_media_files(
+            study_id, participant_id, cursor
+        ):
+            trial_media = media_files.setdefault(
+                str(trial_id), {"screenshots": [], "videos": []}
+            )
+            if filename.endswith(".mp4"):
+                trial_media["videos"].append(filename)
+            else:
+                trial_media["screenshots"].append(filename)
 
         logger.info(
-            f"Found {len(participant_dirs)} participant directories: {participant_dirs}"
+            f"Found media for {len(media_files)} trials of participant {participant_id}"
         )
 
-        # Sort directories by participant session ID (numerically)
-        participant_dirs.sort(key=lambda x: int(x.split("_")[0]))
-
-        # For the immediate need: Just use the first available participant directory
-        # FUTURE TODO: Replace this with proper database mapping between frontend IDs and directory IDs
-
-        if not participant_dirs:
-            logger.warning(f"No participant directories found for study {study_id}")
-            return (
-                jsonify(
-                    {"error": "No participant directories found", "study_id": study_id}
-                ),
-                404,
-            )
-
-        # Temporary solution: Map frontend IDs to available directories
-        # First find directories that actually have media files
-        dirs_with_media = []
-        for dir_name in participant_dirs:
-            dir_path = os.path.join(study_directory, dir_name)
-            trial_dirs = [
-                d
-                for d in os.listdir(dir_path)
-                if os.path.isdir(os.path.join(dir_path, d)) and d.endswith("_trial_id")
-            ]
-
-            # Check if any trial directories have media files
-            has_media = False
-            for trial_dir in trial_dirs:
-                trial_path = os.path.join(dir_path, trial_dir)
-                if trial_path and os.path.exists(trial_path):
-                    files = os.listdir(trial_path)
-                    if any(
-                        f.lower().endswith(".mp4") or f.lower().endswith(".png")
-                        for f in files
-                    ):
-                        has_media = True
-                        break
-
-            if has_media:
-                dirs_with_media.append(dir_name)
-
-        # Use a directory with media if any exist
-        if dirs_with_media:
-            # Simple rotating selection - use modulo to pick a directory
-            try:
-                # Try to use the participant_id as an index (modulo the length of dirs_with_media)
-                idx = int(participant_id) % len(dirs_with_media)
-                session_dir = dirs_with_media[idx]
-            except (ValueError, TypeError):
-                # If conversion fails, just use the first directory with media
-                session_dir = dirs_with_media[0]
-
-            logger.info(
-                f"Using directory with media: {session_dir} for participant ID {participant_id}"
-            )
-        else:
-            # Fallback to first directory if none have media
-            session_dir = participant_dirs[0]
-            logger.warning(
-                f"No directories with media found, using first directory: {session_dir}"
-            )
-
-        media_directory = os.path.join(study_directory, session_dir)
-        logger.info(f"All available directories with media: {dirs_with_media}")
-
-        # Check if the resolved directory exists (should always be true at this point)
-        if not os.path.exists(media_directory):
-            logger.warning(f"Resolved media directory not found: {media_directory}")
-            return (
-                jsonify(
-                    {
-                        "error": "Resolved participant media directory not found",
-                        "study_id": study_id,
-                        "participant_id": participant_id,
-                    }
-                ),
-                404,
-            )
-
-        # Find all trials for this participant
-        media_files = {}
-
-        # Look for trial directories
-        trial_dirs = [
-            d
-            for d in os.listdir(media_directory)
-            if os.path.isdir(os.path.join(media_directory, d))
-            and d.endswith("_trial_id")
-        ]
-
-        for trial_dir in trial_dirs:
-            trial_id = trial_dir.split("_")[0]  # Extract the numeric trial ID
-            trial_path = os.path.join(media_directory, trial_dir)
-
-            # Find PNG screenshots and MP4 recordings
-            screenshots = [
-                f for f in os.listdir(trial_path) if f.lower().endswith(".png")
-            ]
-            videos = [f for f in os.listdir(trial_path) if f.lower().endswith(".mp4")]
-
-            # Add to the result
-            media_files[trial_id] = {"screenshots": screenshots, "videos": videos}
-
-            logger.info(
-                f"Found {len(screenshots)} screenshots and {len(videos)} videos for trial {trial_id}"
-            )
-
         return jsonify(
             {
                 "study_id": study_id,
@@ -3487,114 +3234,38 @@ def get_participant_media(study_id, participant_id):
 def get_media_file(study_id, participant_id, trial_id, filename):
     """Serve a media file (PNG or MP4) for a participant"""
     try:
-        # Define the base directory for participant data
-        base_dir = "/home/hci/Documents/participants_results"
-        study_directory = f"{base_dir}/{study_id}_study_id"
-
         logger.info(
             f"Attempting to serve media file for participant {participant_id}, trial {trial_id}, file {filename}"
         )
 
-        if not os.path.exists(study_directory):
-            logger.warning(f"Study directory not found: {study_directory}")
-            return (
-                jsonify({"error": "Study directory not found", "study_id": study_id}),
-                404,
-            )
-
-        # Get a list of all participant session directories for this study
-        participant_dirs = [
-            d
-            for d in os.listdir(study_directory)
-            if os.path.isdir(os.path.join(study_directory, d))
-            and d.endswith("_participant_session_id")
-        ]
-
-        # Sort directories by participant session ID (numerically)
-        participant_dirs.sort(key=lambda x: int(x.split("_")[0]))
-
-        # For the immediate need: Use consistent directory mapping
-        # FUTURE TODO: Replace this with proper database mapping between frontend IDs and directory IDs
+        # Only files recorded for this participant's trial can be served
+        cursor = get_db_connection().cursor()
+        file_path = next(
+            (
+                results_path
+                for _, name, results_path in get_participant_media_files(
+                    study_id, participant_id, cursor, trial_id=trial_id
+                )
+                if name == filename
+            ),
+            None,
+        )
 
-        if not participant_dirs:
-            logger.warning(f"No participant directories found for study {study_id}")
+        # Check if the file exists
+        if file_path is None or not os.path.exists(file_path):
+            logger.warning(f"Media file not found: {filename} (path {file_path})")
             return (
                 jsonify(
-                    {"error": "No participant directories found", "study_id": study_id}
+                    {
+                        "error": "Media file not found",
+                        "path": f"{study_id}/{participant_id}/{trial_id}/{filename}",
+                    }
                 ),
                 404,
             )
 
-        # Temporary solution: Map frontend IDs to available directories with media
-        # First find directories that actually have media files
-        dirs_with_media = []
-        for dir_name in participant_dirs:
-            dir_path = os.path.join(study_directory, dir_name)
-            trial_dirs = [
-                d
-                for d in os.listdir(dir_path)
-                if os.path.isdir(os.path.join(dir_path, d)) and d.endswith("_trial_id")
-            ]
-
-            # Check if any trial directories have media files
-            has_media = False
-            for trial_dir in trial_dirs:
-                trial_path = os.path.join(dir_path, trial_dir)
-                if trial_path and os.path.exists(trial_path):
-                    files = os.listdir(trial_path)
-                    if any(
-                        f.lower().endswith(".mp4") or f.lower().endswith(".png")
-                        for f in files
-                    ):
-                        has_media = True
-                        break
-
-            if has_media:
-                dirs_with_media.append(dir_name)
-
-        # Use a directory with media if any exist
-        if dirs_with_media:
-            # Simple rotating selection - use modulo to pick a directory
-            try:
-                # Try to use the participant_id as an index (modulo the length of dirs_with_media)
-                idx = int(participant_id) % len(dirs_with_media)
-                session_dir = dirs_with_media[idx]
-            except (ValueError, TypeError):
-                # If conversion fails, just use the first directory with media
-                session_dir = dirs_with_media[0]
-
-            logger.info(
-                f"Using directory with media: {session_dir} for participant ID {participant_id}"
-            )
-        else:
-            # Fallback to first directory if none have media
-            session_dir = participant_dirs[0]
-            logger.warning(
-                f"No directories with media found, using first directory: {session_dir}"
-            )
-
-        participant_directory = os.path.join(study_directory, session_dir)
-        logger.info(f"All available directories with media: {dirs_with_media}")
-
-        # Form the complete file path
-        file_path = f"{participant_directory}/{trial_id}_trial_id/{filename}"
-        logger.info(f"Attempting to serve media file: {file_path}")
-
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            logger.warning(f"Media file not found: {file_path}")
-            return jsonify({"error": "Media file not found", "path": file_path}), 404
-
-        # Determine the content type based on file extension
-        content_type = None
-        if filename.lower().endswith(".png"):
-            content_type = "image/png"
-        elif filename.lower().endswith(".jpg") or filename.lower().endswith(".jpeg"):
-            content_type = "image/jpeg"
-        elif filename.lower().endswith(".mp4"):
-            content_type = "video/mp4"
-
         # Serve the file
+        content_type = MEDIA_TYPES[os.path.splitext(filename)[1]]
         return send_file(file_path, mimetype=content_type)
     except Exception as e:
         logger.error(f"Error serving media file: {str(e)}")
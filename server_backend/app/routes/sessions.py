@@ -1,10 +1,9 @@
-import glob
 import io
 import os
 import json
 import tempfile
 import zipfile
-from flask import Blueprint, current_app, request, jsonify, Response, send_file
+from flask import Blueprint, current_app, request, jsonify, Response
 from app.utility.sessions import (
     get_all_participant_csv_files,
     get_all_participant_session_csv_files,
@@ -15,23 +14,41 @@ from app.utility.sessions import (
     get_participant_name_for_folder,
     get_participant_session_name_for_folder,
     get_trial_order_for_folder,
-    get_zip,
-    process_trial_file,
+    get_zip_entries,
+    verify_study_files,
 )
+from app.utility.analytics.task_queue import enqueue_task
+from app.utility.analytics.trial_metrics import precompute_trial_metrics
+from app.utility.blob_store import store_blob
 from app.utility.db_connection import get_db_connection
+from app.utility.ingest import IngestError, ingest_session, plan_session_ingest
+from app.utility.zip_stream import zip_response
+from app.utility.uploads import (
+    check_upload_owner,
+    discard_upload,
+    init_upload,
+    missing_chunks,
+    open_upload,
+    store_chunk,
+)
 from flask_security import auth_required
+from flask_login import current_user
 
 bp = Blueprint("sessions", __name__)
 
 
+# Directory where chunked uploads are staged until they are committed
+def get_upload_root():
+    return current_app.config.get("UPLOAD_STAGING_DIR") or os.path.join(
+        tempfile.gettempdir(), "fulcrum_uploads"
+    )
+
+
 # Saving participant session results
 # Excpects a JSON and a zip file with PRECISE naming standards
 @bp.route("/api/save_participant_session", methods=["POST"])
 @auth_required()
 def save_participant_session():
-    temp_dir = None
-    conn = None
-
     try:
         # Check file input
         if "file" not in request.files:
@@ -50,122 +67,144 @@ def save_participant_session():
         except json.JSONDecodeError as e:
             return jsonify({"error": f"Invalid JSON: {str(e)}"}), 400
 
-        # Get info from JSON
-        participant_session_id = session_data.get("participantSessId")
-        trials = session_data.get("trials", [])
-        study_id = session_data.get("study_id")
-
-        # Bad JSON info
-        if not participant_session_id or not trials:
-            return jsonify({"error": "Invalid session data or no trials found"}), 400
-
-        # Get the original filename (e.g., "1_participant_session.zip")
-        filename = file.filename
-
-        # Extract the base name
-        base_name = "_".join(filename.split("_"))
-
-        # Create a temporary directory
-        temp_dir = tempfile.mkdtemp()
-
-        # Generate the path for the zip file using the extracted base name
-        zip_path = os.path.join(temp_dir, f"{base_name}.zip")
-
-        # Save the file to the zip path
-        file.save(zip_path)
-        print("zip_path", zip_path)
-
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(temp_dir)
-
-        trial_counter = 1
-
-        # Iterate over each trial folder (by iterating over each trial in JSON), processing files for that SPECIFIC trial
-        for trial in trials:
-            task_id = trial.get("taskID")
-            factor_id = trial.get("factorID")
-            started_at = trial.get("startedAt")
-
-            if not (task_id and factor_id and started_at):
-                return jsonify({"error": "Improper trial info from inputted JSON"}), 400
-
-            try:
-                # Connect to the database
-                conn = get_db_connection()
-                with conn.cursor() as cur:
-                    # Insert trial data into the database
-                    insert_trial = """
-                    INSERT INTO trial (participant_session_id, task_id, factor_id, started_at)
-                    VALUES(%s, %s, %s, %s)
-                    """
-                    cur.execute(
-                        insert_trial,
-                        (participant_session_id, task_id, factor_id, started_at),
-                    )
-                    conn.commit()
-
-                    # Get the inserted trial ID
-                    cur.execute("SELECT LAST_INSERT_ID()")
-                    trial_id = cur.fetchone()[0]
-
-                    # Create the path for the trial-specific directory in the participant's results
-                    base_dir = current_app.config.get("RESULTS_BASE_DIR_PATH")
-                    participant_dir = f"{base_dir}/{study_id}_study_id/{participant_session_id}_participant_session_id/{trial_id}_trial_id"
-                    os.makedirs(participant_dir, exist_ok=True)
-
-                    # Find and process the files in the current trial folder
-                    trial_folder = os.path.join(temp_dir, f"*trial_{trial_counter}")
-                    trial_folders = glob.glob(trial_folder)
-
-                    # Make sure there is an exact match for trial folder naming
-                    if not trial_folders:
-                        return (
-                            jsonify(
-                                {
-                                    "error": f"No trial folder found for trial {trial_counter}"
-                                }
-                            ),
-                            400,
-                        )
-
-                    trial_folder = trial_folders[0]
-
-                    if os.path.exists(trial_folder):
-                        # Process each file within 1 specific trial folder
-                        for file_name in os.listdir(trial_folder):
-                            # Accepted file types. Change this if we ever support more
-                            if file_name.endswith((".csv", ".mp4", ".png")):
-                                process_trial_file(
-                                    cur,
-                                    conn,
-                                    trial_id,
-                                    participant_dir,
-                                    trial_folder,
-                                    file_name,
-                                )
-
-            except Exception as e:
-                if conn:
-                    conn.rollback()
-                return (
-                    jsonify(
-                        {
-                            "Note": "Rollback initiated. Database insertion failed",
-                            "error_type": type(e).__name__,
-                            "error_message": str(e),
-                        }
-                    ),
-                    500,
-                )
-
-            trial_counter += 1
-        os.system(f"rm -rf {temp_dir}")
-        return jsonify({"message": "Participant session saved successfully"}), 200
+        # Members are streamed straight out of the uploaded file, it is never saved or extracted to a temp dir
+        try:
+            zip_ref = zipfile.ZipFile(file.stream)
+        except zipfile.BadZipFile as e:
+            return jsonify({"error": f"Invalid zip file: {str(e)}"}), 400
+
+        with zip_ref:
+            return ingest_session_zip(zip_ref, session_data)
+
+    except Exception as e:
+        return jsonify({"error_type": type(e).__name__, "error_message": str(e)}), 500
+
+
+# Chunked upload, step 1: register the session zip's manifest. Returns which chunks still need sending so an interrupted upload
+# can resume from where it stopped
+@bp.route("/api/uploads", methods=["POST"])
+@auth_required()
+def init_session_upload():
+    data = request.get_json(silent=True) or {}
+
+    try:
+        upload_id, missing = init_upload(
+            get_upload_root(), data.get("manifest"), current_user.id
+        )
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"upload_id": upload_id, "missing": missing}), 200
+
+
+# Chunked upload, step 2: one chunk, addressed by its sha256 and verified while it is streamed to disk
+@bp.route("/api/uploads/<upload_id>/chunks/<chunk_hash>", methods=["PUT"])
+@auth_required()
+def upload_session_chunk(upload_id, chunk_hash):
+    try:
+        store_chunk(
+            get_upload_root(), upload_id, chunk_hash, request.stream, current_user.id
+        )
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"message": "Chunk saved"}), 200
+
+
+# Chunked upload, step 3: check the chunks add up to the session zip and save the session exactly like a direct upload
+@bp.route("/api/uploads/<upload_id>/commit", methods=["POST"])
+@auth_required()
+def commit_session_upload(upload_id):
+    session_data = request.get_json(silent=True)
+    if not session_data:
+        return jsonify({"error": "No session data received"}), 400
+
+    upload_root = get_upload_root()
+    try:
+        check_upload_owner(upload_root, upload_id, current_user.id)
+        missing = missing_chunks(upload_root, upload_id)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 404
+    if missing:
+        return jsonify({"error": "Upload incomplete", "missing": missing}), 409
+
+    try:
+        # The chunks are read in place and checked against the upload's sha256 before anything is ingested, the zip is
+        # never reassembled on disk
+        try:
+            zip_ref = zipfile.ZipFile(open_upload(upload_root, upload_id))
+        except (ValueError, zipfile.BadZipFile) as e:
+            discard_upload(upload_root, upload_id)  # corrupt, client has to start over
+            return jsonify({"error": str(e)}), 400
+
+        with zip_ref:
+            response = ingest_session_zip(zip_ref, session_data)
+        if response[1] == 200:
+            discard_upload(upload_root, upload_id)
+        return response
 
     except Exception as e:
         return jsonify({"error_type": type(e).__name__, "error_message": str(e)}), 500
 
 
+# Saves every trial's files and database rows from an open session results zip in a single transaction
+def ingest_session_zip(zip_ref, session_data):
+    # Get info from JSON
+    participant_session_id = session_data.get("participantSessId")
+    trials = session_data.get("trials", [])
+
+    # Bad JSON info
+    if not participant_session_id or not trials:
+        return jsonify({"error": "Invalid session data or no trials found"}), 400
+
+    # Match every trial to its files before touching the database
+    try:
+        plan = plan_session_ingest(zip_ref, trials)
+    except IngestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        conn = get_db_connection()
+        stored = ingest_session(
+            conn,
+            zip_ref,
+            plan,
+            current_app.config.get("RESULTS_BASE_DIR_PATH"),
+            participant_session_id,
+        )
+    except IngestError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return (
+            jsonify(
+                {
+                    "Note": "Rollback initiated. Database insertion failed",
+                    "error_type": type(e).__name__,
+                    "error_message": str(e),
+                }
+            ),
+            500,
+        )
+
+    print(
+        f"Stored {len(stored)} files ({sum(f['size'] for f in stored)} bytes) for participant session {participant_session_id}"
+    )
+
+    # Metrics are computed once per trial in the background so analytics never reparse these files
+    for trial_id in sorted({f["trial_id"] for f in stored}):
+        enqueue_task(precompute_trial_metrics, trial_id)
+
+    return jsonify({"message": "Participant session saved successfully"}), 200
+
+
 # Saves tracked data to server file system, db will have a file path to the CSVs
 @bp.route(
     "/api/save_session_data_instance/<int:participant_session_id>/<int:study_id>/<int:task_id>/<int:measurement_option_id>/<int:factor_id>",
@@ -301,14 +340,9 @@ def get_all_session_data_instance_from_participant_zip(participant_id):
         # if not results_with_size:
         #     return jsonify({"error": "No data found for this participant"}), 404
 
-        memory_file = get_zip(results_with_size, study_id, conn, mode="participant")
+        entries = get_zip_entries(results_with_size, study_id, conn, mode="participant")
 
-        return send_file(
-            memory_file,
-            mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"{participant_name}_participant.zip",
-        )
+        return zip_response(entries, f"{participant_name}_participant.zip")
 
     except Exception as e:
         return jsonify({"error_type": type(e).__name__, "error_message": str(e)}), 500
@@ -362,15 +396,12 @@ def get_all_session_data_instance_from_participant_session_zip():
         # if not results_with_size:
         #     return jsonify({"error": "No data found for this participant session"}), 404
 
-        memory_file = get_zip(
+        entries = get_zip_entries(
             results_with_size, study_id, conn, mode="participant_session"
         )
 
-        return send_file(
-            memory_file,
-            mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"{participant_session_name}_participant_session.zip",
+        return zip_response(
+            entries, f"{participant_session_name}_participant_session.zip"
         )
 
     except Exception as e:
@@ -423,14 +454,9 @@ def get_one_session_data_instance_zip():
         # if not results_with_size:
         #     return jsonify({"error": "No data found for this data instance file"}), 404
 
-        memory_file = get_zip(results_with_size, study_id, conn, mode="one file")
+        entries = get_zip_entries(results_with_size, study_id, conn, mode="one file")
 
-        return send_file(
-            memory_file,
-            mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"{file_name}.zip",
-        )
+        return zip_response(entries, f"{file_name}.zip")
 
     except Exception as e:
         return jsonify({"error_type": type(e).__name__, "error_message": str(e)}), 500
@@ -486,14 +512,9 @@ def get_all_session_data_instance_for_a_trial_zip():
         # if not results_with_size:
         #     return jsonify({"error": "No data found for this trial"}), 404
 
-        memory_file = get_zip(results_with_size, study_id, conn, mode="trial")
+        entries = get_zip_entries(results_with_size, study_id, conn, mode="trial")
 
-        return send_file(
-            memory_file,
-            mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"{task_name}_{factor_name}_{trial_order}.zip",
-        )
+        return zip_response(entries, f"{task_name}_{factor_name}_{trial_order}.zip")
 
     except Exception as e:
         return jsonify({"error_type": type(e).__name__, "error_message": str(e)}), 500
@@ -535,13 +556,42 @@ def get_all_session_data_instance_zip():
         # if not results_with_size:
         #     return jsonify({"error": "No data found for this study"}), 404
 
-        memory_file = get_zip(results_with_size, study_id, conn, mode="study")
+        entries = get_zip_entries(results_with_size, study_id, conn, mode="study")
+
+        return zip_response(entries, f"{study_name}.zip")
+
+    except Exception as e:
+        return jsonify({"error_type": type(e).__name__, "error_message": str(e)}), 500
+
 
-        return send_file(
-            memory_file,
-            mimetype="application/zip",
-            as_attachment=True,
-            download_name=f"{study_name}.zip",
+# Checks a study's stored result files against the size (and with "full": true, the sha256) recorded when they were uploaded
+@bp.route("/api/verify_study_files", methods=["POST"])
+@auth_required()
+def verify_study_result_files():
+    data = request.get_json()
+
+    # Check if study_id is provided
+    if not data or "study_id" not in data:
+        return (
+            jsonify({"error": "Missing study_id in request body"}),
+            400,
+        )
+
+    try:
+        cur = get_db_connection().cursor()
+        damaged = verify_study_files(data["study_id"], cur, bool(data.get("full")))
+        cur.close()
+
+        return (
+            jsonify(
+                {
+                    "damaged": [
+                        {"session_data_instance_id": instance_id, "results_path": path}
+                        for instance_id, path in damaged
+                    ]
+                }
+            ),
+            200,
         )
 
     except Exception as e:
@@ -1303,22 +1353,20 @@ def save_survey_results():
 
         survey_form_id = result[0]
 
-        # Insert JSON results into filesystem
+        # Insert JSON results into the blob store, identical answers are stored once
         base_dir = current_app.config.get("RESULTS_BASE_DIR_PATH")
-        study_dir_path = os.path.join(base_dir, f"{study_id}_study_id")
-        session_dir_path = os.path.join(
-            study_dir_path, f"{participant_session_id}_participant_session_id"
+        results_bytes = json.dumps(resultsJson, ensure_ascii=False, indent=2).encode(
+            "utf-8"
         )
-        os.makedirs(session_dir_path, exist_ok=True)
-
-        file_path = os.path.join(session_dir_path, f"{survey_type}_survey_results.json")
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(resultsJson, f, ensure_ascii=False, indent=2)
+        file_path, _, _, _ = store_blob(io.BytesIO(results_bytes), base_dir, ".json")
 
-        # Update survey results tbl
+        # Update survey results tbl, a re-submission points it at the new answers
         insert_survey_results_query = """
-        INSERT IGNORE INTO survey_results (survey_form_id, participant_session_id, file_path)
+        INSERT INTO survey_results (survey_form_id, participant_session_id, file_path)
         VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            file_path = VALUES(file_path),
+            completed_at = CURRENT_TIMESTAMP
         """
         cur.execute(
             insert_survey_results_query,
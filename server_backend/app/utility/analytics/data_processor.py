@@ -6,11 +6,19 @@ import logging
 from functools import wraps
 import os
 import io
+import struct
 import zipfile
 import pandas as pd
 import traceback  # For detailed error logs
 import tempfile  # For handling temporary files
 import json  # For parsing JSON data
+from app.utility.analytics.metric_rollups import get_task_rollups
+from app.utility.mp4_header import read_mp4_duration
+from app.utility.trial_streams import (
+    MEASUREMENT_FILE_EXTENSIONS,
+    is_trial_stream,
+    read_measurement_frame,
+)
 
 # Import scipy here to ensure it's available
 try:
@@ -117,303 +125,200 @@ def clear_cache_for_study(study_id):
 
 # New functions for zip file processing
 
+# Measurement types named in result file paths, in the order they are matched
+MEASUREMENT_TYPES = [
+    ("mouse movement", "Mouse Movement"),
+    ("keyboard input", "Keyboard Input"),
+    ("mouse clicks", "Mouse Clicks"),
+    ("mouse scrolls", "Mouse Scrolls"),
+]
+
+# Column types of the measurement CSVs, so pandas does not infer them per file
+MEASUREMENT_CSV_DTYPES = {
+    "Time": str,
+    "running_time": "float64",
+    "x": "float64",
+    "y": "float64",
+    "keys": "category",
+    "vk": "Int32",
+    "pressed": "Int8",
+}
+
+
+def classify_zip_member(path, header=None):
+    """
+    Measurement type of a result file in a session zip
+
+    Args:
+        path: Path of the member within the zip, folders included
+        header: Column names of the file, used when the path does not name its type
+
+    Returns:
+        Measurement type, or the file name without extension when it cannot be told
+    """
+    for pattern, data_type_name in MEASUREMENT_TYPES:
+        if pattern in path.lower():
+            return data_type_name
+
+    if header:
+        if "keys" in header:
+            return "Keyboard Input"
+        if "x" in header and "y" in header:
+            return "Mouse Movement"
+
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_measurement_member(zip_ref, info):
+    """
+    Read a measurement file of a session zip into a DataFrame, opening it once
+
+    CSVs are classified from their path and the header line, and the rest of the file
+    is parsed with MEASUREMENT_CSV_DTYPES. Trial streams carry their own column types.
+
+    Returns:
+        (measurement type, DataFrame)
+    """
+    with zip_ref.open(info) as f:
+        if is_trial_stream(info.filename):
+            df = read_measurement_frame(f, name=info.filename)
+            return classify_zip_member(info.filename, list(df.columns)), df
+
+        header = f.readline().decode("utf-8").strip().split(",")
+        if header == [""]:
+            raise pd.errors.EmptyDataError("No columns to parse from file")
+        df = pd.read_csv(
+            f,
+            names=header,
+            header=None,
+            dtype={
+                column: dtype
+                for column, dtype in MEASUREMENT_CSV_DTYPES.items()
+                if column in header
+            },
+            on_bad_lines="warn",
+        )
+        return classify_zip_member(info.filename, header), df
+
+
+def get_trial_id_from_path(path):
+    # Path format is typically: something/<trial_id>_trial_id/file.mp4
+    for part in path.split("/"):
+        if "_trial_id" in part.lower():
+            return part.split("_")[0]
+    return None
+
 
 def extract_session_data_from_zip(zip_path, data_type=None):
     """
     Extract data from a session zip file
 
+    Members are read in one pass in archive order. Each measurement file is opened and
+    parsed once, screen recording durations are read from the MP4 header of the member
+    without extracting it.
+
     Args:
         zip_path: Path to the zip file
-        data_type: Optional filter for specific data types (e.g., "Mouse Movement", "Keyboard Inputs")
+        data_type: Optional filter for specific data types (e.g., "Mouse Movement", "Keyboard Inputs"),
+            applied to measurement files. Recording durations are read for every trial
 
     Returns:
-        Dictionary mapping data types to DataFrames
+        Dictionary mapping data types to DataFrames, plus "video_durations" (trial id ->
+        seconds) when the zip has screen recordings
     """
     logger.info(f"======== EXTRACTING DATA FROM ZIP ========")
     logger.info(f"ZIP Path: {zip_path}")
     logger.info(f"Data Type Filter: {data_type}")
 
-    # Debugging to find out what files we can find
-    import glob
-
-    logger.info("DEBUG: Looking for CSV files in HCI Documents directory...")
-    hci_files = glob.glob(
-        "/home/hci/Documents/participants_results/**/*.csv", recursive=True
-    )
-    if hci_files:
-        logger.info(f"Found {len(hci_files)} CSV files in HCI Documents")
-        for i, file_path in enumerate(hci_files[:5]):  # Show first 5
-            logger.info(f"Sample HCI file {i+1}: {file_path}")
-    else:
-        logger.info("No CSV files found in HCI Documents - access issue?")
-
     if not os.path.exists(zip_path):
         logger.error(f"Zip file not found: {zip_path}")
         return {}
 
     try:
-        result_data = {}
+        frames = defaultdict(list)
+        video_durations = {}
+        counts = defaultdict(int)
 
         with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            # List all files in the zip
-            all_files = zip_ref.namelist()
-
-            # Log all file types for debugging
-            file_extensions = set(
-                [
-                    os.path.splitext(f)[1].lower()
-                    for f in all_files
-                    if os.path.splitext(f)[1]
-                ]
-            )
-            logger.info(f"ZIP contains file types: {file_extensions}")
-
-            # Create separate lists for different file types
-            csv_files = [f for f in all_files if f.endswith(".csv")]
-            mp4_files = [f for f in all_files if f.endswith(".mp4")]
+            for info in zip_ref.infolist():
+                file_path = info.filename
+                extension = os.path.splitext(file_path)[1].lower()
+                counts[extension] += 1
 
-            # Filter by data type if specified
-            if data_type:
-                if data_type == "Screen Recording":
-                    data_files = [f for f in mp4_files if data_type in f]
-                    logger.info(
-                        f"Filtered to {len(data_files)} MP4 files matching data type '{data_type}'"
-                    )
-                else:
-                    data_files = [f for f in csv_files if data_type in f]
-                    logger.info(
-                        f"Filtered to {len(data_files)} CSV files matching data type '{data_type}'"
-                    )
-            else:
-                # Use all CSVs primarily, but also include MP4s for duration extraction
-                data_files = csv_files
-                logger.info(
-                    f"Using all {len(data_files)} CSV files for primary data processing"
-                )
-                logger.info(
-                    f"Found {len(mp4_files)} MP4 files that will be used for duration information"
-                )
-
-            # Log detailed information about what we found
-            total_count = len(all_files)
-            other_count = total_count - len(csv_files) - len(mp4_files)
-
-            logger.info(
-                f"ZIP contains {total_count} total files: {len(csv_files)} CSV files, {len(mp4_files)} MP4 files, and {other_count} other files"
-            )
-
-            # Process MP4 files to extract durations first (for potential use by other functions)
-            video_durations = {}
-            if len(mp4_files) > 0:
-                logger.info(f"Found {len(mp4_files)} MP4 files, extracting durations")
-                for video_path in mp4_files:
+                if file_path.endswith(".mp4"):
                     try:
-                        # Extract the file to a temporary location
-                        temp_dir = tempfile.mkdtemp()
-                        temp_video_path = os.path.join(
-                            temp_dir, os.path.basename(video_path)
-                        )
-
-                        with zip_ref.open(video_path) as source, open(
-                            temp_video_path, "wb"
-                        ) as target:
-                            target.write(source.read())
-
-                        # Get duration
-                        duration = get_video_duration(temp_video_path)
-                        if duration:
-                            # Extract trial_id from the path for association
-                            # Path format is typically: something/trial_id/file.mp4
-                            path_parts = video_path.split("/")
-                            for part in path_parts:
-                                if "_trial_id" in part.lower():
-                                    trial_id = part.split("_")[0]
-                                    video_durations[trial_id] = duration
-                                    logger.info(
-                                        f"Found duration {duration}s for trial {trial_id} from {os.path.basename(video_path)}"
-                                    )
-                                    break
-
-                        # Clean up
-                        os.unlink(temp_video_path)
-                        os.rmdir(temp_dir)
+                        with zip_ref.open(info) as f:
+                            duration = read_mp4_duration(f)
                     except Exception as e:
                         logger.error(
-                            f"Error processing video file {video_path}: {str(e)}"
+                            f"Error processing video file {file_path}: {str(e)}"
                         )
+                        continue
 
-            # Continue with CSV processing
-            logger.debug(f"Processing {len(data_files)} CSV data files from zip")
-
-            # Process each data file
-            for file_path in data_files:
-                try:
-                    # Extract file name to determine data type
-                    file_name = os.path.basename(file_path)
-
-                    # Figure out what type of data this is
-                    data_type_name = None
-
-                    # First, check if we have database info about this file
-                    try:
-                        # Extract session_data_instance_id from filename (assumes filename is the ID.csv)
-                        instance_id = os.path.splitext(file_name)[0]
-                        if instance_id.isdigit():
-                            # We have a potential session data instance ID, look it up
-                            logger.debug(
-                                f"Found potential session data instance ID in filename: {instance_id}"
-                            )
-
-                            # Look for column names in the first few lines to determine data type
-                            with zip_ref.open(file_path) as f:
-                                first_line = f.readline().decode("utf-8").strip()
-                                if "keys" in first_line.lower():
-                                    data_type_name = "Keyboard Input"
-                                    logger.debug(
-                                        f"Detected Keyboard Input data from column names"
-                                    )
-                                elif "x,y" in first_line.lower():
-                                    if "clicks" in file_path.lower():
-                                        data_type_name = "Mouse Clicks"
-                                        logger.debug(
-                                            f"Detected Mouse Clicks data from column names and path"
-                                        )
-                                    else:
-                                        data_type_name = "Mouse Movement"
-                                        logger.debug(
-                                            f"Detected Mouse Movement data from column names"
-                                        )
-                    except Exception as e:
-                        logger.error(
-                            f"Error determining data type from file inspection: {e}"
+                    trial_id = get_trial_id_from_path(file_path)
+                    if duration and trial_id:
+                        video_durations[trial_id] = duration
+                        logger.info(
+                            f"Found duration {duration}s for trial {trial_id} from {os.path.basename(file_path)}"
                         )
+                    continue
 
-                    # If still not determined, try common patterns
-                    if not data_type_name:
-                        for data_type in [
-                            "Mouse Movement",
-                            "Keyboard Input",
-                            "Keyboard Inputs",
-                            "Mouse Clicks",
-                            "Mouse Scrolls",
-                        ]:
-                            if (
-                                data_type.lower() in file_path.lower()
-                                or data_type.lower() in file_name.lower()
-                            ):
-                                data_type_name = data_type
-                                logger.debug(
-                                    f"Determined data type as {data_type} from path/name"
-                                )
-                                break
-
-                    # Try to extract from parent folder name if still not found
-                    if not data_type_name:
-                        parts = file_path.split("/")
-                        if len(parts) > 1:
-                            folder_name = parts[-2]  # Parent folder
-                            for data_type in [
-                                "Mouse Movement",
-                                "Keyboard Input",
-                                "Keyboard Inputs",
-                                "Mouse Clicks",
-                                "Mouse Scrolls",
-                            ]:
-                                if data_type.lower() in folder_name.lower():
-                                    data_type_name = data_type
-                                    logger.debug(
-                                        f"Determined data type as {data_type} from parent folder"
-                                    )
-                                    break
-
-                    # If still can't determine, examine column headers
-                    if not data_type_name:
-                        try:
-                            with zip_ref.open(file_path) as f:
-                                headers = (
-                                    f.readline().decode("utf-8").strip().split(",")
-                                )
-                                if "keys" in headers:
-                                    data_type_name = "Keyboard Input"
-                                    logger.debug(
-                                        "Determined data type as Keyboard Input from headers"
-                                    )
-                                elif "x" in headers and "y" in headers:
-                                    data_type_name = (
-                                        "Mouse Movement"  # Default to movement
-                                    )
-                                    logger.debug(
-                                        "Determined data type as Mouse Movement from headers"
-                                    )
-                        except Exception as e:
-                            logger.error(f"Error examining headers: {e}")
-
-                    # Last resort - use filename without extension
-                    if not data_type_name:
-                        data_type_name = os.path.splitext(file_name)[0]
-                        logger.debug(f"Using filename as data type: {data_type_name}")
-
-                    # Read the CSV data
-                    try:
-                        with zip_ref.open(file_path) as f:
-                            # Read CSV with more robust error handling
-                            df = pd.read_csv(f, on_bad_lines="warn")
+                # Recordings give every trial's duration, the filter only applies to measurements
+                if not file_path.endswith(MEASUREMENT_FILE_EXTENSIONS) or (
+                    data_type and data_type not in file_path
+                ):
+                    continue
 
-                            # Check if dataframe is empty or missing key columns
-                            if df.empty:
-                                logger.warning(f"Empty dataframe from {file_path}")
-                                continue
-
-                            # Add some basic validation based on data type
-                            if data_type_name == "Mouse Movement" and not all(
-                                col in df.columns for col in ["x", "y"]
-                            ):
-                                logger.warning(
-                                    f"Missing required columns for Mouse Movement in {file_path}"
-                                )
-                                continue
-
-                            if (
-                                data_type_name == "Keyboard Input"
-                                and "keys" not in df.columns
-                            ):
-                                logger.warning(
-                                    f"Missing required columns for Keyboard Input in {file_path}"
-                                )
-                                continue
-
-                            # Add file metadata to help with debugging
-                            df["_source_file"] = os.path.basename(file_path)
-
-                            # Store in result dictionary
-                            if data_type_name in result_data:
-                                # Append to existing data
-                                result_data[data_type_name] = pd.concat(
-                                    [result_data[data_type_name], df]
-                                )
-                                logger.debug(
-                                    f"Added {len(df)} rows to existing {data_type_name} data"
-                                )
-                            else:
-                                # Create new entry
-                                result_data[data_type_name] = df
-                                logger.debug(
-                                    f"Created new {data_type_name} dataframe with {len(df)} rows"
-                                )
-                    except pd.errors.EmptyDataError:
-                        logger.warning(f"Empty CSV file: {file_path}")
-                    except pd.errors.ParserError as pe:
-                        logger.warning(f"CSV parsing error in {file_path}: {str(pe)}")
+                try:
+                    data_type_name, df = read_measurement_member(zip_ref, info)
+                except pd.errors.EmptyDataError:
+                    logger.warning(f"Empty CSV file: {file_path}")
+                    continue
+                except pd.errors.ParserError as pe:
+                    logger.warning(f"CSV parsing error in {file_path}: {str(pe)}")
+                    continue
                 except Exception as e:
                     logger.error(f"Error processing file {file_path}: {str(e)}")
                     logger.error(traceback.format_exc())
+                    continue
+
+                # Check if dataframe is empty or missing key columns
+                if df.empty:
+                    logger.warning(f"Empty dataframe from {file_path}")
+                    continue
+                if data_type_name == "Mouse Movement" and not all(
+                    col in df.columns for col in ["x", "y"]
+                ):
+                    logger.warning(
+                        f"Missing required columns for Mouse Movement in {file_path}"
+                    )
+                    continue
+                if data_type_name == "Keyboard Input" and "keys" not in df.columns:
+                    logger.warning(
+                        f"Missing required columns for Keyboard Input in {file_path}"
+                    )
+                    continue
 
-            # Add video durations data if we found any
-            if len(video_durations) > 0:
-                result_data["video_durations"] = video_durations
-                logger.info(
-                    f"Added {len(video_durations)} video durations to result data"
-                )
+                # Add file metadata to help with debugging
+                df["_source_file"] = os.path.basename(file_path)
+                frames[data_type_name].append(df)
+
+        logger.info(
+            f"ZIP contains {sum(counts.values())} files by type: {dict(counts)}"
+        )
+
+        # One concat per data type instead of one per file
+        result_data = {
+            data_type_name: dfs[0] if len(dfs) == 1 else pd.concat(dfs)
+            for data_type_name, dfs in frames.items()
+        }
+        for data_type_name, df in result_data.items():
+            logger.debug(f"Extracted {len(df)} rows of {data_type_name} data")
+
+        # Add video durations data if we found any
+        if len(video_durations) > 0:
+            result_data["video_durations"] = video_durations
+            logger.info(f"Added {len(video_durations)} video durations to result data")
 
         return result_data
     except Exception as e:
@@ -499,10 +404,95 @@ def process_mouse_movement_data(mouse_movement_df):
         return {}
 
 
+# Keys that undo typing, counted as corrections
+CORRECTION_KEYS = ("Key.backspace", "Key.delete")
+
+# A pause between keystrokes longer than this (seconds) ends a typing burst
+BURST_GAP = 2.0
+
+
+def keystroke_dynamics(t, vk, pressed, is_correction, burst_gap=BURST_GAP):
+    """
+    Vectorized keystroke dynamics from a press/release event stream
+
+    Each press is paired with the next release of the same virtual key. Presses repeated
+    while a key is held down (auto-repeat) are not counted as new keystrokes.
+
+    Args:
+        t: Event times in seconds
+        vk: Virtual-key code of each event (-1 when unknown, never paired)
+        pressed: 1 for key down, 0 for key up
+        is_correction: True for events of a correction key (backspace/delete)
+        burst_gap: Pause in seconds that separates two typing bursts
+
+    Returns:
+        Dictionary of keystroke, correction, dwell, flight and burst metrics
+    """
+    t = np.asarray(t, dtype=np.float64)
+    vk = np.asarray(vk, dtype=np.int64)
+    pressed = np.asarray(pressed).astype(bool)
+    is_correction = np.asarray(is_correction, dtype=bool)
+    n = len(t)
+
+    # Group events by key, in time order within each key (original order breaks ties)
+    order = np.lexsort((np.arange(n), t, vk))
+    s_t, s_vk, s_pressed = t[order], vk[order], pressed[order]
+    same_key = np.r_[False, s_vk[1:] == s_vk[:-1]]
+    autorepeat = s_pressed & same_key & np.r_[False, s_pressed[:-1]]
+    stroke = s_pressed & ~autorepeat
+
+    # Index of the next release at or after every row (n when there is none)
+    release_rows = np.where(s_pressed, n, np.arange(n))
+    next_release = np.minimum.accumulate(release_rows[::-1])[::-1]
+
+    rows = np.flatnonzero(stroke)
+    release = next_release[rows]
+    paired = release < n
+    paired[paired] = (s_vk[release[paired]] == s_vk[rows[paired]]) & (
+        s_vk[rows[paired]] >= 0
+    )
+
+    press_t = s_t[rows]
+    release_t = np.full(len(rows), np.nan)
+    release_t[paired] = s_t[release[paired]]
+
+    # Back to the order keystrokes were typed in
+    typed = np.argsort(press_t, kind="stable")
+    press_t, release_t = press_t[typed], release_t[typed]
+    corrections = int(is_correction[order][rows].sum())
+
+    dwell = release_t - press_t
+    flight = press_t[1:] - release_t[:-1]  # negative when keys overlap (rollover)
+    dwell, flight = dwell[~np.isnan(dwell)], flight[~np.isnan(flight)]
+
+    burst_lengths = np.array([], dtype=np.int64)
+    if len(press_t):
+        burst_ids = np.r_[0, np.cumsum(np.diff(press_t) > burst_gap)]
+        burst_lengths = np.bincount(burst_ids)
+
+    def ms(values, fn):
+        return float(fn(values)) * 1000 if len(values) else 0
+
+    return {
+        "keystrokes": len(rows),
+        "autorepeat_count": int(autorepeat.sum()),
+        "corrections": corrections,
+        "mean_dwell_ms": ms(dwell, np.mean),
+        "median_dwell_ms": ms(dwell, np.median),
+        "mean_flight_ms": ms(flight, np.mean),
+        "median_flight_ms": ms(flight, np.median),
+        "burst_count": len(burst_lengths),
+        "mean_burst_length": float(burst_lengths.mean()) if len(burst_lengths) else 0,
+    }
+
+
 def process_keyboard_data(keyboard_df):
     """
     Process keyboard data to extract metrics
 
+    Streams with key-up events (vk/pressed columns) get the full keystroke dynamics
+    pass, older press-only data falls back to counting rows.
+
     Args:
         keyboard_df: DataFrame containing keyboard data
 
@@ -512,6 +502,9 @@ def process_keyboard_data(keyboard_df):
     if keyboard_df is None or keyboard_df.empty:
         return {}
 
+    if {"vk", "pressed", "running_time"}.issubset(keyboard_df.columns):
+        return process_keystroke_events(keyboard_df)
+
     try:
         # Count keypresses
         total_keypresses = len(keyboard_df)
@@ -561,6 +554,47 @@ def process_keyboard_data(keyboard_df):
         return {}
 
 
+def process_keystroke_events(keyboard_df):
+    """
+    Keyboard metrics from a press/release stream, see keystroke_dynamics
+
+    Args:
+        keyboard_df: DataFrame with running_time, vk, pressed and (optionally) keys
+
+    Returns:
+        Dictionary of metrics
+    """
+    try:
+        running_time = pd.to_numeric(keyboard_df["running_time"], errors="coerce")
+        if "keys" in keyboard_df.columns:
+            is_correction = keyboard_df["keys"].isin(CORRECTION_KEYS).to_numpy()
+        else:
+            is_correction = np.zeros(len(keyboard_df), dtype=bool)
+
+        dynamics = keystroke_dynamics(
+            running_time.to_numpy(),
+            keyboard_df["vk"].to_numpy(),
+            keyboard_df["pressed"].to_numpy(),
+            is_correction,
+        )
+
+        total_keypresses = dynamics.pop("keystrokes")
+        correction_count = dynamics.pop("corrections")
+        duration = running_time.max()
+        return {
+            "total_keypresses": total_keypresses,
+            "correction_count": correction_count,
+            "correction_ratio": (
+                correction_count / total_keypresses if total_keypresses > 0 else 0
+            ),
+            "typing_speed": total_keypresses / duration if duration > 0 else 0,
+            **dynamics,
+        }
+    except Exception as e:
+        logger.error(f"Error processing keystroke events: {str(e)}")
+        return {}
+
+
 def calculate_task_pvalue(completion_times, interaction_data=None, success_rates=None):
     """
     Calculate a comprehensive p-value for a task based on multiple HCI metrics.
@@ -1085,9 +1119,22 @@ def get_video_duration(file_path):
     Args:
         file_path: Path to the video file
 
+    MP4 durations are read from the container header, ffprobe is only started for
+    other formats or MP4 files without a usable movie header.
+
     Returns:
         Duration in seconds or None if couldn't determine
     """
+    if file_path.lower().endswith(".mp4"):
+        try:
+            with open(file_path, "rb") as f:
+                duration = read_mp4_duration(f)
+            if duration:
+                logger.info(f"Video duration for {file_path}: {duration} seconds")
+                return duration
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Could not read MP4 header of {file_path}: {str(e)}")
+
     try:
         # Try to import the necessary libraries
         import subprocess
@@ -1147,31 +1194,18 @@ def process_zip_data_async(study_id=None, participant_id=None, zip_path=None, **
 
     logger.info(f"Current working directory: {os.getcwd()}")
 
-    # Create a new database connection inside the worker process
-    # This prevents issues with the Flask app's connection pool being exhausted
-    # or connections being closed during processing
-    import MySQLdb
+    # The job checks out its own connection from the process's pool (set up from the
+    # MYSQL_* environment variables in the worker), separate from any request's
+    from app.utility.db_pool import get_pool
     import os
     import tempfile
 
-    # Get environment variables for database connection
-    db_host = os.environ.get("MYSQL_HOST")
-    db_user = os.environ.get("MYSQL_USER")
-    db_pass = os.environ.get("MYSQL_PASSWORD")
-    db_name = os.environ.get("MYSQL_DB")
-
     start_time = time.time()
     temp_file = None
 
     try:
-        # Create a fresh database connection for this job
-        logger.info(
-            f"Creating fresh database connection for async job (host={db_host}, db={db_name})"
-        )
-        db_conn = MySQLdb.connect(
-            host=db_host, user=db_user, passwd=db_pass, db=db_name
-        )
-        logger.info("Database connection successful")
+        db_conn = get_pool().checkout()
+        logger.info("Database connection checked out")
 
         # If we don't have a zip file path, we need to create one
         if not zip_path:
@@ -1351,7 +1385,11 @@ def process_zip_data_async(study_id=None, participant_id=None, zip_path=None, **
                         results_with_size = processed_results
 
                 memory_file = get_zip(
-                    results_with_size, study_id, db_conn, mode="participant"
+                    results_with_size,
+                    study_id,
+                    db_conn,
+                    mode="participant",
+                    export_csv=False,
                 )
                 scope = "participant"
             else:
@@ -1493,7 +1531,7 @@ def process_zip_data_async(study_id=None, participant_id=None, zip_path=None, **
                         results_with_size = processed_results
 
                 memory_file = get_zip(
-                    results_with_size, study_id, db_conn, mode="study"
+                    results_with_size, study_id, db_conn, mode="study", export_csv=False
                 )
                 scope = "study"
 
@@ -1543,10 +1581,10 @@ def process_zip_data_async(study_id=None, participant_id=None, zip_path=None, **
                         with zipfile.ZipFile(
                             supplemented_memory_file, "w", zipfile.ZIP_DEFLATED
                         ) as new_zip:
-                            # Find all CSV files recursively
+                            # Find all raw measurement files recursively
                             for root, dirs, files in os.walk(study_dir):
                                 for file in files:
-                                    if file.endswith(".csv"):
+                                    if file.endswith(MEASUREMENT_FILE_EXTENSIONS):
                                         file_path = os.path.join(root, file)
                                         # Get relative path for inside the zip
                                         rel_path = os.path.relpath(file_path, study_dir)
@@ -1670,9 +1708,9 @@ def process_zip_data_async(study_id=None, participant_id=None, zip_path=None, **
                             ):
                                 continue
 
-                            # Add all CSV files in this trial
+                            # Add all raw measurement files in this trial
                             for file_name in os.listdir(trial_path):
-                                if file_name.endswith(".csv"):
+                                if file_name.endswith(MEASUREMENT_FILE_EXTENSIONS):
                                     file_path = os.path.join(trial_path, file_name)
 
                                     # Create a path within the zip that includes session and trial
@@ -1767,7 +1805,7 @@ def process_zip_data_async(study_id=None, participant_id=None, zip_path=None, **
                     # Ensure DB connection is closed if it was opened
                     if "db_conn" in locals() and db_conn:
                         db_conn.close()
-                        logger.info("Database connection closed")
+                        logger.info("Database connection returned to the pool")
 
                     return {
                         "error": "No valid data found in the zip file",
@@ -1942,7 +1980,7 @@ def process_zip_data_async(study_id=None, participant_id=None, zip_path=None, **
         # Close the database connection if it was opened
         if "db_conn" in locals() and db_conn:
             db_conn.close()
-            logger.info("Database connection closed")
+            logger.info("Database connection returned to the pool")
 
         # We've already returned from the function in both try and except blocks,
         # so this code below should not be reachable
@@ -2241,23 +2279,34 @@ def get_task_performance_data(conn, study_id):
         )
         tasks = cursor.fetchall()
 
+        # Rolled up trial durations of every task in one read, when they have been computed
+        try:
+            task_rollups = get_task_rollups(cursor, study_id)
+        except Exception as e:
+            logger.warning(f"Task metric rollups unavailable: {str(e)}")
+            task_rollups = {}
+
         result = []
 
         for task_id, task_name in tasks:
-            # Get average completion time per task (required field)
-            cursor.execute(
-                """
-                SELECT AVG(ABS(TIMESTAMPDIFF(SECOND, t.started_at, t.ended_at))) 
-                FROM trial t
-                JOIN participant_session ps ON t.participant_session_id = ps.participant_session_id
-                WHERE 
-                    ps.study_id = %s AND 
-                    t.task_id = %s AND
-                    t.ended_at IS NOT NULL
-                """,
-                (study_id, task_id),
-            )
-            avg_time = cursor.fetchone()[0] or 0
+            task_duration = task_rollups.get(task_id, {}).get("duration_s")
+            if task_duration:
+                avg_time = task_duration["mean"]
+            else:
+                # Get average completion time per task (required field)
+                cursor.execute(
+                    """
+                    SELECT AVG(ABS(TIMESTAMPDIFF(SECOND, t.started_at, t.ended_at))) 
+                    FROM trial t
+                    JOIN participant_session ps ON t.participant_session_id = ps.participant_session_id
+                    WHERE 
+                        ps.study_id = %s AND 
+                        t.task_id = %s AND
+                        t.ended_at IS NOT NULL
+                    """,
+                    (study_id, task_id),
+                )
+                avg_time = cursor.fetchone()[0] or 0
 
             # Get all completion times for this task to calculate p-value
             # Add more detailed debug logging to diagnose query results
@@ -2314,8 +2363,8 @@ def get_task_performance_data(conn, study_id):
                 import json
                 from app.utility.analytics.task_queue import redis_conn
 
-                # Check if Redis is available
-                if redis_conn:
+                # Check if Redis is available (not needed when the task has rolled up durations)
+                if redis_conn and not task_duration:
                     # Look for recent analysis jobs in Redis
                     for key in redis_conn.keys("result:*"):
                         try:
@@ -2365,7 +2414,7 @@ def get_task_performance_data(conn, study_id):
                 "durationSource": (
                     "video"
                     if len(completion_times) == 0 and video_duration
-                    else "database"
+                    else "metrics" if task_duration else "database"
                 ),
             }
 
@@ -0,0 +1,358 @@
+"""Per-study and per-task rollups of the precomputed trial metrics
+
+Each (study, metric) and (task, metric) pair keeps its count, sum, sum of squares, min,
+max and a fixed-bucket histogram. That is enough for the mean, standard deviation and
+distribution, so summary endpoints read a handful of rows however large a study is.
+
+Rollups are kept up to date as each trial's trial_metrics row is written, replaced or
+deleted, in the same transaction as the change. A trial only moves its own values in or
+out. Only min/max cannot be undone by subtraction. They are re-read from trial_metrics
+when the removed value was the current extreme.
+"""
+
+import json
+from bisect import bisect_right
+
+# Rolled up trial_metrics columns and their histogram bucket lower edges. The last bucket
+# is open ended. Changing edges needs the rollup tables rebuilt (rebuild_rollups)
+ROLLUP_METRICS = {
+    "duration_s": (0, 5, 10, 20, 30, 60, 120, 300, 600),
+    "click_count": (0, 1, 5, 10, 25, 50, 100, 250, 500),
+    "keypresses": (0, 1, 10, 25, 50, 100, 250, 500, 1000),
+    "corrections": (0, 1, 2, 5, 10, 25, 50, 100),
+}
+
+# scope -> (rollup table, key column, predicate selecting the scope's trial_metrics rows)
+SCOPES = {
+    "study": (
+        "study_metric_rollup",
+        "study_id",
+        "t.participant_session_id IN (SELECT participant_session_id FROM participant_session WHERE study_id = %s)",
+    ),
+    "task": ("task_metric_rollup", "task_id", "t.task_id = %s"),
+}
+
+SELECT_TRIAL_OWNERS = """
+SELECT ps.study_id, t.task_id
+FROM trial t
+JOIN participant_session ps ON t.participant_session_id = ps.participant_session_id
+WHERE t.trial_id = %s
+"""
+
+SELECT_TRIAL_VALUES = f"""
+SELECT {", ".join(ROLLUP_METRICS)} FROM trial_metrics WHERE trial_id = %s FOR UPDATE
+"""
+
+
+def empty_rollup(metric):
+    return {
+        "n": 0,
+        "total": 0.0,
+        "total_sq": 0.0,
+        "min_value": None,
+        "max_value": None,
+        "histogram": [0] * len(ROLLUP_METRICS[metric]),
+    }
+
+
+def bucket_index(edges, value):
+    return max(bisect_right(edges, value) - 1, 0)
+
+
+def merge_values(rollup, metric, added=(), removed=()):
+    """
+    Move trial values into and out of a rollup in place
+
+    Returns:
+        True if min/max may be stale and must be re-read from trial_metrics
+    """
+    edges = ROLLUP_METRICS[metric]
+    stale = False
+
+    for value in removed:
+        rollup["n"] -= 1
+        rollup["total"] -= value
+        rollup["total_sq"] -= value * value
+        rollup["histogram"][bucket_index(edges, value)] -= 1
+        stale = stale or value in (rollup["min_value"], rollup["max_value"])
+
+    if rollup["n"] <= 0:
+        rollup.update(empty_rollup(metric))
+        stale = False
+
+    for value in added:
+        rollup["n"] += 1
+        rollup["total"] += value
+        rollup["total_sq"] += value * value
+        rollup["histogram"][bucket_index(edges, value)] += 1
+        if not stale:
+            rollup["min_value"] = min(
+                value if rollup["min_value"] is None else rollup["min_value"], value
+            )
+            rollup["max_value"] = max(
+                value if rollup["max_value"] is None else rollup["max_value"], value
+            )
+
+    return stale
+
+
+def rollup_stats(rollup, metric):
+    """Mean, standard deviation and histogram of a rollup row, as the endpoints use them"""
+    n = rollup["n"]
+    mean = rollup["total"] / n if n else 0
+    variance = max(rollup["total_sq"] / n - mean * mean, 0) if n else 0
+    return {
+        "count": n,
+        "mean": mean,
+        "std": variance**0.5,
+        "min": rollup["min_value"],
+        "max": rollup["max_value"],
+        "histogram": {
+            "edges": list(ROLLUP_METRICS[metric]),
+            "counts": list(rollup["histogram"]),
+        },
+    }
+
+
+def _trial_values(row):
+    """A trial_metrics row (ROLLUP_METRICS order) -> {metric: value}, leaving out NULLs"""
+    if row is None:
+        return {}
+    return {
+        metric: float(value)
+        for metric, value in zip(ROLLUP_METRICS, row)
+        if value is not None
+    }
+
+
+def _update_scope(cur, scope, key, old_values, new_values):
+    table, key_column, trial_filter = SCOPES[scope]
+    metrics = [
+        metric
+        for metric in ROLLUP_METRICS
+        if metric in old_values or metric in new_values
+    ]
+    if not metrics:
+        return
+
+    # Rows exist before they are locked, so concurrent first trials of a scope serialize on them
+    cur.executemany(
+        f"INSERT IGNORE INTO {table} ({key_column}, metric, histogram) VALUES (%s, %s, %s)",
+        [
+            (key, metric, json.dumps(empty_rollup(metric)["histogram"]))
+            for metric in metrics
+        ],
+    )
+    cur.execute(
+        f"""
+        SELECT metric, n, total, total_sq, min_value, max_value, histogram
+        FROM {table} WHERE {key_column} = %s FOR UPDATE
+        """,
+        (key,),
+    )
+    current = {row[0]: row for row in cur.fetchall()}
+
+    updates = []
+    for metric in metrics:
+        _, n, total, total_sq, min_value, max_value, histogram = current[metric]
+        rollup = {
+            "n": n,
+            "total": total,
+            "total_sq": total_sq,
+            "min_value": min_value,
+            "max_value": max_value,
+            "histogram": json.loads(histogram),
+        }
+        stale = merge_values(
+            rollup,
+            metric,
+            [new_values[metric]] if metric in new_values else (),
+            [old_values[metric]] if metric in old_values else (),
+        )
+        if stale:
+            cur.execute(
+                f"""
+                SELECT MIN(tm.{metric}), MAX(tm.{metric})
+                FROM trial_metrics tm JOIN trial t ON tm.trial_id = t.trial_id
+                WHERE tm.{metric} IS NOT NULL AND {trial_filter}
+                """,
+                (key,),
+            )
+            rollup["min_value"], rollup["max_value"] = cur.fetchone()
+
+        updates.append(
+            (
+                rollup["n"],
+                rollup["total"],
+                rollup["total_sq"],
+                rollup["min_value"],
+                rollup["max_value"],
+                json.dumps(rollup["histogram"]),
+                key,
+                metric,
+            )
+        )
+
+    cur.executemany(
+        f"""
+        UPDATE {table}
+        SET n = %s, total = %s, total_sq = %s, min_value = %s, max_value = %s, histogram = %s
+        WHERE {key_column} = %s AND metric = %s
+        """,
+        updates,
+    )
+
+
+def lock_trial_values(cur, trial_id):
+    """Current rolled up values of a trial, locked until the caller's transaction ends"""
+    cur.execute(SELECT_TRIAL_VALUES, (trial_id,))
+    return _trial_values(cur.fetchone())
+
+
+def update_rollups(cur, trial_id, old_values, new_values):
+    """
+    Replace a trial's old values with its new ones in its study and task rollups
+
+    Runs in the caller's transaction, after the trial_metrics row itself was written or
+    deleted, so re-read extremes already see the change.
+    """
+    if old_values == new_values:
+        return
+
+    cur.execute(SELECT_TRIAL_OWNERS, (trial_id,))
+    owners = cur.fetchone()
+    if owners is None:
+        return
+
+    study_id, task_id = owners
+    _update_scope(cur, "study", study_id, old_values, new_values)
+    _update_scope(cur, "task", task_id, old_values, new_values)
+
+
+def remove_trial_metrics(cur, trial_ids):
+    """Delete trials' trial_metrics rows and take their values out of the rollups"""
+    for trial_id in trial_ids:
+        old_values = lock_trial_values(cur, trial_id)
+        cur.execute("DELETE FROM trial_metrics WHERE trial_id = %s", (trial_id,))
+        update_rollups(cur, trial_id, old_values, {})
+
+
+def rebuild_rollups(cur, study_id):
+    """
+    Recompute a study's rollups from its trial_metrics rows
+
+    For backfilling studies uploaded before the rollups existed, or after ROLLUP_METRICS
+    changes. Runs in the caller's transaction.
+    """
+    cur.execute(
+        f"""
+        SELECT t.task_id, {", ".join(f"tm.{metric}" for metric in ROLLUP_METRICS)}
+        FROM trial_metrics tm
+        JOIN trial t ON tm.trial_id = t.trial_id
+        JOIN participant_session ps ON t.participant_session_id = ps.participant_session_id
+        WHERE ps.study_id = %s
+        """,
+        (study_id,),
+    )
+    rows = cur.fetchall()
+
+    cur.execute(
+        "DELETE FROM task_metric_rollup WHERE task_id IN (SELECT task_id FROM task WHERE study_id = %s)",
+        (study_id,),
+    )
+    cur.execute("DELETE FROM study_metric_rollup WHERE study_id = %s", (study_id,))
+
+    scopes = {}
+    for task_id, *values in rows:
+        for scope, key in (("study", study_id), ("task", task_id)):
+            rollups = scopes.setdefault((scope, key), {})
+            for metric, value in _trial_values(values).items():
+                rollup = rollups.setdefault(metric, empty_rollup(metric))
+                merge_values(rollup, metric, [value])
+
+    for (scope, key), rollups in scopes.items():
+        table, key_column, _ = SCOPES[scope]
+        cur.executemany(
+            f"""
+            INSERT INTO {table} ({key_column}, metric, n, total, total_sq, min_value, max_value, histogram)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            [
+                (
+                    key,
+                    metric,
+                    rollup["n"],
+                    rollup["total"],
+                    rollup["total_sq"],
+                    rollup["min_value"],
+                    rollup["max_value"],
+                    json.dumps(rollup["histogram"]),
+                )
+                for metric, rollup in rollups.items()
+            ],
+        )
+
+
+def _read_rollups(cur, query, params):
+    rollups = {}
+    cur.execute(query, params)
+    for (
+        key,
+        metric,
+        n,
+        total,
+        total_sq,
+        min_value,
+        max_value,
+        histogram,
+    ) in cur.fetchall():
+        if metric not in ROLLUP_METRICS or not n:
+            continue
+        rollups.setdefault(key, {})[metric] = rollup_stats(
+            {
+                "n": n,
+                "total": total,
+                "total_sq": total_sq,
+                "min_value": min_value,
+                "max_value": max_value,
+                "histogram": json.loads(histogram),
+            },
+            metric,
+        )
+    return rollups
+
+
+def get_study_rollup(cur, study_id):
+    """
+    A study's rolled up trial metrics
+
+    Returns:
+        {metric: rollup_stats(...)}, empty if no trial of the study has metrics yet
+    """
+    return _read_rollups(
+        cur,
+        """
+        SELECT study_id, metric, n, total, total_sq, min_value, max_value, histogram
+        FROM study_metric_rollup WHERE study_id = %s
+        """,
+        (study_id,),
+    ).get(study_id, {})
+
+
+def get_task_rollups(cur, study_id):
+    """
+    Rolled up trial metrics of every task of a study, in one query
+
+    Returns:
+        {task_id: {metric: rollup_stats(...)}}
+    """
+    return _read_rollups(
+        cur,
+        """
+        SELECT r.task_id, r.metric, r.n, r.total, r.total_sq, r.min_value, r.max_value, r.histogram
+        FROM task_metric_rollup r
+        JOIN task t ON r.task_id = t.task_id
+        WHERE t.study_id = %s
+        """,
+        (study_id,),
+    )
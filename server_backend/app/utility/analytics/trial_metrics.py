@@ -0,0 +1,171 @@
+"""Per-trial metrics computed once, right after a session is uploaded
+
+Analytics endpoints used to open and parse every measurement file of a study on each
+request. Instead, every newly ingested trial gets a background job
+(``precompute_trial_metrics``, enqueued with ``task_queue.enqueue_task``) that reads the
+trial's files once, runs the same mouse, click and keyboard metric functions the
+endpoints use, and saves the results as one row of the ``trial_metrics`` table. The
+endpoints then aggregate those rows in SQL.
+"""
+
+import json
+import logging
+import math
+from datetime import datetime
+from app.utility.analytics.data_processor import (
+    get_video_duration,
+    process_keyboard_data,
+    process_mouse_clicks_data,
+    process_mouse_movement_data,
+)
+from app.utility.analytics.metric_rollups import (
+    ROLLUP_METRICS,
+    lock_trial_values,
+    update_rollups,
+)
+from app.utility.db_pool import get_pool
+from app.utility.trial_streams import (
+    MEASUREMENT_FILE_EXTENSIONS,
+    read_measurement_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+# measurement_option_name -> (metrics key, function computing its metrics from the frame)
+METRIC_FUNCTIONS = {
+    "Mouse Movement": ("mouse_movement", process_mouse_movement_data),
+    "Mouse Clicks": ("mouse_clicks", process_mouse_clicks_data),
+    "Keyboard Inputs": ("keyboard", process_keyboard_data),
+}
+
+# trial_metrics column -> (metrics key, metric name), the values endpoints aggregate on.
+# Everything else is kept in metrics_json
+METRIC_COLUMNS = {
+    "mouse_distance": ("mouse_movement", "total_distance"),
+    "mouse_avg_speed": ("mouse_movement", "avg_speed"),
+    "mouse_path_efficiency": ("mouse_movement", "path_efficiency"),
+    "click_count": ("mouse_clicks", "total_clicks"),
+    "keypresses": ("keyboard", "total_keypresses"),
+    "corrections": ("keyboard", "correction_count"),
+    "typing_speed": ("keyboard", "typing_speed"),
+}
+
+SELECT_TRIAL_FILES = """
+SELECT mo.measurement_option_name, sdi.results_path
+FROM session_data_instance sdi
+JOIN measurement_option mo ON sdi.measurement_option_id = mo.measurement_option_id
+WHERE sdi.trial_id = %s AND sdi.results_path IS NOT NULL
+"""
+
+UPSERT_TRIAL_METRICS = f"""
+INSERT INTO trial_metrics (trial_id, duration_s, video_length_s, {", ".join(METRIC_COLUMNS)}, metrics_json, computed_at)
+VALUES (%s, %s, %s, {", ".join(["%s"] * len(METRIC_COLUMNS))}, %s, %s)
+ON DUPLICATE KEY UPDATE
+    duration_s = VALUES(duration_s),
+    video_length_s = VALUES(video_length_s),
+    {", ".join(f"{column} = VALUES({column})" for column in METRIC_COLUMNS)},
+    metrics_json = VALUES(metrics_json),
+    computed_at = VALUES(computed_at)
+"""
+
+
+def _plain(value):
+    """numpy scalars -> python numbers (NaN -> None) so the metrics can be stored as JSON"""
+    value = value.item() if hasattr(value, "item") else value
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def compute_trial_metrics(files):
+    """
+    Compute every metric of one trial from its stored files
+
+    Args:
+        files: (measurement_option_name, results_path) pairs for the trial
+
+    Returns:
+        Dictionary with duration_s, video_length_s and a metrics dict per input type
+    """
+    metrics = {"duration_s": None, "video_length_s": None}
+
+    for option_name, path in files:
+        try:
+            if path.endswith(".mp4"):
+                metrics["video_length_s"] = get_video_duration(path)
+                continue
+            if not path.endswith(MEASUREMENT_FILE_EXTENSIONS):
+                continue
+
+            df = read_measurement_frame(path)
+            if "running_time" in df.columns and not df.empty:
+                last = float(df["running_time"].max())
+                metrics["duration_s"] = max(metrics["duration_s"] or 0, last)
+
+            if option_name in METRIC_FUNCTIONS:
+                key, process = METRIC_FUNCTIONS[option_name]
+                metrics[key] = {
+                    name: _plain(value) for name, value in process(df).items()
+                }
+        except Exception as e:
+            logger.error(f"Error computing metrics from {path}: {e}")
+
+    return metrics
+
+
+def store_trial_metrics(conn, trial_id):
+    """
+    Compute one trial's metrics from its session_data_instance files and upsert its row
+
+    Returns:
+        The computed metrics
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(SELECT_TRIAL_FILES, (trial_id,))
+        metrics = compute_trial_metrics(cur.fetchall())
+
+        # A recomputed trial swaps its previous values out of the rollups
+        old_values = lock_trial_values(cur, trial_id)
+
+        columns = {
+            column: metrics.get(key, {}).get(name)
+            for column, (key, name) in METRIC_COLUMNS.items()
+        }
+        columns["duration_s"] = metrics["duration_s"]
+        cur.execute(
+            UPSERT_TRIAL_METRICS,
+            (
+                trial_id,
+                metrics["duration_s"],
+                metrics["video_length_s"],
+                *(columns[column] for column in METRIC_COLUMNS),
+                json.dumps(metrics),
+                datetime.now(),
+            ),
+        )
+        update_rollups(
+            cur,
+            trial_id,
+            old_values,
+            {
+                metric: float(columns[metric])
+                for metric in ROLLUP_METRICS
+                if columns[metric] is not None
+            },
+        )
+        conn.commit()
+        return metrics
+    finally:
+        cur.close()
+
+
+def precompute_trial_metrics(trial_id, **kwargs):
+    """
+    Task queue job run for every newly ingested trial, see enqueue_task
+
+    Checks out its own pooled connection, like the other queued jobs, since it runs in
+    the worker process outside any request.
+    """
+    with get_pool().connection() as conn:
+        metrics = store_trial_metrics(conn, trial_id)
+        logger.info(f"Stored precomputed metrics for trial {trial_id}")
+        return {"trial_id": trial_id, "duration_s": metrics["duration_s"]}
@@ -0,0 +1,94 @@
+"""Content-addressed storage for uploaded result files
+
+Every stored file lives at ``<root>/blobs/<h0h1>/<h2h3>/<sha256><ext>``. The path comes
+from the content's sha256, so:
+
+- Identical files (blank heatmaps, placeholder CSVs, re-uploads of a session, consent and
+  survey forms of duplicated studies, identical survey answers) are stored once, however
+  many session_data_instance, consent_form, survey_form or survey_results rows point at
+  them.
+- A file is never rewritten in place. Writers stream into a private temporary file and
+  rename it into place, and two writers of the same content produce the same bytes, so
+  concurrent uploads never see or leave a partial file.
+- The size and sha256 recorded at ingest are enough to check a file later without
+  reading it back (size) or to fully verify it (hash).
+
+Blobs are only ever added. A blob that no row references (e.g. after an upload rolled
+back) is left for a retry of the same upload to reuse.
+"""
+
+import hashlib
+import os
+import tempfile
+
+BLOB_DIR = "blobs"
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def blob_path(root, sha256, extension=""):
+    """Where the blob with this hash is stored under root"""
+    return os.path.join(root, BLOB_DIR, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+
+def verify_blob(path, size, sha256=None):
+    """
+    Check a stored blob against its recorded size, and its hash when one is given
+
+    The size check is a single stat. Pass sha256 to also read the file and hash it.
+    """
+    try:
+        if os.stat(path).st_size != size:
+            return False
+    except OSError:
+        return False
+
+    if sha256 is None:
+        return True
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(data)
+    return digest.hexdigest() == sha256
+
+
+def store_blob(src, root, extension=""):
+    """
+    Stream a file object into the store
+
+    Args:
+        src: Readable binary file object, read to the end
+        root: Store root (RESULTS_BASE_DIR_PATH)
+        extension: Kept on the blob name so the file type stays visible on disk
+
+    Returns:
+        (path, size, sha256, created), created is False when an identical blob was
+        already stored
+    """
+    tmp_dir = os.path.join(root, BLOB_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for data in iter(lambda: src.read(COPY_BUFFER_SIZE), b""):
+                size += len(data)
+                digest.update(data)
+                out.write(data)
+
+        sha256 = digest.hexdigest()
+        path = blob_path(root, sha256, extension)
+
+        # An intact copy is already stored, a damaged one is replaced by this upload
+        if verify_blob(path, size):
+            return path, size, sha256, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path, size, sha256, True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
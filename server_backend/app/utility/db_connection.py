@@ -1,7 +1,35 @@
-from flask_mysqldb import MySQL
+import os
+from flask import g
+from app.utility.db_pool import DEFAULT_STATEMENT_TIMEOUT_MS, configure_pool, get_pool
 
-mysql = MySQL()
+
+def init_db(app):
+    # Pool sized from MYSQL_POOL_SIZE, connections returned when each request ends
+    app.config.setdefault("MYSQL_POOL_SIZE", int(os.getenv("MYSQL_POOL_SIZE", 10)))
+    app.config.setdefault(
+        "MYSQL_STATEMENT_TIMEOUT_MS",
+        int(os.getenv("MYSQL_STATEMENT_TIMEOUT_MS", DEFAULT_STATEMENT_TIMEOUT_MS)),
+    )
+    configure_pool(
+        host=app.config["MYSQL_HOST"],
+        user=app.config["MYSQL_USER"],
+        password=app.config["MYSQL_PASSWORD"],
+        database=app.config["MYSQL_DB"],
+        max_size=app.config["MYSQL_POOL_SIZE"],
+        statement_timeout_ms=app.config["MYSQL_STATEMENT_TIMEOUT_MS"],
+    )
+    app.teardown_appcontext(release_db_connection)
 
 
 def get_db_connection():
-    return mysql.connection
+    # One pooled connection per request, checked out on first use
+    conn = g.get("db_conn")
+    if conn is None or conn.closed:
+        conn = g.db_conn = get_pool().checkout()
+    return conn
+
+
+def release_db_connection(exception=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        conn.close()
@@ -0,0 +1,340 @@
+"""Bounded MySQL connection pool shared by the Flask app and the task queue jobs
+
+Opening a MySQL connection (TCP handshake, auth, session setup) costs more than most
+analytics queries, so connections are kept open and reused:
+
+- At most ``max_size`` connections are open per process. A checkout waits up to
+  ``wait_timeout`` seconds for one to be returned, then raises PoolTimeout.
+- A connection idle for longer than ``ping_after`` seconds is pinged before it is handed
+  out, and replaced when the server has dropped it.
+- Every connection runs with the session's ``MAX_EXECUTION_TIME`` set, so one runaway
+  SELECT cannot hold a connection for the rest of the pool indefinitely.
+- A returned connection is rolled back, so the next user never sees an open transaction.
+
+Routes check out one connection per request through ``db_connection.get_db_connection``,
+jobs use ``with get_pool().connection() as conn``. ``ConnectionPool.stats`` reports the
+checkouts, waits and open connections.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_WAIT_TIMEOUT = 10.0
+DEFAULT_PING_AFTER = 30.0
+DEFAULT_STATEMENT_TIMEOUT_MS = 60000
+
+
+class PoolTimeout(Exception):
+    """No connection was returned to the pool within its wait timeout"""
+
+
+def _mysql_connect(**connect_args):
+    import MySQLdb
+
+    return MySQLdb.connect(**connect_args)
+
+
+class PooledConnection:
+    """
+    A checked out connection, used like a MySQLdb connection
+
+    close() hands it back to the pool instead of closing it and may be called more than
+    once. discard() closes it for good, for a connection left in an unknown state.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def discard(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw, discard=True)
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise RuntimeError("Connection was already returned to the pool")
+        return getattr(raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Args:
+        connect_args: Keyword arguments for MySQLdb.connect
+        max_size: Most connections open at once
+        wait_timeout: Seconds a checkout waits for a free connection
+        ping_after: Idle seconds after which a connection is pinged before reuse
+        statement_timeout_ms: MAX_EXECUTION_TIME of every connection, None to leave the
+            server default
+        connect: Function opening a connection, MySQLdb.connect by default
+    """
+
+    def __init__(
+        self,
+        connect_args,
+        max_size=DEFAULT_POOL_SIZE,
+        wait_timeout=DEFAULT_WAIT_TIMEOUT,
+        ping_after=DEFAULT_PING_AFTER,
+        statement_timeout_ms=DEFAULT_STATEMENT_TIMEOUT_MS,
+        connect=_mysql_connect,
+    ):
+        self.connect_args = connect_args
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self.statement_timeout_ms = statement_timeout_ms
+        self._connect = connect
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned at), most recently returned last
+        self._open = 0
+        self._closed = False
+        self._pid = os.getpid()
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "connects": 0,
+            "connect_errors": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+
+    def _reset_after_fork(self):
+        # Connections inherited from the parent process (e.g. a forked RQ work horse)
+        # belong to the parent's sockets and must not be used here
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._open = 0
+
+    def _new_connection(self):
+        raw = self._connect(**self.connect_args)
+        if self.statement_timeout_ms:
+            try:
+                cursor = raw.cursor()
+                cursor.execute(
+                    "SET SESSION MAX_EXECUTION_TIME = %s",
+                    (int(self.statement_timeout_ms),),
+                )
+                cursor.close()
+            except Exception as e:
+                logger.warning(f"Could not set the statement timeout: {e}")
+        return raw
+
+    def _healthy(self, raw, returned_at):
+        if time.monotonic() - returned_at < self.ping_after:
+            return True
+        try:
+            raw.ping()
+            return True
+        except Exception:
+            return False
+
+    def checkout(self):
+        """Take a connection, opening one while fewer than max_size are open"""
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._reset_after_fork()
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+
+            started_waiting = None
+            while not self._idle and self._open >= self.max_size:
+                now = time.monotonic()
+                if started_waiting is None:
+                    started_waiting = now
+                    self._counters["waits"] += 1
+                if now >= deadline:
+                    self._counters["timeouts"] += 1
+                    self._counters["wait_seconds"] += now - started_waiting
+                    raise PoolTimeout(
+                        f"No database connection free after {self.wait_timeout}s "
+                        f"({self.max_size} in use)"
+                    )
+                self._cond.wait(deadline - now)
+            if started_waiting is not None:
+                self._counters["wait_seconds"] += time.monotonic() - started_waiting
+
+            if self._idle:
+                raw, returned_at = self._idle.pop()
+            else:
+                raw, returned_at = None, None
+            # The slot is held from here on, whether the connection is reused or opened
+            if raw is None:
+                self._open += 1
+            self._counters["checkouts"] += 1
+
+        if raw is not None and not self._healthy(raw, returned_at):
+            with self._cond:
+                self._counters["health_check_failures"] += 1
+            self._close_quietly(raw)
+            raw = None
+
+        if raw is None:
+            try:
+                raw = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._counters["connect_errors"] += 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._counters["connects"] += 1
+
+        return PooledConnection(self, raw)
+
+    def release(self, raw, discard=False):
+        """Return a connection, rolled back, or close it when discard is set or the rollback fails"""
+        if not discard:
+            try:
+                raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if discard or self._closed:
+                self._open -= 1
+                if discard:
+                    self._counters["discarded"] += 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            self._cond.notify()
+
+        if raw is not None:
+            self._close_quietly(raw)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with block"""
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Checkout and wait counters plus the current open, idle and in use connections"""
+        with self._cond:
+            self._reset_after_fork()
+            return {
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                **self._counters,
+            }
+
+    def close(self):
+        """Close the idle connections, connections still in use are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for raw, _ in idle:
+            self._close_quietly(raw)
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_settings_from_env():
+    """Pool settings from the MYSQL_* environment variables, used by the task queue jobs"""
+    return {
+        "host": os.environ.get("MYSQL_HOST"),
+        "user": os.environ.get("MYSQL_USER"),
+        "password": os.environ.get("MYSQL_PASSWORD"),
+        "database": (os.environ.get("MYSQL_DB") or "").strip(),
+        "max_size": int(os.environ.get("MYSQL_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        "statement_timeout_ms": int(
+            os.environ.get("MYSQL_STATEMENT_TIMEOUT_MS", DEFAULT_STATEMENT_TIMEOUT_MS)
+        ),
+    }
+
+
+def configure_pool(
+    host,
+    user,
+    password,
+    database,
+    max_size=DEFAULT_POOL_SIZE,
+    statement_timeout_ms=DEFAULT_STATEMENT_TIMEOUT_MS,
+    charset="utf8",
+):
+    """
+    Set up the process wide pool
+
+    Calling it again with the same settings keeps the current pool, different settings
+    (e.g. a testing app on test_db) replace it.
+
+    Returns:
+        The ConnectionPool
+    """
+    global _pool
+    connect_args = {
+        "host": host,
+        "user": user,
+        "passwd": password,
+        "db": database,
+        "charset": charset,
+    }
+    with _pool_lock:
+        if (
+            _pool is not None
+            and _pool.connect_args == connect_args
+            and _pool.max_size == max_size
+            and _pool.statement_timeout_ms == statement_timeout_ms
+        ):
+            return _pool
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(
+            connect_args, max_size=max_size, statement_timeout_ms=statement_timeout_ms
+        )
+        logger.info(
+            f"Database connection pool for {user}@{host}/{database}, up to {max_size} connections"
+        )
+        return _pool
+
+
+def get_pool():
+    """The process wide pool, set up from the environment when the app has not configured it"""
+    if _pool is None:
+        configure_pool(**pool_settings_from_env())
+    return _pool
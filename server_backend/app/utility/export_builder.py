@@ -0,0 +1,248 @@
+"""Prebuilt study exports
+
+A study's zip export only changes when sessions are uploaded, so instead of compressing
+every file again on each download it is built once by a task queue job
+(``build_study_export``) and kept on disk as a versioned artifact:
+
+    <RESULTS_BASE_DIR_PATH>/exports/<study_id>/<watermark>.zip
+
+The watermark (``get_export_watermark``) summarizes the study's result file rows and its
+survey files (rows, mtime and size, since a re-submitted survey is rewritten in place), so
+any upload, removal or survey change gives the study a new watermark and the stored
+artifact stops matching. Until then the export route serves the artifact straight from disk.
+
+The job compresses the text files in a process pool at a level chosen per file type
+(``zip_stream.compression_level_for``) and copies media into the archive uncompressed.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from app.utility.db_pool import get_pool
+from app.utility.sessions import (
+    export_file_name,
+    get_all_study_csv_files,
+    plan_zip_entries,
+    unreadable_file_placeholder,
+)
+from app.utility.trial_streams import is_trial_stream, trial_stream_to_csv
+from app.utility.zip_stream import (
+    CHUNK_SIZE,
+    compression_level_for,
+    deflate,
+    write_deflated,
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = "exports"
+
+# A build marker older than the task queue's job timeout belongs to a job that died
+BUILD_TIMEOUT = 1200
+
+EXPORT_PROCESSES = int(os.getenv("EXPORT_PROCESSES", os.cpu_count() or 1))
+
+SELECT_EXPORT_WATERMARK = """
+SELECT CONCAT(COUNT(*), '.', COALESCE(MAX(sdi.session_data_instance_id), 0))
+FROM session_data_instance sdi
+INNER JOIN trial tr ON tr.trial_id = sdi.trial_id
+INNER JOIN participant_session ps ON ps.participant_session_id = tr.participant_session_id
+WHERE ps.study_id = %s
+"""
+
+SELECT_EXPORT_SURVEYS = """
+SELECT sr.survey_results_id, sr.file_path
+FROM survey_results sr
+INNER JOIN participant_session ps ON ps.participant_session_id = sr.participant_session_id
+WHERE ps.study_id = %s
+ORDER BY sr.survey_results_id
+"""
+
+
+def _survey_version(rows):
+    # A re-submitted survey points its row at a new blob, but surveys saved before the blob store rewrote their file in
+    # place, so the files' mtime and size are part of the version too
+    digest = hashlib.sha256()
+    for survey_results_id, file_path in rows:
+        try:
+            stat = os.stat(file_path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        digest.update(f"{survey_results_id}:{file_path}:{version}\n".encode())
+    return f"{len(rows)}.{digest.hexdigest()[:16]}"
+
+
+def get_export_watermark(cur, study_id):
+    """Version of the study's export, changes whenever a result file or survey is added, removed or re-submitted"""
+    cur.execute(SELECT_EXPORT_WATERMARK, (study_id,))
+    files = cur.fetchone()[0]
+    cur.execute(SELECT_EXPORT_SURVEYS, (study_id,))
+    return f"{files}-{_survey_version(cur.fetchall())}"
+
+
+def export_dir(root, study_id):
+    return os.path.join(root, EXPORT_DIR, str(study_id))
+
+
+def export_artifact_path(root, study_id, watermark):
+    return os.path.join(export_dir(root, study_id), f"{watermark}.zip")
+
+
+def claim_export_build(root, study_id):
+    """
+    Mark a build of the study's export as started
+
+    Returns:
+        False when another build is already running, so only one is enqueued at a time
+    """
+    os.makedirs(export_dir(root, study_id), exist_ok=True)
+    marker = os.path.join(export_dir(root, study_id), "building")
+    try:
+        if time.time() - os.path.getmtime(marker) > BUILD_TIMEOUT:
+            os.remove(marker)
+    except OSError:
+        pass
+
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def release_export_build(root, study_id):
+    try:
+        os.remove(os.path.join(export_dir(root, study_id), "building"))
+    except OSError:
+        pass
+
+
+def _compress_file(results_path, level, export_csv):
+    # Runs in a worker process, returns None when the file cannot be read
+    try:
+        if export_csv and is_trial_stream(results_path):
+            data = trial_stream_to_csv(results_path)
+        else:
+            with open(results_path, "rb") as f:
+                data = f.read()
+    except (IOError, PermissionError, ValueError) as e:
+        logger.warning(f"Cannot access file: {results_path} - Error: {str(e)}")
+        return None
+
+    compressed, crc = deflate(data, level)
+    return compressed, crc, len(data)
+
+
+def _write_stored(zipf, name, path):
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.file_size = os.path.getsize(path)
+    with open(path, "rb") as src, zipf.open(zinfo, "w") as dest:
+        for data in iter(lambda: src.read(CHUNK_SIZE), b""):
+            dest.write(data)
+
+
+def write_export_zip(files, surveys, path, export_csv=True, processes=EXPORT_PROCESSES):
+    """
+    Write an export archive to path
+
+    Text files are read and deflated in a process pool, a bounded number ahead of the
+    writer, and added in their planned order. Media is copied in by this process.
+
+    Args:
+        files, surveys: Entries planned by sessions.plan_zip_entries
+    """
+    with zipfile.ZipFile(path, "w") as zipf, ProcessPoolExecutor(processes) as pool:
+        pending = []
+
+        def write_next():
+            name, results_path, future = pending.pop(0)
+            if future is None:
+                try:
+                    _write_stored(zipf, name, results_path)
+                    return
+                except OSError as e:
+                    logger.warning(f"Cannot access file: {results_path} - {str(e)}")
+                    result = None
+            else:
+                result = future.result()
+
+            if result is None:
+                placeholder = unreadable_file_placeholder(results_path, export_csv)
+                if placeholder is not None:
+                    zipf.writestr(name, placeholder, zipfile.ZIP_DEFLATED)
+            else:
+                write_deflated(zipf, name, *result)
+
+        for zip_file_path, results_path in files:
+            name = export_file_name(zip_file_path, results_path, export_csv)
+            level = compression_level_for(name)
+            future = None
+            if level is not None:
+                future = pool.submit(_compress_file, results_path, level, export_csv)
+            pending.append((name, results_path, future))
+
+            # Keep a few files per process in flight, not the whole study in memory
+            while len(pending) > processes * 4:
+                write_next()
+
+        while pending:
+            write_next()
+
+        for name, file_path in surveys:
+            if os.path.exists(file_path):
+                zipf.write(file_path, name, zipfile.ZIP_DEFLATED)
+
+
+def build_study_export(study_id, root, **kwargs):
+    """
+    Task queue job building the study's export artifact, see enqueue_task
+
+    The watermark is read before the files are listed, so an upload landing during the
+    build leaves an artifact that is at least as new as its name says and the next
+    download builds again.
+
+    Returns:
+        Dict with the artifact path and watermark
+    """
+    try:
+        with get_pool().connection() as conn:
+            cur = conn.cursor()
+            watermark = get_export_watermark(cur, study_id)
+            path = export_artifact_path(root, study_id, watermark)
+            if os.path.exists(path):
+                return {"study_id": study_id, "watermark": watermark, "path": path}
+
+            results_with_size = get_all_study_csv_files(study_id, cur)
+            files, surveys = plan_zip_entries(
+                results_with_size, study_id, conn, mode="study"
+            )
+
+        start_time = time.time()
+        os.makedirs(export_dir(root, study_id), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=export_dir(root, study_id), suffix=".part")
+        os.close(fd)
+        try:
+            write_export_zip(files, surveys, temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        # Earlier versions are superseded
+        for name in os.listdir(export_dir(root, study_id)):
+            if name.endswith(".zip") and name != os.path.basename(path):
+                os.remove(os.path.join(export_dir(root, study_id), name))
+
+        logger.info(
+            f"Built export of study {study_id} ({len(files)} files) at watermark "
+            f"{watermark} in {time.time() - start_time:.1f}s"
+        )
+        return {"study_id": study_id, "watermark": watermark, "path": path}
+    finally:
+        release_export_build(root, study_id)
@@ -0,0 +1,235 @@
+"""Batched, transactional ingestion of an uploaded session's trial files.
+
+A session upload used to cost several round trips and two commits per file, and a
+failure halfway through left partial rows behind. Ingestion now works in two steps:
+
+1. ``plan_session_ingest`` matches every trial in the session JSON to its folder in the
+   session zip and lists the members to keep, before the database is touched.
+2. ``ingest_session`` writes all trial rows with one ``executemany`` and all
+   session_data_instance rows with another. It then streams each member straight from
+   the zip into the content-addressed store (see blob_store, the zip's CRC is checked by
+   zipfile), records every path, size and sha256 with a third ``executemany`` and
+   commits once. Any failure rolls the transaction back.
+
+The zip is never extracted to a temp dir, so large screen recordings are written to
+disk once, and files already in the store are not written again.
+
+The measurement option ids are looked up once and cached, since the option names are
+fixed.
+"""
+
+import fnmatch
+import posixpath
+from app.utility.blob_store import store_blob
+from app.utility.trial_streams import TRIAL_STREAM_EXTENSION
+
+# Accepted file types. Change this if we ever support more
+INGEST_EXTENSIONS = (".csv", TRIAL_STREAM_EXTENSION, ".mp4", ".png")
+
+# measurement_option_name -> measurement_option_id, filled on first use
+_measurement_option_ids = {}
+
+INSERT_TRIALS = """
+INSERT INTO trial (participant_session_id, task_id, factor_id, started_at)
+VALUES (%s, %s, %s, %s)
+"""
+
+INSERT_DATA_INSTANCES = """
+INSERT INTO session_data_instance (trial_id, measurement_option_id)
+VALUES (%s, %s)
+"""
+
+# Written as an upsert on the new ids so the driver sends every path in one batched statement
+UPDATE_RESULTS_PATHS = """
+INSERT INTO session_data_instance (session_data_instance_id, trial_id, measurement_option_id, results_path, size_bytes, sha256)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    results_path = VALUES(results_path),
+    size_bytes = VALUES(size_bytes),
+    sha256 = VALUES(sha256)
+"""
+
+
+class IngestError(ValueError):
+    """The upload does not match its session JSON, nothing was written"""
+
+
+def plan_session_ingest(zip_ref, trials):
+    """
+    Match each trial in the session JSON to its folder and files in the session zip
+
+    Trial folders are named ``<task>_<factor>_trial_<n>`` where n is the trial's
+    1-based position in the session JSON.
+
+    Args:
+        zip_ref: Open zipfile.ZipFile of the session results
+        trials: The session JSON's trials, in order
+
+    Returns:
+        List of (trial, [(ZipInfo, measurement option name, extension), ...])
+
+    Raises:
+        IngestError: If trial info is incomplete or a trial folder is missing
+    """
+    # Top level folder -> file members directly inside it
+    folders = {}
+    for info in zip_ref.infolist():
+        parts = info.filename.rstrip("/").split("/")
+        folders.setdefault(parts[0], [])
+        if len(parts) == 2 and not info.is_dir():
+            folders[parts[0]].append(info)
+
+    plan = []
+    for trial_num, trial in enumerate(trials, start=1):
+        if not (
+            trial.get("taskID") and trial.get("factorID") and trial.get("startedAt")
+        ):
+            raise IngestError("Improper trial info from inputted JSON")
+
+        # Make sure there is an exact match for trial folder naming
+        trial_folders = sorted(fnmatch.filter(folders, f"*trial_{trial_num}"))
+        if not trial_folders:
+            raise IngestError(f"No trial folder found for trial {trial_num}")
+
+        files = []
+        for info in sorted(folders[trial_folders[0]], key=lambda info: info.filename):
+            option_name, extension = posixpath.splitext(
+                posixpath.basename(info.filename)
+            )
+            if extension in INGEST_EXTENSIONS:
+                files.append((info, option_name, extension))
+        plan.append((trial, files))
+
+    return plan
+
+
+def get_measurement_option_ids(cur, names):
+    """
+    Measurement option ids by name, from the cache or one query for all options
+
+    Raises:
+        IngestError: If a name is not a known measurement option
+    """
+    if not set(names).issubset(_measurement_option_ids):
+        cur.execute(
+            "SELECT measurement_option_id, measurement_option_name FROM measurement_option"
+        )
+        _measurement_option_ids.clear()
+        _measurement_option_ids.update({name: id for id, name in cur.fetchall()})
+
+    missing = set(names) - set(_measurement_option_ids)
+    if missing:
+        raise IngestError(f"No measurement option found for {sorted(missing)}")
+    return {name: _measurement_option_ids[name] for name in names}
+
+
+def _insert_batch(cur, query, rows, table, id_column, owner_filter, owner_params):
+    """
+    executemany an INSERT and return the new rows' ids
+
+    A multi-row INSERT gets consecutive auto increment ids starting at lastrowid. The
+    range is checked (every id in it must belong to this batch's owner) rather than
+    assumed, so a server setting that breaks this can never attach files to the wrong
+    rows.
+    """
+    if not rows:
+        return []
+
+    cur.executemany(query, rows)
+    first_id = cur.lastrowid
+    ids = list(range(first_id, first_id + len(rows)))
+
+    cur.execute(
+        f"SELECT COUNT(*) FROM {table} WHERE {id_column} BETWEEN %s AND %s AND {owner_filter}",
+        (ids[0], ids[-1], *owner_params),
+    )
+    if cur.fetchone()[0] != len(rows):
+        raise RuntimeError(f"Could not resolve the ids of the new {table} rows")
+    return ids
+
+
+def ingest_session(conn, zip_ref, plan, results_base_dir, participant_session_id):
+    """
+    Write every trial and data instance of a planned session in one transaction
+
+    Args:
+        conn: Database connection, committed on success and rolled back on failure
+        zip_ref: The session zip the plan was made from
+        plan: Output of plan_session_ingest
+        results_base_dir: Root of the blob store the result files are stored in
+        participant_session_id: Owner of the session
+
+    Returns:
+        List of stored files: {trial_id, session_data_instance_id, results_path, size,
+        sha256}
+    """
+    cur = conn.cursor()
+    try:
+        option_ids = get_measurement_option_ids(
+            cur, {name for _, files in plan for _, name, _ in files}
+        )
+
+        trial_ids = _insert_batch(
+            cur,
+            INSERT_TRIALS,
+            [
+                (
+                    participant_session_id,
+                    trial["taskID"],
+                    trial["factorID"],
+                    trial["startedAt"],
+                )
+                for trial, _ in plan
+            ],
+            "trial",
+            "trial_id",
+            "participant_session_id = %s",
+            (participant_session_id,),
+        )
+
+        # Every file of the session, flattened so its data instance row is inserted in the same batch
+        instances = [
+            (trial_id, option_ids[name], info, extension)
+            for trial_id, (_, files) in zip(trial_ids, plan)
+            for info, name, extension in files
+        ]
+        instance_ids = _insert_batch(
+            cur,
+            INSERT_DATA_INSTANCES,
+            [(trial_id, option_id) for trial_id, option_id, _, _ in instances],
+            "session_data_instance",
+            "session_data_instance_id",
+            "trial_id BETWEEN %s AND %s",
+            (trial_ids[0], trial_ids[-1]) if trial_ids else (0, 0),
+        )
+
+        # Files are stored before the commit, so a failed copy leaves no rows behind
+        stored = []
+        path_rows = []
+        for instance_id, (trial_id, option_id, info, extension) in zip(
+            instance_ids, instances
+        ):
+            with zip_ref.open(info) as src:
+                path, size, sha256, _ = store_blob(src, results_base_dir, extension)
+            path_rows.append((instance_id, trial_id, option_id, path, size, sha256))
+            stored.append(
+                {
+                    "trial_id": trial_id,
+                    "session_data_instance_id": instance_id,
+                    "results_path": path,
+                    "size": size,
+                    "sha256": sha256,
+                }
+            )
+
+        if path_rows:
+            cur.executemany(UPDATE_RESULTS_PATHS, path_rows)
+
+        conn.commit()
+        return stored
+    except Exception:
+        # Blobs already stored stay in place for a retry of the upload to reuse
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
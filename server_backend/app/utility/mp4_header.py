@@ -0,0 +1,73 @@
+"""Video duration from the MP4 container header
+
+An MP4 file is a sequence of boxes (32-bit size, 4-character type, payload, with a
+64-bit size when the 32-bit one is 1). The movie box ``moov`` holds the movie header
+``mvhd``, whose timescale and duration give the length of the recording. Only box
+headers are read on the way there, every other box is skipped with a seek, so the
+duration of a screen recording can be read from an open zip member without extracting
+it or starting ffprobe.
+"""
+
+import struct
+
+BOX_HEADER = struct.Struct(">I4s")
+LARGE_SIZE = struct.Struct(">Q")
+MVHD_V0 = struct.Struct(">8xII")  # creation/modification time, timescale, duration
+MVHD_V1 = struct.Struct(">16xIQ")
+
+
+def find_box(f, box_type, end=None):
+    """
+    Seek f to the payload of the next box of box_type before end
+
+    Returns:
+        Offset where the box ends (None when it runs to the end of the file), or False
+        when there is no such box
+    """
+    while end is None or f.tell() < end:
+        header = f.read(BOX_HEADER.size)
+        if len(header) < BOX_HEADER.size:
+            return False
+        size, found = BOX_HEADER.unpack(header)
+        start = f.tell() - BOX_HEADER.size
+        if size == 1:
+            size = LARGE_SIZE.unpack(f.read(LARGE_SIZE.size))[0]
+        if size == 0:
+            # Box runs to the end of the file
+            return None if found == box_type else False
+        if size < f.tell() - start:
+            raise ValueError(f"Invalid size of MP4 box {found!r}")
+
+        if found == box_type:
+            return start + size
+        f.seek(start + size)
+    return False
+
+
+def read_mp4_duration(f):
+    """
+    Duration in seconds of the MP4 file object f, from its movie header
+
+    f has to be seekable (files and zip members are), its position is moved.
+
+    Returns:
+        Duration in seconds, or None when the file has no movie header or the duration
+        is not set
+    """
+    moov_end = find_box(f, b"moov")
+    if moov_end is False or find_box(f, b"mvhd", moov_end) is False:
+        return None
+
+    # Version 1 headers have 64-bit times and duration
+    layout, unknown = (
+        (MVHD_V1, 2**64 - 1) if f.read(4)[:1] == b"\x01" else (MVHD_V0, 2**32 - 1)
+    )
+    data = f.read(layout.size)
+    if len(data) < layout.size:
+        return None
+    timescale, duration = layout.unpack(data)
+
+    # All ones means the duration is unknown
+    if not timescale or duration == unknown:
+        return None
+    return duration / timescale
@@ -0,0 +1,211 @@
+"""Columnar study exports for analysis tools
+
+The ``parquet`` export format gives analysts one typed Parquet dataset per stream
+instead of a folder of CSVs per trial. Each dataset is hive partitioned by participant
+session and task, so pandas, R (arrow) and DuckDB read a whole study with a single call
+and skip partitions a filter rules out:
+
+    mouse_movement/participant_session_id=<id>/task_id=<id>/trial_<id>.parquet
+    mouse_clicks/...
+    mouse_scrolls/...
+    keyboard/...
+    trial_summary/participant_session_id=<id>/task_id=<id>/trials.parquet
+
+Stream files hold the same columns as the CSV export, with fixed types, plus the trial
+and factor they belong to. The trial summary has one row per trial with its timings and
+the metrics precomputed in ``trial_metrics``. Files are converted one trial at a time
+while the archive streams, so memory use does not grow with the study.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+from itertools import groupby
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.utility.analytics.trial_metrics import METRIC_COLUMNS
+from app.utility.trial_streams import read_measurement_frame
+
+logger = logging.getLogger(__name__)
+
+PARQUET_COMPRESSION = "zstd"
+
+PARTITION_COLUMNS = ("participant_session_id", "task_id")
+
+_TRIAL_COLUMNS = [
+    pa.field("trial_id", pa.int32()),
+    pa.field("factor_id", pa.int32()),
+    pa.field("Time", pa.string()),
+    pa.field("running_time", pa.float64()),
+]
+_MOUSE_SCHEMA = pa.schema(
+    _TRIAL_COLUMNS + [pa.field("x", pa.int32()), pa.field("y", pa.int32())]
+)
+_KEYBOARD_SCHEMA = pa.schema(
+    _TRIAL_COLUMNS
+    + [
+        pa.field("keys", pa.dictionary(pa.int32(), pa.string())),
+        # Only in streams that also record key releases
+        pa.field("vk", pa.int32()),
+        pa.field("pressed", pa.int8()),
+    ]
+)
+
+# measurement_option_name -> (dataset name, schema of its files)
+STREAM_DATASETS = {
+    "Mouse Movement": ("mouse_movement", _MOUSE_SCHEMA),
+    "Mouse Clicks": ("mouse_clicks", _MOUSE_SCHEMA),
+    "Mouse Scrolls": ("mouse_scrolls", _MOUSE_SCHEMA),
+    "Keyboard Inputs": ("keyboard", _KEYBOARD_SCHEMA),
+}
+
+# trial_metrics columns stored as INT, the others are DOUBLE
+COUNT_METRICS = ("click_count", "keypresses", "corrections")
+
+TRIAL_SUMMARY_SCHEMA = pa.schema(
+    [
+        pa.field("trial_id", pa.int32()),
+        pa.field("participant_id", pa.int32()),
+        pa.field("task_name", pa.string()),
+        pa.field("factor_id", pa.int32()),
+        pa.field("factor_name", pa.string()),
+        pa.field("started_at", pa.timestamp("ms")),
+        pa.field("ended_at", pa.timestamp("ms")),
+        pa.field("duration_s", pa.float64()),
+        pa.field("video_length_s", pa.float64()),
+    ]
+    + [
+        pa.field(column, pa.int32() if column in COUNT_METRICS else pa.float64())
+        for column in METRIC_COLUMNS
+    ]
+)
+
+SELECT_TRIAL_SUMMARY = f"""
+SELECT
+    tr.participant_session_id,
+    tr.task_id,
+    tr.trial_id,
+    ps.participant_id,
+    t.task_name,
+    tr.factor_id,
+    f.factor_name,
+    tr.started_at,
+    tr.ended_at,
+    tm.duration_s,
+    tm.video_length_s,
+    {", ".join(f"tm.{column}" for column in METRIC_COLUMNS)}
+FROM trial tr
+INNER JOIN participant_session ps
+    ON ps.participant_session_id = tr.participant_session_id
+INNER JOIN task AS t
+    ON t.task_id = tr.task_id
+LEFT JOIN factor AS f
+    ON f.factor_id = tr.factor_id
+LEFT JOIN trial_metrics AS tm
+    ON tm.trial_id = tr.trial_id
+WHERE ps.study_id = %s
+ORDER BY tr.participant_session_id, tr.task_id, tr.started_at
+"""
+
+
+def get_trial_summary_rows(study_id, cur):
+    """Trial summary rows of a study, grouped by partition (session, then task)"""
+    cur.execute(SELECT_TRIAL_SUMMARY, (study_id,))
+    return cur.fetchall()
+
+
+def partition_path(dataset, participant_session_id, task_id):
+    return (
+        f"{dataset}/participant_session_id={participant_session_id}"
+        f"/task_id={task_id}"
+    )
+
+
+def stream_table(frame, schema, trial_id, factor_id):
+    """
+    Typed table of one trial's measurement frame (see read_measurement_frame)
+
+    Columns the file does not have (e.g. key releases in older keyboard files) are null.
+
+    Raises:
+        ValueError, TypeError: When a column does not fit its type (pyarrow errors)
+    """
+    rows = len(frame)
+    constants = {"trial_id": trial_id, "factor_id": factor_id}
+    arrays = []
+    for field in schema:
+        if field.name in constants:
+            values = constants[field.name]
+            arrays.append(
+                pa.array(np.full(rows, values, dtype=np.int32))
+                if values is not None
+                else pa.nulls(rows, field.type)
+            )
+        elif field.name in frame:
+            arrays.append(pa.array(frame[field.name], field.type, from_pandas=True))
+        else:
+            arrays.append(pa.nulls(rows, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def trial_summary_table(rows):
+    """Table of trial summary rows of one partition, without the partition columns"""
+    columns = list(zip(*rows))[len(PARTITION_COLUMNS) :]
+    arrays = [
+        pa.array(values, field.type)
+        for field, values in zip(TRIAL_SUMMARY_SCHEMA, columns)
+    ]
+    return pa.Table.from_arrays(arrays, schema=TRIAL_SUMMARY_SCHEMA)
+
+
+def _write_entry(table, temp_dir, name):
+    # Written to disk and unlinked once opened, the archive reads it back in chunks
+    path = os.path.join(temp_dir, "entry.parquet")
+    pq.write_table(table, path, compression=PARQUET_COMPRESSION)
+    source = open(path, "rb")
+    os.remove(path)
+    return name, source
+
+
+def get_parquet_entries(results_with_size, summary_rows):
+    """
+    Archive entries of a study's Parquet datasets, for zip_stream.stream_zip
+
+    Args:
+        results_with_size: Rows of sessions.get_all_study_csv_files
+        summary_rows: Rows of get_trial_summary_rows
+
+    Yields:
+        (name in the archive, open Parquet file), each trial is converted when the
+        archive reaches it. Files that cannot be read or typed are left out.
+    """
+    temp_dir = tempfile.mkdtemp(prefix="parquet_export_")
+    try:
+        for row in results_with_size:
+            results_path, trial_id, task_id = row[2], row[3], row[4]
+            measurement_option_name, factor_id = row[7], row[8]
+            participant_session_id = row[10]
+            if measurement_option_name not in STREAM_DATASETS:
+                continue
+
+            dataset, schema = STREAM_DATASETS[measurement_option_name]
+            try:
+                table = stream_table(
+                    read_measurement_frame(results_path), schema, trial_id, factor_id
+                )
+            except (IOError, ValueError, TypeError) as e:
+                logger.warning(f"Cannot convert file: {results_path} - Error: {str(e)}")
+                continue
+
+            name = partition_path(dataset, participant_session_id, task_id)
+            yield _write_entry(table, temp_dir, f"{name}/trial_{trial_id}.parquet")
+
+        for partition, rows in groupby(summary_rows, key=lambda row: row[:2]):
+            name = partition_path("trial_summary", *partition)
+            yield _write_entry(
+                trial_summary_table(list(rows)), temp_dir, f"{name}/trials.parquet"
+            )
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -1,194 +1,182 @@
 import io
-import zipfile
 import pandas as pd
 import json
 import os
 import logging
+from app.utility.blob_store import verify_blob
 from app.utility.db_connection import get_db_connection
+from app.utility.trial_streams import (
+    MEASUREMENT_FILE_EXTENSIONS,
+    is_trial_stream,
+    trial_stream_to_csv,
+)
+from app.utility.zip_stream import stream_zip
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# Media file extensions shown to researchers, and the type they are served with
+MEDIA_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".mp4": "video/mp4",
+}
 
-def process_trial_file(cur, conn, trial_id, participant_dir, trial_folder, file_name):
-    # Full path
-    data_instance_path = os.path.join(trial_folder, file_name)
 
-    # Separate name (like Mouse Movement) and extension (like .csv)
-    file_name_without_extension, file_extension = os.path.splitext(file_name)
-
-    # Fetch measurement option ID
-    get_measurement_id = """
-    SELECT m.measurement_option_id
-    FROM measurement_option AS m
-    WHERE m.measurement_option_name = %s
-    """
-    cur.execute(get_measurement_id, (file_name_without_extension,))
-    result = cur.fetchone()
-    if not result:
-        raise ValueError(
-            f"No measurement option found for '{file_name_without_extension}'"
-        )
-
-    measurement_option_id = result[0]
-
-    # Insert session data instance
-    insert_session_data_instance = """
-    INSERT INTO session_data_instance (trial_id, measurement_option_id)
-    VALUES(%s, %s)
-    """
-    cur.execute(insert_session_data_instance, (trial_id, measurement_option_id))
-    conn.commit()
-
-    # Get the inserted session data instance ID
-    cur.execute("SELECT LAST_INSERT_ID()")
-    session_data_instance_id = cur.fetchone()[0]
+# export_csv renders binary trial streams as CSV for researchers, analytics callers pass False to keep the compact streams
+def get_zip(results_with_size, study_id, conn, mode, export_csv=True):
+    # In-memory archive for callers that read it back, downloads stream it with zip_response
+    memory_file = io.BytesIO()
+    for chunk in stream_zip(
+        get_zip_entries(results_with_size, study_id, conn, mode, export_csv)
+    ):
+        memory_file.write(chunk)
 
-    # Create the new absolute path for the file in the participant's trial folder
-    absolute_data_instance_path = os.path.join(
-        participant_dir,
-        f"{session_data_instance_id}{file_extension}",
-    )
+    memory_file.seek(0)
+    return memory_file
 
-    # Update the results path in the database
-    update_results_path = """
-    UPDATE session_data_instance
-    SET results_path = %s
-    WHERE session_data_instance_id = %s
-    """
-    cur.execute(
-        update_results_path, (absolute_data_instance_path, session_data_instance_id)
-    )
-    conn.commit()
 
-    # Save to actual filesystem
-    os.rename(data_instance_path, absolute_data_instance_path)
+# Names every file of the export within the archive, returns the (name, source) entries for stream_zip
+# The database is only queried here, so the entries can be streamed after the request's connection is returned
+def get_zip_entries(results_with_size, study_id, conn, mode, export_csv=True):
+    files, surveys = plan_zip_entries(results_with_size, study_id, conn, mode)
+    return _open_zip_entries(files, surveys, export_csv)
 
 
-def get_zip(results_with_size, study_id, conn, mode):
+# Returns ([(name in the archive, results_path)], [(name in the archive, survey file_path)])
+def plan_zip_entries(results_with_size, study_id, conn, mode):
 
-    # Fetch the required data for folder naming
+    # Fetch the required data for folder naming, a fixed number of queries however many files there are
     participant_sessions = get_participant_session_name_for_folder(
         study_id, conn.cursor()
     )
     cur = conn.cursor()
+    trial_orders = get_trial_orders_for_folder(
+        {row[-1] for row in results_with_size}, cur
+    )
 
-    # Create an in-memory ZIP file
-    memory_file = io.BytesIO()
+    files = []
+
+    # Iterate over the session data results and organize files in the ZIP
+    for (
+        study_name,
+        session_data_instance_id,
+        results_path,
+        trial_id,
+        task_id,
+        task_name,
+        measurement_option_id,
+        measurement_option_name,
+        factor_id,
+        factor_name,
+        participant_session_id,
+    ) in results_with_size:
+
+        participant_session_name = participant_sessions.get(
+            participant_session_id, "UnknownSession"
+        )
+        trial_order = trial_orders.get(trial_id, "UnknownTrialOrdering")
 
-    with zipfile.ZipFile(memory_file, "w", zipfile.ZIP_DEFLATED) as zipf:
-
-        # Iterate over the session data results and organize files in the ZIP
-        for (
-            study_name,
-            session_data_instance_id,
-            results_path,
-            trial_id,
-            task_id,
-            task_name,
-            measurement_option_id,
-            measurement_option_name,
-            factor_id,
-            factor_name,
-            participant_session_id,
-        ) in results_with_size:
-
-            participant_session_name = participant_sessions.get(
-                participant_session_id, "UnknownSession"
+        if mode == "study" or mode == "participant":
+            trial_folder = f"{task_name}_{factor_name}_trial_{trial_order}"
+            participant_session_folder = (
+                f"{participant_session_name}_participant_session/{trial_folder}"
             )
-            trial_order = get_trial_order_for_folder(
-                participant_session_id, conn.cursor()
-            ).get(trial_id, "UnknownTrialOrdering")
-
-            if mode == "study" or mode == "participant":
-                trial_folder = f"{task_name}_{factor_name}_trial_{trial_order}"
-                participant_session_folder = (
-                    f"{participant_session_name}_participant_session/{trial_folder}"
-                )
-
-                # Extract the file extension
-                file_extension = os.path.splitext(results_path)[1]
-                zip_file_path = f"{participant_session_folder}/{measurement_option_name}{file_extension}"
-            elif mode == "participant_session":
-                trial_folder = f"{task_name}_{factor_name}_trial_{trial_order}"
-
-                # Extract the file extension
-                file_extension = os.path.splitext(results_path)[1]
-                zip_file_path = (
-                    f"{trial_folder}/{measurement_option_name}{file_extension}"
-                )
-            elif mode == "one file" or mode == "trial":
-                # Extract the file extension
-                file_extension = os.path.splitext(results_path)[1]
-                zip_file_path = f"{measurement_option_name}{file_extension}"
-
-            try:
-                with open(results_path, "rb") as file:
-                    zipf.writestr(zip_file_path, file.read())
-                    logger.info(f"Successfully added file to ZIP: {results_path}")
-            except (IOError, PermissionError) as e:
-                logger.warning(f"Cannot access file: {results_path} - Error: {str(e)}")
-                # If file type is CSV, create a placeholder with headers
-                if results_path.endswith(".csv"):
-                    # Create an empty CSV with basic headers for this data type
-                    placeholder_content = "timestamp,running_time,x,y\n0,0,0,0\n"
-                    zipf.writestr(zip_file_path, placeholder_content)
-                    logger.warning(
-                        f"Added placeholder CSV for inaccessible file: {results_path}"
-                    )
-                # If file type is PNG, create a tiny image
-                elif results_path.endswith(".png"):
-                    # We can't create a useful image, so just log and continue
-                    logger.warning(f"Skipping inaccessible PNG file: {results_path}")
-                # If file type is MP4, just skip
-                elif results_path.endswith(".mp4"):
-                    logger.warning(f"Skipping inaccessible MP4 file: {results_path}")
-                else:
-                    logger.warning(f"Skipping unknown file type: {results_path}")
-
-        # Are we looking at the study-level (many sessions) or looking at a single session
-        if mode == "participant_session":
-            participant_session_ids = {row[-1] for row in results_with_size}
-            participant_sessions_filtered = {
-                pid: participant_sessions.get(pid, "UnknownSession")
-                for pid in participant_session_ids
-            }
-        else:
-            participant_sessions_filtered = participant_sessions
-
-        # Grab pre/post survey responses
-        for (
-            participant_session_id,
-            participant_number,
-        ) in participant_sessions_filtered.items():
-            survey_query = """
-                SELECT
-                    survey_results.file_path,
-                    survey_form.form_type
-                FROM survey_results
-                INNER JOIN survey_form
-                ON survey_results.survey_form_id = survey_form.survey_form_id
-                WHERE survey_results.participant_session_id = %s
-            """
-            cur.execute(survey_query, (participant_session_id,))
-            survey_results = cur.fetchall()
-
-            for file_path, form_type in survey_results:
-                if os.path.exists(file_path):
-                    filename = os.path.basename(file_path)
-
-                    if mode == "participant_session":
-                        survey_folder = f"{form_type}_survey"
-                    else:
-                        folder = f"{participant_number}_participant_session"
-                        survey_folder = f"{folder}/{form_type}_survey"
-                    zip_path = f"{survey_folder}/{filename}"
-
-                    with open(file_path, "rb") as f:
-                        zipf.writestr(zip_path, f.read())
 
-    memory_file.seek(0)
-    return memory_file
+            # Extract the file extension
+            file_extension = os.path.splitext(results_path)[1]
+            zip_file_path = f"{participant_session_folder}/{measurement_option_name}{file_extension}"
+        elif mode == "participant_session":
+            trial_folder = f"{task_name}_{factor_name}_trial_{trial_order}"
+
+            # Extract the file extension
+            file_extension = os.path.splitext(results_path)[1]
+            zip_file_path = f"{trial_folder}/{measurement_option_name}{file_extension}"
+        elif mode == "one file" or mode == "trial":
+            # Extract the file extension
+            file_extension = os.path.splitext(results_path)[1]
+            zip_file_path = f"{measurement_option_name}{file_extension}"
+
+        files.append((zip_file_path, results_path))
+
+    # Are we looking at the study-level (many sessions) or looking at a single session
+    if mode == "participant_session":
+        participant_session_ids = {row[-1] for row in results_with_size}
+        participant_sessions_filtered = {
+            pid: participant_sessions.get(pid, "UnknownSession")
+            for pid in participant_session_ids
+        }
+    else:
+        participant_sessions_filtered = participant_sessions
+
+    # Grab pre/post survey responses
+    survey_files = get_survey_files_for_folder(participant_sessions_filtered, cur)
+    surveys = []
+    for (
+        participant_session_id,
+        participant_number,
+    ) in participant_sessions_filtered.items():
+        for file_path, form_type in survey_files.get(participant_session_id, []):
+            # Stored files are named by their hash, the archive names them by survey
+            filename = f"{form_type}_survey_results{os.path.splitext(file_path)[1]}"
+
+            if mode == "participant_session":
+                survey_folder = f"{form_type}_survey"
+            else:
+                folder = f"{participant_number}_participant_session"
+                survey_folder = f"{folder}/{form_type}_survey"
+            surveys.append((f"{survey_folder}/{filename}", file_path))
+
+    return files, surveys
+
+
+# Name of a result file in the archive, trial streams are exported as CSV
+def export_file_name(zip_file_path, results_path, export_csv):
+    if export_csv and is_trial_stream(results_path):
+        return os.path.splitext(zip_file_path)[0] + ".csv"
+    return zip_file_path
+
+
+# What goes in the archive for a result file that cannot be read, None to leave it out
+def unreadable_file_placeholder(results_path, export_csv):
+    # If file type is CSV, create a placeholder with headers
+    if results_path.endswith(".csv") or (export_csv and is_trial_stream(results_path)):
+        # Create an empty CSV with basic headers for this data type
+        logger.warning(f"Added placeholder CSV for inaccessible file: {results_path}")
+        return b"timestamp,running_time,x,y\n0,0,0,0\n"
+    # If file type is PNG, create a tiny image
+    elif results_path.endswith(".png"):
+        # We can't create a useful image, so just log and continue
+        logger.warning(f"Skipping inaccessible PNG file: {results_path}")
+    # If file type is MP4, just skip
+    elif results_path.endswith(".mp4"):
+        logger.warning(f"Skipping inaccessible MP4 file: {results_path}")
+    else:
+        logger.warning(f"Skipping unknown file type: {results_path}")
+    return None
+
+
+# Opens each file only when the archive reaches it, so one file at a time is held open
+def _open_zip_entries(files, surveys, export_csv):
+    for zip_file_path, results_path in files:
+        zip_file_path = export_file_name(zip_file_path, results_path, export_csv)
+        try:
+            if export_csv and is_trial_stream(results_path):
+                source = trial_stream_to_csv(results_path)
+            else:
+                source = open(results_path, "rb")
+            logger.info(f"Adding file to ZIP: {results_path}")
+        except (IOError, PermissionError, ValueError) as e:
+            logger.warning(f"Cannot access file: {results_path} - Error: {str(e)}")
+            source = unreadable_file_placeholder(results_path, export_csv)
+
+        if source is not None:
+            yield zip_file_path, source
+
+    for zip_path, file_path in surveys:
+        if os.path.exists(file_path):
+            yield zip_path, open(file_path, "rb")
 
 
 def get_core_csv_files_query():
@@ -239,6 +227,58 @@ def get_trial_order_for_folder(participant_session_id, cur):
     return trial_order
 
 
+# Trial numbering of many sessions in one query, numbered like get_trial_order_for_folder
+def get_trial_orders_for_folder(participant_session_ids, cur):
+    participant_session_ids = list(participant_session_ids)
+    if not participant_session_ids:
+        return {}
+
+    placeholders = ", ".join(["%s"] * len(participant_session_ids))
+    query = f"""
+    SELECT t.participant_session_id, t.trial_id
+    FROM trial AS t
+    WHERE t.participant_session_id IN ({placeholders})
+    ORDER BY t.participant_session_id, t.started_at DESC
+    """
+    cur.execute(query, participant_session_ids)
+    results = cur.fetchall()
+
+    trial_order = {}
+    counters = {}
+    for participant_session_id, trial_id in results:
+        counters[participant_session_id] = counters.get(participant_session_id, 0) + 1
+        trial_order[trial_id] = counters[participant_session_id]
+    return trial_order
+
+
+# Pre/post survey files of many sessions in one query, as {participant_session_id: [(file_path, form_type)]}
+def get_survey_files_for_folder(participant_session_ids, cur):
+    participant_session_ids = list(participant_session_ids)
+    if not participant_session_ids:
+        return {}
+
+    placeholders = ", ".join(["%s"] * len(participant_session_ids))
+    query = f"""
+    SELECT
+        survey_results.participant_session_id,
+        survey_results.file_path,
+        survey_form.form_type
+    FROM survey_results
+    INNER JOIN survey_form
+    ON survey_results.survey_form_id = survey_form.survey_form_id
+    WHERE survey_results.participant_session_id IN ({placeholders})
+    """
+    cur.execute(query, participant_session_ids)
+    results = cur.fetchall()
+
+    survey_files = {}
+    for participant_session_id, file_path, form_type in results:
+        survey_files.setdefault(participant_session_id, []).append(
+            (file_path, form_type)
+        )
+    return survey_files
+
+
 def get_participant_session_name_for_folder(study_id, cur):
     query = """
     SELECT ps.participant_session_id, ps.created_at
@@ -336,18 +376,47 @@ def get_all_study_csv_files(study_id, cur):
 
     logger.info(f"Found {len(results)} files for study {study_id}")
 
-    # Validate result paths
-    import os
+    # Files are not stat'ed here, get_zip reports any it cannot read and
+    # verify_study_files checks them against their recorded size and hash on demand
+    return results
 
-    missing_files = 0
-    for result in results:
-        file_path = result[2]  # results_path is at index 2
-        if not os.path.exists(file_path):
-            missing_files += 1
-            logger.warning(f"File does not exist: {file_path}")
 
-    logger.info(f"Found {missing_files} missing files out of {len(results)}")
-    return results
+def verify_study_files(study_id, cur, full=False):
+    """
+    Check a study's stored files against the size (and with full=True, sha256) recorded at ingest
+
+    Each distinct blob is checked once, however many rows share it. Files ingested
+    before sizes were recorded are skipped.
+
+    Returns:
+        List of (session_data_instance_id, results_path) whose file is missing or damaged
+    """
+    cur.execute(
+        """
+        SELECT sdi.session_data_instance_id, sdi.results_path, sdi.size_bytes, sdi.sha256
+        FROM session_data_instance sdi
+        INNER JOIN trial tr ON tr.trial_id = sdi.trial_id
+        INNER JOIN participant_session ps ON ps.participant_session_id = tr.participant_session_id
+        WHERE ps.study_id = %s AND sdi.size_bytes IS NOT NULL
+        """,
+        (study_id,),
+    )
+    rows = cur.fetchall()
+
+    checked = {}
+    damaged = []
+    for session_data_instance_id, results_path, size, sha256 in rows:
+        if results_path not in checked:
+            checked[results_path] = verify_blob(
+                results_path, size, sha256 if full else None
+            )
+        if not checked[results_path]:
+            damaged.append((session_data_instance_id, results_path))
+
+    logger.info(
+        f"Verified {len(checked)} files for study {study_id}, {len(damaged)} rows missing or damaged"
+    )
+    return damaged
 
 
 def get_one_trial(trial_id, cur):
@@ -355,3 +424,60 @@ def get_one_trial(trial_id, cur):
     cur.execute(query, (trial_id,))
     results = cur.fetchall()
     return results
+
+
+# Stored measurement files (CSV or trial stream) of a study's trials, optionally of one participant or task
+# Files are content-addressed, session_data_instance is the only link from a trial to its files
+# Returns [(participant_id, participant_session_id, task_id, trial_id, results_path)] in trial order
+def get_trial_measurement_files(study_id, cur, participant_id=None, task_id=None):
+    query = """
+    SELECT ps.participant_id, ps.participant_session_id, tr.task_id, tr.trial_id, sdi.results_path
+    FROM session_data_instance AS sdi
+    INNER JOIN trial AS tr ON tr.trial_id = sdi.trial_id
+    INNER JOIN participant_session AS ps ON ps.participant_session_id = tr.participant_session_id
+    WHERE ps.study_id = %s AND sdi.results_path IS NOT NULL
+    """
+    params = [study_id]
+    if participant_id is not None:
+        query += " AND ps.participant_id = %s"
+        params.append(participant_id)
+    if task_id is not None:
+        query += " AND tr.task_id = %s"
+        params.append(task_id)
+    query += " ORDER BY ps.participant_session_id, tr.started_at"
+
+    cur.execute(query, params)
+    return [
+        row
+        for row in cur.fetchall()
+        if row[-1].lower().endswith(MEASUREMENT_FILE_EXTENSIONS)
+    ]
+
+
+# Screenshots and recordings of a participant's trials in a study, optionally of one trial
+# Named like the export names them (measurement option name and extension), since stored files are named by hash
+# Returns [(trial_id, file name, results_path)] in trial order
+def get_participant_media_files(study_id, participant_id, cur, trial_id=None):
+    query = """
+    SELECT tr.trial_id, mo.measurement_option_name, sdi.results_path
+    FROM session_data_instance AS sdi
+    INNER JOIN measurement_option AS mo ON mo.measurement_option_id = sdi.measurement_option_id
+    INNER JOIN trial AS tr ON tr.trial_id = sdi.trial_id
+    INNER JOIN participant_session AS ps ON ps.participant_session_id = tr.participant_session_id
+    WHERE ps.study_id = %s AND ps.participant_id = %s AND sdi.results_path IS NOT NULL
+    """
+    params = [study_id, participant_id]
+    if trial_id is not None:
+        query += " AND tr.trial_id = %s"
+        params.append(trial_id)
+    query += " ORDER BY tr.started_at, sdi.session_data_instance_id"
+
+    cur.execute(query, params)
+    media = []
+    for trial_id, measurement_option_name, results_path in cur.fetchall():
+        extension = os.path.splitext(results_path)[1].lower()
+        if extension in MEDIA_TYPES:
+            media.append(
+                (trial_id, f"{measurement_option_name}{extension}", results_path)
+            )
+    return media
@@ -1,9 +1,9 @@
 import base64
+import io
 import pandas as pd
 import os
-import shutil
+from app.utility.blob_store import store_blob
 from app.utility.db_connection import get_db_connection
-from flask import current_app
 from werkzeug.utils import secure_filename
 
 
@@ -83,21 +83,7 @@ def create_study_data(study_data, user_id, cur):
             (user_id, study_id, study_user_role_type_id),
         )
 
-        # Save base64-encoded consent file if present
-        if "consentFile" in study_data:
-            file_info = study_data["consentFile"]
-            filename = secure_filename(file_info.get("filename"))
-            base64_data = file_info.get("content")
-
-            if filename and base64_data:
-                file_bytes = base64.b64decode(base64_data)
-                base_dir = current_app.config.get("RESULTS_BASE_DIR_PATH")
-                full_path = os.path.join(base_dir, "study_consent_forms", str(study_id))
-
-                os.makedirs(full_path, exist_ok=True)
-                with open(os.path.join(full_path, filename), "wb") as f:
-                    f.write(file_bytes)
-
+        # The consent file, if any, is stored by the caller through save_study_consent_form
         return study_id
     except Exception as e:
         # Raise the error to be handled by the calling function
@@ -338,7 +324,7 @@ def create_study_task_factor_details(study_id, submissionData, cur):
         raise Exception(f"Error creating study: {str(e)}")
 
 
-# Stores consent form in the study-level dir in the filesystem
+# Stores consent form in the results blob store, studies with the same form share one file
 def save_study_consent_form(study_id, file, cur, base_dir):
     original_filename = secure_filename(file.get("filename"))
 
@@ -351,15 +337,10 @@ def save_study_consent_form(study_id, file, cur, base_dir):
     if not content:
         raise ValueError("Missing file content.")
 
-    # Construct path
-    full_path = os.path.join(base_dir, f"{study_id}_study_id")
-    os.makedirs(full_path, exist_ok=True)
-
-    file_path = os.path.join(full_path, "consent_form.pdf")
-
-    # Save decoded bytes to file
-    with open(file_path, "wb") as f:
-        f.write(base64.b64decode(content))
+    # Save decoded bytes to the store
+    file_path, _, _, _ = store_blob(
+        io.BytesIO(base64.b64decode(content)), base_dir, ".pdf"
+    )
 
     # Insert or update the consent form in the database
     insert_consent_form = """
@@ -375,26 +356,7 @@ def save_study_consent_form(study_id, file, cur, base_dir):
 
 # Removing consent form
 def remove_study_consent_form(study_id, cur):
-    # Get file path if one exists
-    look_path = """
-    SELECT file_path
-    FROM consent_form
-    WHERE study_id = %s
-    """
-    cur.execute(look_path, (study_id,))
-    result = cur.fetchone()
-
-    if not result:
-        return
-
-    file_path = result[0]
-
-    if file_path and os.path.isfile(file_path):
-        try:
-            os.remove(file_path)
-        except Exception as err:
-            print(f"Failed removing file at {file_path}: {err}")
-
+    # Only the row goes, the file is a blob other studies may share and blobs are never removed
     # Updating consent form tbl to reflect deletion
     delete_consent_tbl_entry = """
     DELETE
@@ -404,7 +366,7 @@ def remove_study_consent_form(study_id, cur):
     cur.execute(delete_consent_tbl_entry, (study_id,))
 
 
-# Stores survey forms in the study-level dir in the filesystem
+# Stores survey forms in the results blob store, studies with the same form share one file
 def save_study_survey_form(study_id, file, cur, base_dir, survey_type):
     original_filename = secure_filename(file.get("filename"))
 
@@ -417,20 +379,13 @@ def save_study_survey_form(study_id, file, cur, base_dir, survey_type):
     if not content:
         raise ValueError("Missing survey file content.")
 
-    # Construct path
-    full_path = os.path.join(base_dir, f"{study_id}_study_id")
-    os.makedirs(full_path, exist_ok=True)
-
-    survey_name = None
     if survey_type not in ["pre", "post"]:
         raise ValueError("Invalid survey type received.")
-    survey_name = f"{survey_type}_survey_form.json"
-
-    file_path = os.path.join(full_path, survey_name)
 
-    # Save decoded bytes to file
-    with open(file_path, "wb") as f:
-        f.write(base64.b64decode(content))
+    # Save decoded bytes to the store
+    file_path, _, _, _ = store_blob(
+        io.BytesIO(base64.b64decode(content)), base_dir, ".json"
+    )
 
     # Insert or update the survey form in the database
     insert_survey_form = """
@@ -451,26 +406,7 @@ def remove_study_survey_form(study_id, cur, survey_type):
     if survey_type not in ["pre", "post"]:
         raise ValueError("Invalid survey type received.")
 
-    # Get file path if one exists
-    look_path = """
-    SELECT file_path
-    FROM survey_form
-    WHERE study_id = %s AND form_type = %s
-    """
-    cur.execute(look_path, (study_id, survey_type))
-    result = cur.fetchone()
-
-    if not result:
-        return
-
-    file_path = result[0]
-
-    if file_path and os.path.isfile(file_path):
-        try:
-            os.remove(file_path)
-        except Exception as err:
-            print(f"Failed removing file at {file_path}: {err}")
-
+    # Only the row goes, the file is a blob other studies may share and blobs are never removed
     # Updating survey form tbl to reflect deletion
     delete_survey_tbl_entry = """
     DELETE
@@ -499,12 +435,11 @@ def copy_consent_form(old_study_id, new_study_id, cur, base_dir):
     if not (src_file_path and os.path.isfile(src_file_path)):
         return "failure"  # File supposed to exist according to db but failed to find it in filesystem
 
+    dst_file_path = None
     try:
-        dst_dir = os.path.join(base_dir, f"{new_study_id}_study_id")
-        os.makedirs(dst_dir, exist_ok=True)
-
-        dst_file_path = os.path.join(dst_dir, "consent_form.pdf")
-        shutil.copy2(src_file_path, dst_file_path)
+        # Forms already in the store are found there rather than copied, older ones are copied into it
+        with open(src_file_path, "rb") as src:
+            dst_file_path, _, _, _ = store_blob(src, base_dir, ".pdf")
 
         # Insert or update the consent form in the database
         insert_consent_form = """
@@ -545,12 +480,11 @@ def copy_survey_form(old_study_id, new_study_id, cur, base_dir, survey_type):
     if not (src_file_path and os.path.isfile(src_file_path)):
         return "failure"  # File supposed to exist according to db but failed to find it in filesystem
 
+    dst_file_path = None
     try:
-        dst_dir = os.path.join(base_dir, f"{new_study_id}_study_id")
-        os.makedirs(dst_dir, exist_ok=True)
-
-        dst_file_path = os.path.join(dst_dir, f"{survey_type}_survey_form.json")
-        shutil.copy2(src_file_path, dst_file_path)
+        # Forms already in the store are found there rather than copied, older ones are copied into it
+        with open(src_file_path, "rb") as src:
+            dst_file_path, _, _, _ = store_blob(src, base_dir, ".json")
 
         # Insert or update the survey form in the database
         insert_survey_form = """
@@ -0,0 +1,162 @@
+"""Reader for the binary columnar trial streams produced by the local tracker.
+
+Each raw measurement stream (mouse movement, clicks, scrolls, keyboard) is uploaded
+as a ``.fcol`` file instead of a CSV. The layout mirrors
+``local_backend/tracking/utility/trial_format.py``: a fixed header (magic, schema
+version, column count, metadata length, row count), UTF-8 JSON trial metadata, a
+column directory (name, numpy dtype, offset) and 8-byte aligned column data that can
+be mapped straight into numpy. CSV is only produced from these files on demand when a
+researcher exports data.
+"""
+
+import io
+import json
+import mmap
+import struct
+import numpy as np
+import pandas as pd
+
+TRIAL_STREAM_EXTENSION = ".fcol"
+MEASUREMENT_FILE_EXTENSIONS = (".csv", TRIAL_STREAM_EXTENSION)
+
+MAGIC = b"FULCRUM\x00"
+SCHEMA_VERSION = 1
+HEADER = struct.Struct("<8sHHIQ")
+COLUMN_ENTRY = struct.Struct("<16s4sQ")
+
+
+def is_trial_stream(path):
+    return str(path).lower().endswith(TRIAL_STREAM_EXTENSION)
+
+
+def parse_trial_stream(buffer):
+    """
+    Parse a trial stream held in memory (bytes, memoryview or mmap)
+
+    Returns:
+        (metadata dict, dict of column name -> read-only numpy array)
+    """
+    if len(buffer) < HEADER.size:
+        raise ValueError("Trial stream is truncated")
+
+    magic, version, column_count, meta_len, row_count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a Fulcrum trial stream")
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"Trial stream schema version {version} is newer than supported version {SCHEMA_VERSION}"
+        )
+
+    pos = HEADER.size
+    metadata = json.loads(bytes(buffer[pos : pos + meta_len]).decode("utf-8"))
+    pos += meta_len
+
+    columns = {}
+    for _ in range(column_count):
+        raw_name, raw_dtype, offset = COLUMN_ENTRY.unpack_from(buffer, pos)
+        pos += COLUMN_ENTRY.size
+        name = raw_name.rstrip(b"\x00").decode("ascii")
+        dtype = np.dtype(raw_dtype.rstrip(b"\x00").decode("ascii"))
+        columns[name] = np.frombuffer(
+            buffer, dtype=dtype, count=row_count, offset=offset
+        )
+
+    return metadata, columns
+
+
+def read_trial_stream(file_path):
+    """Memory map a trial stream from disk, see parse_trial_stream"""
+    with open(file_path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return parse_trial_stream(buffer)
+
+
+def running_time_ns(t_ns, pauses):
+    """
+    Convert trial clock timestamps to running time with the paused intervals removed
+
+    Args:
+        t_ns: Timestamps on the trial's shared monotonic clock (nanoseconds since start)
+        pauses: [start_ns, end_ns] pause intervals on the same clock, in order
+
+    Returns:
+        int64 array of nanoseconds the trial had been running at each timestamp
+    """
+    t_ns = np.asarray(t_ns, dtype=np.int64)
+    if not pauses:
+        return t_ns
+
+    bounds = np.asarray(pauses, dtype=np.int64).reshape(-1, 2)
+    paused_before = np.concatenate(([0], np.cumsum(bounds[:, 1] - bounds[:, 0])))
+    # Pauses that ended at or before each timestamp (nothing is captured during a pause)
+    return t_ns - paused_before[np.searchsorted(bounds[:, 1], t_ns, side="right")]
+
+
+def trial_stream_to_dataframe(metadata, columns):
+    """
+    Build the same frame a legacy CSV produced (Time, running_time, x, y / keys)
+
+    Streams stamped on the shared trial clock keep paused time in t_ns (so they line up
+    with the screen recording) and list their pauses in the metadata, running_time drops
+    those pauses. Older streams already stored running time. Time is derived from the
+    trial's start wall clock so it is only computed here, never stored per event.
+    """
+    t_ns = np.asarray(columns["t_ns"], dtype=np.int64)
+    running_time = running_time_ns(t_ns, metadata.get("pauses")) / 1e9
+
+    start_local = metadata.get("trial_start_wall", 0) + metadata.get("utc_offset_s", 0)
+    times = pd.to_datetime(start_local + t_ns / 1e9, unit="s").strftime("%H:%M:%S")
+
+    frame = {"Time": times, "running_time": running_time}
+    if "code" in columns:
+        # Categorical so key comparisons run once per distinct key, not once per event
+        key_table = metadata.get("keys", [])
+        codes = np.asarray(columns["code"])
+        frame["keys"] = (
+            pd.Categorical.from_codes(codes, categories=key_table)
+            if len(key_table)
+            else codes.astype(str)
+        )
+        # Streams with key-up events also carry the virtual-key code and press (1) / release (0)
+        for name in ("vk", "pressed"):
+            if name in columns:
+                frame[name] = np.asarray(columns[name])
+    else:
+        frame["x"] = np.asarray(columns["x"])
+        frame["y"] = np.asarray(columns["y"])
+
+    return pd.DataFrame(frame)
+
+
+def read_measurement_frame(source, name=None):
+    """
+    Load a raw measurement file into a DataFrame regardless of its on-disk format
+
+    Args:
+        source: Path, or an open binary file object (e.g. a zip member)
+        name: File name used to detect the format when source is a file object
+    """
+    name = name or (source if isinstance(source, str) else "")
+    if not is_trial_stream(name):
+        return pd.read_csv(source)
+
+    if isinstance(source, str):
+        metadata, columns = read_trial_stream(source)
+    else:
+        metadata, columns = parse_trial_stream(source.read())
+    return trial_stream_to_dataframe(metadata, columns)
+
+
+def trial_stream_to_csv(source):
+    """Render a trial stream (path or raw bytes) as CSV bytes for researcher exports"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        metadata, columns = parse_trial_stream(source)
+    else:
+        metadata, columns = read_trial_stream(source)
+
+    output = io.StringIO()
+    trial_stream_to_dataframe(metadata, columns).to_csv(
+        output, index=False, float_format="%.2f"
+    )
+    return output.getvalue().encode("utf-8")
+
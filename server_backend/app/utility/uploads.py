@@ -0,0 +1,325 @@
+"""Chunked, resumable uploads of local session results.
+
+The local tracker describes its session zip with a manifest: the whole file's size and
+sha256 plus a list of fixed size chunks, each with its own sha256. An upload is staged
+under ``<staging root>/<file sha256>/`` so re-initialising after a dropped connection
+finds the chunks already received. Chunks are stored by their hash, verified against
+their hash and manifest size as they are streamed in. On commit they are read in place
+through ``open_upload``, a seekable view over the chunk files checked against the whole
+file's sha256, so the zip never has to be reassembled on disk.
+
+The manifest records the user who started the upload, only they can send its chunks and
+commit it. Staged uploads nobody has touched for ``UPLOAD_EXPIRY`` seconds are removed
+whenever an upload is started.
+"""
+
+import bisect
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import time
+
+# Upper bound on a single chunk so one request can never fill the disk
+CHUNK_MAX_SIZE = 64 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Abandoned uploads are cleaned up after a day without a new chunk or resume
+UPLOAD_EXPIRY = 24 * 60 * 60
+
+_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _check_hash(value, what):
+    if not isinstance(value, str) or not _SHA256_PATTERN.match(value):
+        raise ValueError(f"Invalid {what} sha256")
+
+
+def _upload_dir(root, upload_id):
+    _check_hash(upload_id, "upload")
+    upload_dir = os.path.join(root, upload_id)
+    if not os.path.isdir(upload_dir):
+        raise FileNotFoundError(f"No upload {upload_id} in progress")
+    return upload_dir
+
+
+def _chunk_path(upload_dir, chunk_hash):
+    return os.path.join(upload_dir, "chunks", chunk_hash)
+
+
+def validate_manifest(manifest):
+    """
+    Make sure a manifest describes one file exactly, chunk by chunk
+
+    Raises:
+        ValueError: If any field is missing, malformed or inconsistent
+    """
+    if not isinstance(manifest, dict):
+        raise ValueError("Upload manifest missing")
+
+    _check_hash(manifest.get("sha256"), "file")
+    chunks = manifest.get("chunks")
+    if not isinstance(chunks, list) or not chunks:
+        raise ValueError("Upload manifest has no chunks")
+
+    offset = 0
+    sizes = {}
+    for index, chunk in enumerate(chunks):
+        _check_hash(chunk.get("sha256"), f"chunk {index}")
+        size = chunk.get("size")
+        if chunk.get("index") != index or chunk.get("offset") != offset:
+            raise ValueError(f"Chunk {index} is out of order")
+        if not isinstance(size, int) or not 0 < size <= CHUNK_MAX_SIZE:
+            raise ValueError(f"Chunk {index} has an invalid size")
+        # Repeated chunks are stored once, so they must agree on their size
+        if sizes.setdefault(chunk["sha256"], size) != size:
+            raise ValueError(f"Chunk {index} has an invalid size")
+        offset += size
+
+    if offset != manifest.get("size"):
+        raise ValueError("Chunk sizes do not add up to the file size")
+
+
+def load_manifest(root, upload_id):
+    with open(os.path.join(_upload_dir(root, upload_id), "manifest.json")) as f:
+        return json.load(f)
+
+
+def check_upload_owner(root, upload_id, owner):
+    """
+    Raises:
+        PermissionError: If the upload was started by another user
+    """
+    if load_manifest(root, upload_id).get("owner") != owner:
+        raise PermissionError("Upload belongs to another user")
+
+
+def _last_activity(upload_dir):
+    # Storing a chunk updates the chunks directory, resuming touches the manifest
+    return max(
+        os.path.getmtime(os.path.join(upload_dir, name))
+        for name in ("chunks", "manifest.json")
+        if os.path.exists(os.path.join(upload_dir, name))
+    )
+
+
+def expire_uploads(root, max_age=UPLOAD_EXPIRY):
+    """Remove staged uploads without activity for max_age seconds, returns their ids"""
+    if not os.path.isdir(root):
+        return []
+
+    expired = []
+    cutoff = time.time() - max_age
+    for upload_id in os.listdir(root):
+        upload_dir = os.path.join(root, upload_id)
+        if not _SHA256_PATTERN.match(upload_id) or not os.path.isdir(upload_dir):
+            continue
+        try:
+            if _last_activity(upload_dir) < cutoff:
+                shutil.rmtree(upload_dir)
+                expired.append(upload_id)
+        except (OSError, ValueError):
+            # Removed concurrently, or nothing written in it yet
+            continue
+    return expired
+
+
+def missing_chunks(root, upload_id):
+    """Indexes of the chunks the server has not received yet"""
+    upload_dir = _upload_dir(root, upload_id)
+    manifest = load_manifest(root, upload_id)
+    return [
+        chunk["index"]
+        for chunk in manifest["chunks"]
+        if not os.path.exists(_chunk_path(upload_dir, chunk["sha256"]))
+    ]
+
+
+def init_upload(root, manifest, owner):
+    """
+    Start (or resume) the upload a manifest describes
+
+    Args:
+        owner: Id of the user uploading, recorded in the manifest
+
+    Returns:
+        (upload_id, list of chunk indexes still to be sent)
+
+    Raises:
+        PermissionError: If another user is uploading the same file
+    """
+    validate_manifest(manifest)
+    expire_uploads(root)
+
+    upload_id = manifest["sha256"]
+    upload_dir = os.path.join(root, upload_id)
+    os.makedirs(os.path.join(upload_dir, "chunks"), exist_ok=True)
+
+    manifest_path = os.path.join(upload_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        check_upload_owner(root, upload_id, owner)
+        os.utime(manifest_path)
+    else:
+        temp_path = f"{manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({**manifest, "owner": owner}, f)
+        os.replace(temp_path, manifest_path)
+
+    return upload_id, missing_chunks(root, upload_id)
+
+
+def store_chunk(root, upload_id, chunk_hash, stream, owner):
+    """
+    Stream one chunk to disk, keeping it only if its content matches chunk_hash
+
+    Args:
+        stream: Binary file-like object with the chunk's bytes (e.g. request.stream)
+        owner: Id of the user sending the chunk
+
+    Raises:
+        FileNotFoundError: If the upload was never initialised
+        PermissionError: If the upload was started by another user
+        ValueError: If the chunk is not part of the manifest or its size or content does
+            not match its manifest entry
+    """
+    upload_dir = _upload_dir(root, upload_id)
+    _check_hash(chunk_hash, "chunk")
+    manifest = load_manifest(root, upload_id)
+    if manifest.get("owner") != owner:
+        raise PermissionError("Upload belongs to another user")
+    sizes = {chunk["sha256"]: chunk["size"] for chunk in manifest["chunks"]}
+    expected_size = sizes.get(chunk_hash)
+    if expected_size is None:
+        raise ValueError("Chunk is not part of this upload")
+
+    chunk_path = _chunk_path(upload_dir, chunk_hash)
+    if os.path.exists(chunk_path):  # identical content already received
+        return
+
+    digest = hashlib.sha256()
+    size = 0
+    temp_path = f"{chunk_path}.{os.getpid()}.{id(stream)}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            while True:
+                data = stream.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                if size > expected_size:
+                    raise ValueError("Chunk is larger than its manifest entry")
+                digest.update(data)
+                f.write(data)
+
+        if size != expected_size:
+            raise ValueError("Chunk is smaller than its manifest entry")
+        if digest.hexdigest() != chunk_hash:
+            raise ValueError("Chunk content does not match its checksum")
+        os.replace(temp_path, chunk_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only, seekable file over a list of chunk files laid end to end"""
+
+    def __init__(self, paths, sizes):
+        self._paths = paths
+        self._starts = [0]
+        for size in sizes:
+            self._starts.append(self._starts[-1] + size)
+        self._size = self._starts[-1]
+        self._pos = 0
+        self._open_index = None
+        self._open_file = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer):
+        if self._pos >= self._size:
+            return 0
+
+        index = bisect.bisect_right(self._starts, self._pos) - 1
+        if index != self._open_index:
+            if self._open_file is not None:
+                self._open_file.close()
+            self._open_file = open(self._paths[index], "rb")
+            self._open_index = index
+
+        # Reads stop at chunk boundaries, BufferedReader calls again for the rest
+        self._open_file.seek(self._pos - self._starts[index])
+        count = min(len(buffer), self._starts[index + 1] - self._pos)
+        data = self._open_file.read(count)
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        if self._open_file is not None:
+            self._open_file.close()
+            self._open_file = None
+        super().close()
+
+
+def open_upload(root, upload_id):
+    """
+    Open a complete upload as one seekable binary file, reading the stored chunks in place
+
+    Each chunk was checked against its own sha256 and size as it was stored, which says
+    nothing about the manifest's sha256 for the whole file. The file is read through once
+    here and checked against the upload id before it is handed back, so a file that is
+    not the one the manifest describes is never ingested.
+
+    Raises:
+        ValueError: If chunks are missing or the file does not match its checksum
+    """
+    upload_dir = _upload_dir(root, upload_id)
+    missing = missing_chunks(root, upload_id)
+    if missing:
+        raise ValueError(f"Upload is missing chunks {missing}")
+
+    chunks = load_manifest(root, upload_id)["chunks"]
+    reader = ChunkReader(
+        [_chunk_path(upload_dir, chunk["sha256"]) for chunk in chunks],
+        [chunk["size"] for chunk in chunks],
+    )
+    upload = io.BufferedReader(reader, buffer_size=COPY_BUFFER_SIZE)
+
+    digest = hashlib.sha256()
+    while True:
+        data = upload.read(COPY_BUFFER_SIZE)
+        if not data:
+            break
+        digest.update(data)
+
+    if digest.hexdigest() != upload_id:
+        upload.close()
+        raise ValueError("Upload does not match its checksum")
+
+    upload.seek(0)
+    return upload
+
+
+def discard_upload(root, upload_id):
+    """Remove a staged upload once it has been committed"""
+    shutil.rmtree(_upload_dir(root, upload_id), ignore_errors=True)
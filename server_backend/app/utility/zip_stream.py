@@ -0,0 +1,157 @@
+"""Zip archives produced as a stream of chunks
+
+``stream_zip`` writes entries through ``zipfile`` into a sink that is emptied after
+every block, so an export is sent to the client while it is being built and memory use
+is bounded by the block size (plus one central directory record per entry), not by the
+size of the study. zipfile writes each entry's sizes and CRC in a data descriptor after
+its data when the output is not seekable, and switches to zip64 for large files and
+archives on its own.
+
+Media is already compressed and is stored as is, everything else is deflated.
+``write_deflated`` adds an entry that was deflated elsewhere (the prebuilt exports
+compress in worker processes, at a level chosen per file type).
+"""
+
+import os
+import time
+import zipfile
+import zlib
+from urllib.parse import quote
+
+CHUNK_SIZE = 1024 * 1024
+
+STORED_EXTENSIONS = (
+    ".mp4",
+    ".webm",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".zip",
+    ".gz",
+    ".parquet",
+)
+
+# zlib levels by extension: text compresses well and is worth the effort, the raw
+# numeric trial streams gain little past the fastest level
+COMPRESSION_LEVELS = {".csv": 6, ".json": 6, ".txt": 6, ".fcol": 1}
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+class _ChunkSink:
+    """Write-only file object for zipfile, holding what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def compress_type_for(name):
+    if name.lower().endswith(STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def compression_level_for(name):
+    """zlib level for an entry, None when it is stored"""
+    extension = os.path.splitext(name)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return None
+    return COMPRESSION_LEVELS.get(extension, DEFAULT_COMPRESSION_LEVEL)
+
+
+def deflate(data, level):
+    """Raw deflate data as zip stores it, returns (compressed, crc32)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data)
+
+
+def write_deflated(zipf, name, compressed, crc, file_size):
+    """
+    Add an entry deflated elsewhere to a zip being written, without recompressing it
+
+    Writes the local header and data at the end of the archive and registers the entry,
+    the central directory is written by zipf.close() as for any other entry.
+    """
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0o600 << 16
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    zinfo.compress_size = len(compressed)
+    zinfo.header_offset = zipf.fp.tell()
+
+    zipf.fp.write(zinfo.FileHeader())
+    zipf.fp.write(compressed)
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[name] = zinfo
+    zipf.start_dir = zipf.fp.tell()
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """
+    Build a zip archive from entries, yielding it in chunks
+
+    Args:
+        entries: Iterable of (name in the archive, source), where source is bytes or a
+            binary file object opened for reading. File objects are read in chunk_size
+            blocks and closed once written.
+        chunk_size: Read size for file sources
+
+    Yields:
+        Consecutive pieces of the archive, no chunk holds more than one block of a file
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as zipf:
+        for name, source in entries:
+            zinfo = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            zinfo.compress_type = compress_type_for(name)
+
+            if isinstance(source, (bytes, bytearray)):
+                zinfo.file_size = len(source)
+                with zipf.open(zinfo, "w") as dest:
+                    dest.write(source)
+            else:
+                with source:
+                    # The expected size decides whether the entry needs zip64 headers
+                    zinfo.file_size = os.fstat(source.fileno()).st_size
+                    with zipf.open(zinfo, "w") as dest:
+                        for data in iter(lambda: source.read(chunk_size), b""):
+                            dest.write(data)
+                            chunk = sink.drain()
+                            if chunk:
+                                yield chunk
+
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+    # Central directory, written when the archive is closed
+    yield sink.drain()
+
+
+def zip_response(entries, download_name):
+    """Flask response streaming the archive of entries as a download"""
+    from flask import Response, stream_with_context
+
+    response = Response(
+        stream_with_context(stream_zip(entries)), mimetype="application/zip"
+    )
+    try:
+        download_name.encode("ascii")
+        disposition = {"filename": download_name}
+    except UnicodeEncodeError:
+        disposition = {"filename*": f"UTF-8''{quote(download_name)}"}
+    response.headers.set("Content-Disposition", "attachment", **disposition)
+    return response
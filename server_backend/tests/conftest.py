@@ -1,6 +1,9 @@
+from datetime import datetime, timedelta
+
 import pytest
 
 from app import create_app
+from app.utility.db_connection import get_db_connection
 
 
 @pytest.fixture
@@ -13,5 +16,136 @@ def app():
 @pytest.fixture
 def client(app):
     client = app.test_client()
-    client.post("/testing_reset_db")
+    client.post("/api/testing_reset_db")
     return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    # test_db reset to the sample data, requests of the app's test client share the connection
+    app.test_client().post("/api/testing_reset_db")
+    return get_db_connection()
+
+
+class StudyData:
+    """A study with one task and two factors in test_db, to add sessions and trials to"""
+
+    def __init__(self, conn, task_name="Typing", factor_names=("Quiet", "Loud")):
+        self.conn = conn
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(study_design_type_id) FROM study_design_type")
+        cur.execute(
+            """
+            INSERT INTO study (study_name, study_description, expected_participants, study_design_type_id)
+            VALUES (%s, %s, %s, %s)
+            """,
+            ("Test Study", "Test fixture", 2, cur.fetchone()[0]),
+        )
+        self.study_id = cur.lastrowid
+
+        cur.execute(
+            "INSERT INTO task (study_id, task_name) VALUES (%s, %s)",
+            (self.study_id, task_name),
+        )
+        self.task_id = cur.lastrowid
+
+        self.factor_ids = {}
+        for factor_name in factor_names:
+            cur.execute(
+                "INSERT INTO factor (study_id, factor_name) VALUES (%s, %s)",
+                (self.study_id, factor_name),
+            )
+            self.factor_ids[factor_name] = cur.lastrowid
+
+        self.start = datetime(2026, 1, 1, 10, 0, 0)
+        conn.commit()
+
+    def add_session(self, hours=0):
+        """New participant and session, sessions are numbered by creation time"""
+        cur = self.conn.cursor()
+        cur.execute("INSERT INTO participant (age) VALUES (%s)", (30,))
+        cur.execute(
+            """
+            INSERT INTO participant_session (participant_id, study_id, created_at)
+            VALUES (%s, %s, %s)
+            """,
+            (cur.lastrowid, self.study_id, self.start + timedelta(hours=hours)),
+        )
+        self.conn.commit()
+        return cur.lastrowid
+
+    def add_trial(self, participant_session_id, minutes=0, factor_name="Quiet"):
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO trial (participant_session_id, task_id, factor_id, started_at)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (
+                participant_session_id,
+                self.task_id,
+                self.factor_ids[factor_name],
+                self.start + timedelta(minutes=minutes),
+            ),
+        )
+        self.conn.commit()
+        return cur.lastrowid
+
+    def add_file(self, trial_id, measurement_option_name, results_path):
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO session_data_instance (trial_id, measurement_option_id, results_path)
+            SELECT %s, measurement_option_id, %s
+            FROM measurement_option WHERE measurement_option_name = %s
+            """,
+            (trial_id, str(results_path), measurement_option_name),
+        )
+        self.conn.commit()
+        return cur.lastrowid
+
+
+@pytest.fixture
+def study(db):
+    return StudyData(db)
+
+
+@pytest.fixture
+def other_study(db):
+    return StudyData(db)
+
+
+class CountingConnection:
+    """Passes everything to the connection and keeps each query its cursors run"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.queries = []
+
+    def cursor(self):
+        return CountingCursor(self.conn.cursor(), self.queries)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class CountingCursor:
+    def __init__(self, cursor, queries):
+        self.cursor = cursor
+        self.queries = queries
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        return self.cursor.execute(query, params)
+
+    def executemany(self, query, rows):
+        self.queries.append(query)
+        return self.cursor.executemany(query, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+@pytest.fixture
+def counted_db(db):
+    return CountingConnection(db)
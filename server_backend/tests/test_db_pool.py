@@ -0,0 +1,113 @@
+import os
+import sys
+import threading
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.queries.append((query, params))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Stands in for a MySQLdb connection, alive until the test drops it"""
+
+    def __init__(self):
+        self.queries = []
+        self.rollbacks = 0
+        self.alive = True
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if not self.alive:
+            raise OSError("server has gone away")
+        self.rollbacks += 1
+
+    def ping(self):
+        if not self.alive:
+            raise OSError("server has gone away")
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect(**connect_args):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    pool = ConnectionPool({"db": "test_db"}, connect=connect, **kwargs)
+    return pool, opened
+
+
+def test_connections_are_reused_and_bounded():
+    pool, opened = make_pool(max_size=2, wait_timeout=0.05)
+
+    first = pool.checkout()
+    first.cursor().execute("SELECT 1")
+    first.close()
+    first.close()  # A second close is a no-op
+
+    again = pool.checkout()
+    assert len(opened) == 1
+    assert opened[0].rollbacks == 1
+    assert opened[0].queries[0] == ("SET SESSION MAX_EXECUTION_TIME = %s", (60000,))
+
+    other = pool.checkout()
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+
+    # A connection returned by another thread wakes a waiting checkout
+    threading.Timer(0.01, other.close).start()
+    pool.wait_timeout = 2
+    waited = pool.checkout()
+
+    stats = pool.stats()
+    assert len(opened) == 2
+    assert (stats["open"], stats["in_use"], stats["idle"]) == (2, 2, 0)
+    assert (stats["checkouts"], stats["waits"], stats["timeouts"]) == (4, 2, 1)
+
+    again.close()
+    waited.close()
+    assert pool.stats()["idle"] == 2
+
+
+def test_dropped_connections_are_replaced():
+    pool, opened = make_pool(max_size=1, ping_after=0, statement_timeout_ms=None)
+
+    conn = pool.checkout()
+    conn.close()
+    opened[0].alive = False
+
+    # The idle connection fails its ping and a new one takes its slot
+    conn = pool.checkout()
+    assert opened[0].closed and len(opened) == 2
+    assert opened[1].queries == []
+
+    # A connection that breaks while checked out is closed when returned
+    opened[1].alive = False
+    conn.close()
+    stats = pool.stats()
+    assert (stats["open"], stats["discarded"], stats["health_check_failures"]) == (
+        0,
+        1,
+        1,
+    )
+    with pytest.raises(RuntimeError):
+        conn.cursor()
@@ -0,0 +1,99 @@
+import os
+import sys
+import zipfile
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.export_builder import (
+    claim_export_build,
+    get_export_watermark,
+    release_export_build,
+    write_export_zip,
+)
+
+
+def test_export_zip_compresses_by_file_type(tmp_path):
+    csv = b"running_time,x,y\n" + b"0.5,10,20\n" * 5000
+    video = os.urandom(50000)
+    (tmp_path / "moves.csv").write_bytes(csv)
+    (tmp_path / "screen.mp4").write_bytes(video)
+    (tmp_path / "survey.csv").write_bytes(b"q1,a1\n")
+
+    files = [
+        (
+            "1_participant_session/T_F_trial_1/Mouse Movement.csv",
+            tmp_path / "moves.csv",
+        ),
+        (
+            "1_participant_session/T_F_trial_1/Screen Recording.mp4",
+            tmp_path / "screen.mp4",
+        ),
+        ("1_participant_session/T_F_trial_1/Mouse Clicks.csv", tmp_path / "lost.csv"),
+        ("1_participant_session/T_F_trial_1/Heat Map.png", tmp_path / "lost.png"),
+    ]
+    files = [(name, str(path)) for name, path in files]
+    surveys = [
+        ("1_participant_session/pre_survey/survey.csv", str(tmp_path / "survey.csv"))
+    ]
+
+    path = tmp_path / "export.zip"
+    write_export_zip(files, surveys, str(path), processes=2)
+
+    with zipfile.ZipFile(path) as zipf:
+        assert zipf.testzip() is None
+        infos = {info.filename.split("/")[-1]: info for info in zipf.infolist()}
+        # The unreadable CSV gets a placeholder, the unreadable image is left out
+        assert list(infos) == [
+            "Mouse Movement.csv",
+            "Screen Recording.mp4",
+            "Mouse Clicks.csv",
+            "survey.csv",
+        ]
+        assert infos["Mouse Movement.csv"].compress_type == zipfile.ZIP_DEFLATED
+        assert infos["Mouse Movement.csv"].compress_size < len(csv) // 10
+        assert zipf.read(infos["Mouse Movement.csv"]) == csv
+        assert infos["Screen Recording.mp4"].compress_type == zipfile.ZIP_STORED
+        assert zipf.read(infos["Screen Recording.mp4"]) == video
+        assert zipf.read(infos["Mouse Clicks.csv"]).startswith(b"timestamp,")
+
+
+def test_one_export_build_at_a_time(tmp_path):
+    root = str(tmp_path)
+    assert claim_export_build(root, 4)
+    assert not claim_export_build(root, 4)
+    assert claim_export_build(root, 5)
+
+    release_export_build(root, 4)
+    assert claim_export_build(root, 4)
+
+
+def test_watermark_follows_survey_resubmission(db, study, tmp_path):
+    participant_session_id = study.add_session()
+    survey_path = tmp_path / "pre_survey_results.json"
+    survey_path.write_text('{"q1": "a1"}')
+
+    cur = db.cursor()
+    cur.execute(
+        "INSERT INTO survey_form (study_id, form_type, file_path) VALUES (%s, 'pre', %s)",
+        (study.study_id, str(tmp_path / "pre.json")),
+    )
+    cur.execute(
+        """
+        INSERT INTO survey_results (survey_form_id, participant_session_id, file_path)
+        VALUES (%s, %s, %s)
+        """,
+        (cur.lastrowid, participant_session_id, str(survey_path)),
+    )
+    db.commit()
+    watermark = get_export_watermark(cur, study.study_id)
+    assert get_export_watermark(cur, study.study_id) == watermark
+
+    # Re-submitting rewrites the same file and keeps the row
+    survey_path.write_text('{"q1": "a2", "q2": "b"}')
+    resubmitted = get_export_watermark(cur, study.study_id)
+    assert resubmitted != watermark
+
+    trial_id = study.add_trial(participant_session_id)
+    study.add_file(trial_id, "Mouse Clicks", tmp_path / "clicks.csv")
+    assert get_export_watermark(cur, study.study_id) not in (watermark, resubmitted)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sys
+import zipfile
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility import ingest
+from app.utility.blob_store import blob_path
+from app.utility.ingest import IngestError, ingest_session, plan_session_ingest
+
+
+@pytest.fixture(autouse=True)
+def clear_option_cache():
+    ingest._measurement_option_ids.clear()
+
+
+@pytest.fixture
+def session_zip(tmp_path):
+    path = tmp_path / "session_results.zip"
+    with zipfile.ZipFile(path, "w") as zipf:
+        for folder, files in {
+            "Typing_Quiet_trial_1": [
+                "Mouse Movement.fcol",
+                "Heat Map.png",
+                "notes.txt",
+            ],
+            "Typing_Loud_trial_2": ["Keyboard Inputs.fcol"],
+        }.items():
+            for name in files:
+                zipf.writestr(f"{folder}/{name}", b"data")
+        zipf.writestr("Typing_Loud_trial_3/", b"")
+    with zipfile.ZipFile(path) as zip_ref:
+        yield zip_ref
+
+
+TRIALS = [
+    {"taskID": 1, "factorID": 1, "startedAt": "2026-01-01 10:00:00"},
+    {"taskID": 1, "factorID": 2, "startedAt": "2026-01-01 10:05:00"},
+]
+
+
+def study_trials(study):
+    # TRIALS with the ids of the test study's task and factors
+    factor_ids = list(study.factor_ids.values())
+    return [
+        dict(trial, taskID=study.task_id, factorID=factor_ids[trial["factorID"] - 1])
+        for trial in TRIALS
+    ]
+
+
+def test_plan_matches_trial_folders(session_zip):
+    plan = plan_session_ingest(session_zip, TRIALS + TRIALS[:1])
+    assert [name for _, name, _ in plan[0][1]] == ["Heat Map", "Mouse Movement"]
+    assert [name for _, name, _ in plan[1][1]] == ["Keyboard Inputs"]
+    assert plan[2][1] == []  # empty trial folder
+
+    with pytest.raises(IngestError):
+        plan_session_ingest(session_zip, TRIALS * 2)
+
+
+def get_session_files(cur, participant_session_id):
+    cur.execute(
+        """
+        SELECT sdi.session_data_instance_id, sdi.trial_id, mo.measurement_option_name, sdi.results_path, sdi.size_bytes, sdi.sha256
+        FROM session_data_instance sdi
+        JOIN measurement_option mo ON sdi.measurement_option_id = mo.measurement_option_id
+        JOIN trial t ON sdi.trial_id = t.trial_id
+        WHERE t.participant_session_id = %s
+        ORDER BY sdi.session_data_instance_id
+        """,
+        (participant_session_id,),
+    )
+    return cur.fetchall()
+
+
+def test_ingest_batches_rows_and_streams_files(
+    counted_db, study, session_zip, tmp_path
+):
+    participant_session_id = study.add_session()
+    plan = plan_session_ingest(session_zip, study_trials(study))
+    results = tmp_path / "results"
+
+    stored = ingest_session(
+        counted_db, session_zip, plan, str(results), participant_session_id
+    )
+    # options, trials, id check, instances, id check, paths
+    assert len(counted_db.queries) == 6
+
+    rows = get_session_files(counted_db.cursor(), participant_session_id)
+    assert [f["session_data_instance_id"] for f in stored] == [row[0] for row in rows]
+    trial_1, trial_2 = rows[0][1], rows[2][1]
+    assert [(row[1], row[2]) for row in rows] == [
+        (trial_1, "Heat Map"),
+        (trial_1, "Mouse Movement"),
+        (trial_2, "Keyboard Inputs"),
+    ]
+    assert [f["trial_id"] for f in stored] == [trial_1, trial_1, trial_2]
+    assert stored[0]["size"] == rows[0][4] == 4
+    assert stored[0]["sha256"] == rows[0][5] == hashlib.sha256(b"data").hexdigest()
+
+    # Both streams have the same content, so they share one blob
+    expected = blob_path(str(results), stored[0]["sha256"], ".fcol")
+    assert rows[1][3] == rows[2][3] == expected
+    assert open(expected, "rb").read() == b"data"
+    assert rows[0][3].endswith(".png")
+
+    # Option lookup is cached for the next session
+    counted_db.queries.clear()
+    plan = plan_session_ingest(session_zip, study_trials(study))
+    ingest_session(counted_db, session_zip, plan, str(results), study.add_session())
+    assert len(counted_db.queries) == 5
+
+
+def test_failed_ingest_rolls_back(db, study, session_zip, tmp_path):
+    participant_session_id = study.add_session()
+    plan = plan_session_ingest(session_zip, study_trials(study))
+    results = tmp_path / "results"
+
+    # The second file cannot be stored, after the first one already was
+    sha256 = hashlib.sha256(b"data").hexdigest()
+    os.makedirs(blob_path(str(results), sha256, ".fcol"))
+
+    with pytest.raises(OSError):
+        ingest_session(db, session_zip, plan, str(results), participant_session_id)
+    assert os.listdir(results / "blobs" / "tmp") == []
+
+    cur = db.cursor()
+    cur.execute(
+        "SELECT COUNT(*) FROM trial WHERE participant_session_id = %s",
+        (participant_session_id,),
+    )
+    assert cur.fetchone()[0] == 0
+    assert not get_session_files(cur, participant_session_id)
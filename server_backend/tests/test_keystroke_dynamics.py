@@ -0,0 +1,72 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.analytics.data_processor import (
+    keystroke_dynamics,
+    process_keyboard_data,
+)
+
+A, B, BACKSPACE = 65, 66, 8
+
+
+@pytest.fixture
+def keyboard_df():
+    # "a" (held with auto-repeat), "b" overlapping it, then backspace after a 3s pause
+    events = [
+        (0.00, A, 1, "a"),
+        (0.05, A, 1, "a"),
+        (0.10, B, 1, "b"),
+        (0.12, A, 0, "a"),
+        (0.20, B, 0, "b"),
+        (3.20, BACKSPACE, 1, "Key.backspace"),
+        (3.30, BACKSPACE, 0, "Key.backspace"),
+    ]
+    t, vk, pressed, keys = zip(*events)
+    return pd.DataFrame(
+        {
+            "running_time": t,
+            "keys": pd.Categorical(keys),
+            "vk": vk,
+            "pressed": pressed,
+        }
+    )
+
+
+def test_dwell_flight_and_bursts(keyboard_df):
+    dynamics = keystroke_dynamics(
+        keyboard_df["running_time"],
+        keyboard_df["vk"],
+        keyboard_df["pressed"],
+        keyboard_df["keys"].isin(["Key.backspace"]),
+    )
+
+    assert dynamics["keystrokes"] == 3
+    assert dynamics["autorepeat_count"] == 1
+    assert dynamics["corrections"] == 1
+    # dwell a=120ms, b=100ms, backspace=100ms
+    assert dynamics["median_dwell_ms"] == pytest.approx(100)
+    # flight a->b is -20ms (rollover), b->backspace is 3000ms
+    assert dynamics["mean_flight_ms"] == pytest.approx(1490)
+    assert dynamics["burst_count"] == 2
+    assert dynamics["mean_burst_length"] == 1.5
+
+
+def test_unpaired_press_has_no_dwell():
+    dynamics = keystroke_dynamics([0.0, 0.5], [A, -1], [1, 1], [False, False])
+    assert dynamics["keystrokes"] == 2
+    assert dynamics["mean_dwell_ms"] == 0
+    assert dynamics["mean_flight_ms"] == 0
+
+
+def test_process_keyboard_data_uses_key_events(keyboard_df):
+    metrics = process_keyboard_data(keyboard_df)
+    assert metrics["total_keypresses"] == 3
+    assert metrics["correction_count"] == 1
+    assert metrics["typing_speed"] == pytest.approx(3 / 3.3)
+    assert metrics["burst_count"] == 2
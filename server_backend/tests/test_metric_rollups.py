@@ -0,0 +1,85 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.analytics.metric_rollups import (
+    empty_rollup,
+    get_study_rollup,
+    get_task_rollups,
+    merge_values,
+    rollup_stats,
+    update_rollups,
+)
+
+
+def test_merge_values_matches_numpy():
+    values = [3.0, 12.5, 7.0, 45.0, 700.0]
+    rollup = empty_rollup("duration_s")
+    merge_values(rollup, "duration_s", values)
+
+    stats = rollup_stats(rollup, "duration_s")
+    assert stats["count"] == 5
+    assert stats["mean"] == pytest.approx(np.mean(values))
+    assert stats["std"] == pytest.approx(np.std(values))
+    assert (stats["min"], stats["max"]) == (3.0, 700.0)
+    # edges 0, 5, 10, 20, 30, 60, 120, 300, 600
+    assert stats["histogram"]["counts"] == [1, 1, 1, 0, 1, 0, 0, 0, 1]
+
+    # Removing a value that is not an extreme keeps min/max exact
+    assert not merge_values(rollup, "duration_s", removed=[12.5])
+    stats = rollup_stats(rollup, "duration_s")
+    assert stats["mean"] == pytest.approx(np.mean([3.0, 7.0, 45.0, 700.0]))
+    assert stats["histogram"]["counts"][2] == 0
+
+    # Removing the max flags min/max for a re-read
+    assert merge_values(rollup, "duration_s", removed=[700.0])
+
+    # Removing everything resets the rollup
+    merge_values(rollup, "duration_s", removed=[3.0, 7.0, 45.0])
+    assert rollup == empty_rollup("duration_s")
+
+
+def set_trial_metrics(cur, trial_id, duration_s, click_count=None):
+    cur.execute(
+        """
+        INSERT INTO trial_metrics (trial_id, duration_s, click_count, metrics_json)
+        VALUES (%s, %s, %s, '{}')
+        ON DUPLICATE KEY UPDATE duration_s = VALUES(duration_s), click_count = VALUES(click_count)
+        """,
+        (trial_id, duration_s, click_count),
+    )
+
+
+def test_update_rollups_replaces_a_trials_values(db, study):
+    session = study.add_session()
+    trial_1 = study.add_trial(session, minutes=0)
+    trial_2 = study.add_trial(session, minutes=5)
+    cur = db.cursor()
+
+    set_trial_metrics(cur, trial_1, 10.0, 4)
+    update_rollups(cur, trial_1, {}, {"duration_s": 10.0, "click_count": 4.0})
+    set_trial_metrics(cur, trial_2, 30.0)
+    update_rollups(cur, trial_2, {}, {"duration_s": 30.0})
+
+    # Trial 2 is recomputed with a shorter duration, the old max has to be re-read
+    set_trial_metrics(cur, trial_2, 20.0)
+    update_rollups(cur, trial_2, {"duration_s": 30.0}, {"duration_s": 20.0})
+    db.commit()
+
+    for rollup in (
+        get_study_rollup(cur, study.study_id),
+        get_task_rollups(cur, study.study_id)[study.task_id],
+    ):
+        duration = rollup["duration_s"]
+        assert duration["count"] == 2
+        assert duration["mean"] == pytest.approx(15.0)
+        assert duration["std"] == pytest.approx(5.0)
+        assert (duration["min"], duration["max"]) == (10.0, 20.0)
+        assert duration["histogram"]["counts"] == [0, 0, 1, 1, 0, 0, 0, 0, 0]
+
+        clicks = rollup["click_count"]
+        assert (clicks["count"], clicks["mean"], clicks["std"]) == (1, 4.0, 0.0)
@@ -0,0 +1,85 @@
+import io
+import os
+import sys
+import zipfile
+from datetime import datetime
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.parquet_export import get_parquet_entries
+from app.utility.zip_stream import stream_zip
+from test_trial_streams import build_stream
+
+
+def test_parquet_export_is_typed_and_partitioned(tmp_path):
+    keyboard = tmp_path / "Keyboard Inputs.fcol"
+    keyboard.write_bytes(
+        build_stream(
+            {
+                "t_ns": np.array([250_000_000, 400_000_000], dtype=np.int64),
+                "code": np.array([0, 0], dtype=np.int32),
+                "vk": np.array([65, 65], dtype=np.int32),
+                "pressed": np.array([1, 0], dtype=np.int32),
+            },
+            {"keys": ["a"], "trial_start_wall": 0, "utc_offset_s": 0},
+        )
+    )
+    moves = tmp_path / "Mouse Movement.csv"
+    moves.write_bytes(
+        b"Time,running_time,x,y\n10:00:00,0.5,10,20\n10:00:01,1.5,12,24\n"
+    )
+    heat_map = tmp_path / "Heat Map.png"
+    heat_map.write_bytes(b"\x89PNG")
+
+    rows = [
+        ("Study", 1, str(keyboard), 101, 3, "Typing", 4, "Keyboard Inputs")
+        + (1, "Quiet", 11),
+        ("Study", 2, str(moves), 102, 5, "Pointing", 1, "Mouse Movement")
+        + (2, "Loud", 12),
+        ("Study", 3, str(heat_map), 102, 5, "Pointing", 6, "Heat Map")
+        + (2, "Loud", 12),
+        ("Study", 4, str(tmp_path / "lost.csv"), 103, 5, "Pointing", 1)
+        + ("Mouse Movement", 2, "Loud", 12),
+    ]
+    started = datetime(2025, 3, 1, 10, 0, 0)
+    summary_rows = [
+        (11, 3, 101, 7, "Typing", 1, "Quiet", started, None, 12.5, None)
+        + (None, None, None, None, 2, 0, 40.0),
+        (12, 5, 102, 8, "Pointing", 2, "Loud", started, started, 3.0, 3.5)
+        + (14.0, 9.0, 0.9, 4, None, None, None),
+        (12, 5, 103, 8, "Pointing", 2, "Loud", started, None, None, None) + (None,) * 7,
+    ]
+
+    archive = b"".join(stream_zip(get_parquet_entries(rows, summary_rows)))
+    with zipfile.ZipFile(io.BytesIO(archive)) as zipf:
+        assert sorted(zipf.namelist()) == [
+            "keyboard/participant_session_id=11/task_id=3/trial_101.parquet",
+            "mouse_movement/participant_session_id=12/task_id=5/trial_102.parquet",
+            "trial_summary/participant_session_id=11/task_id=3/trials.parquet",
+            "trial_summary/participant_session_id=12/task_id=5/trials.parquet",
+        ]
+        # Parquet is compressed already
+        assert {info.compress_type for info in zipf.infolist()} == {zipfile.ZIP_STORED}
+        zipf.extractall(tmp_path / "export")
+
+    keyboard_data = ds.dataset(tmp_path / "export" / "keyboard", partitioning="hive")
+    table = keyboard_data.to_table()
+    assert table.schema.field("keys").type == pa.dictionary(pa.int32(), pa.string())
+    assert table.column("pressed").to_pylist() == [1, 0]
+    assert table.column("participant_session_id").to_pylist() == [11, 11]
+
+    moves_data = ds.dataset(
+        tmp_path / "export" / "mouse_movement", partitioning="hive"
+    ).to_table()
+    assert moves_data.schema.field("x").type == pa.int32()
+    assert moves_data.column("factor_id").to_pylist() == [2, 2]
+
+    summary = ds.dataset(tmp_path / "export" / "trial_summary", partitioning="hive")
+    loud = summary.to_table(filter=ds.field("participant_session_id") == 12)
+    assert loud.column("trial_id").to_pylist() == [102, 103]
+    assert loud.column("click_count").to_pylist() == [4, None]
+    assert loud.schema.field("started_at").type == pa.timestamp("ms")
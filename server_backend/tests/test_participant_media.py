@@ -0,0 +1,54 @@
+import os
+import sys
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.blob_store import store_blob
+
+
+def test_media_is_found_through_results_paths(app, db, study, tmp_path):
+    participant_session_id = study.add_session()
+    trial_id = study.add_trial(participant_session_id)
+    cur = db.cursor()
+    cur.execute(
+        "SELECT participant_id FROM participant_session WHERE participant_session_id = %s",
+        (participant_session_id,),
+    )
+    participant_id = cur.fetchone()[0]
+
+    # Stored content-addressed, like an upload
+    results = str(tmp_path / "results")
+    for name, extension, content in (
+        ("Screen Recording", ".mp4", b"video"),
+        ("Heat Map", ".png", b"\x89PNG"),
+        ("Mouse Movement", ".csv", b"running_time,x,y\n"),
+    ):
+        source = tmp_path / f"upload{extension}"
+        source.write_bytes(content)
+        with open(source, "rb") as f:
+            path = store_blob(f, results, extension)[0]
+        study.add_file(trial_id, name, path)
+
+    client = app.test_client()
+    response = client.get(
+        f"/api/analytics/participant-media/{study.study_id}/{participant_id}"
+    )
+    assert response.status_code == 200
+    assert response.get_json()["trials"] == {
+        str(trial_id): {
+            "screenshots": ["Heat Map.png"],
+            "videos": ["Screen Recording.mp4"],
+        }
+    }
+
+    media_url = f"/api/analytics/media/{study.study_id}/{participant_id}/{trial_id}"
+    response = client.get(f"{media_url}/Screen Recording.mp4")
+    assert response.status_code == 200
+    assert response.mimetype == "video/mp4"
+    assert response.data == b"video"
+
+    # Only media of the participant's own trials is served
+    assert client.get(f"{media_url}/Mouse Movement.csv").status_code == 404
+    other_url = f"/api/analytics/media/{study.study_id}/{participant_id + 1}/{trial_id}"
+    assert client.get(f"{other_url}/Heat Map.png").status_code == 404
@@ -0,0 +1,245 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import create_app
+from app.utility.db_connection import get_db_connection
+from app.utility.sessions import (
+    get_all_participant_session_csv_files,
+    get_all_study_csv_files,
+    get_file_name_for_folder,
+    get_one_trial,
+    get_participant_name_for_folder,
+    get_participant_session_name_for_folder,
+    get_survey_files_for_folder,
+    get_trial_order_for_folder,
+    get_trial_orders_for_folder,
+    verify_study_files,
+)
+from app.utility.analytics.data_processor import (
+    clear_cache,
+    get_learning_curve_data,
+    get_study_summary,
+    get_task_performance_data,
+)
+from app.utility.analytics.metric_rollups import (
+    get_study_rollup,
+    get_task_rollups,
+    rebuild_rollups,
+)
+from app.routes.analytics import (
+    calculate_study_average_time_from_csv,
+    calculate_summary_pvalue,
+)
+
+# Large enough that a full scan of trial or session_data_instance stands out in the plan
+STUDIES = 20
+TASKS_PER_STUDY = 4
+FACTORS_PER_STUDY = 2
+SESSIONS_PER_STUDY = 50
+TRIALS_PER_SESSION = 10
+MEASUREMENTS = (1, 3, 4, 5)
+
+# A plan row may only read the whole table (type ALL) or index (type index) below this
+MAX_SCAN_ROWS = 500
+
+
+class ExplainCursor:
+    """Runs EXPLAIN on every SELECT before executing it and keeps the plans that scan"""
+
+    def __init__(self, cursor, violations):
+        self.cursor = cursor
+        self.violations = violations
+
+    def execute(self, query, params=None):
+        if query.lstrip().upper().startswith("SELECT"):
+            self.cursor.execute("EXPLAIN " + query, params)
+            columns = [column[0] for column in self.cursor.description]
+            for row in self.cursor.fetchall():
+                plan = dict(zip(columns, row))
+                if (
+                    plan["type"] in ("ALL", "index")
+                    and (plan["rows"] or 0) > MAX_SCAN_ROWS
+                ):
+                    self.violations.append((" ".join(query.split()), plan))
+        return self.cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class ExplainConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.violations = []
+
+    def cursor(self):
+        return ExplainCursor(self.conn.cursor(), self.violations)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def load_large_study_set(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(study_design_type_id) FROM study_design_type")
+    design_type_id = cur.fetchone()[0]
+
+    start = datetime(2025, 1, 1)
+    study_ids = []
+    for s in range(STUDIES):
+        cur.execute(
+            """
+            INSERT INTO study (study_name, study_description, expected_participants, study_design_type_id)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (
+                f"Plan Study {s}",
+                "Query plan fixture",
+                SESSIONS_PER_STUDY,
+                design_type_id,
+            ),
+        )
+        study_id = cur.lastrowid
+        study_ids.append(study_id)
+
+        task_ids, factor_ids = [], []
+        for n in range(TASKS_PER_STUDY):
+            cur.execute(
+                "INSERT INTO task (study_id, task_name) VALUES (%s, %s)",
+                (study_id, f"Task {n}"),
+            )
+            task_ids.append(cur.lastrowid)
+        for n in range(FACTORS_PER_STUDY):
+            cur.execute(
+                "INSERT INTO factor (study_id, factor_name) VALUES (%s, %s)",
+                (study_id, f"Factor {n}"),
+            )
+            factor_ids.append(cur.lastrowid)
+
+        for p in range(SESSIONS_PER_STUDY):
+            cur.execute("INSERT INTO participant (age) VALUES (%s)", (20 + p % 40,))
+            participant_id = cur.lastrowid
+            created_at = start + timedelta(hours=s * SESSIONS_PER_STUDY + p)
+            cur.execute(
+                """
+                INSERT INTO participant_session (participant_id, study_id, created_at, ended_at)
+                VALUES (%s, %s, %s, %s)
+                """,
+                (
+                    participant_id,
+                    study_id,
+                    created_at,
+                    created_at + timedelta(minutes=30),
+                ),
+            )
+            participant_session_id = cur.lastrowid
+
+            for n in range(TRIALS_PER_SESSION):
+                started_at = created_at + timedelta(minutes=2 * n)
+                cur.execute(
+                    """
+                    INSERT INTO trial (participant_session_id, task_id, factor_id, started_at, ended_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    (
+                        participant_session_id,
+                        task_ids[n % TASKS_PER_STUDY],
+                        factor_ids[n % FACTORS_PER_STUDY],
+                        started_at,
+                        started_at + timedelta(seconds=30 + n),
+                    ),
+                )
+                trial_id = cur.lastrowid
+                cur.executemany(
+                    """
+                    INSERT INTO session_data_instance (trial_id, measurement_option_id, results_path, size_bytes)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    [
+                        (trial_id, option_id, f"/nonexistent/{trial_id}_{option_id}", 0)
+                        for option_id in MEASUREMENTS
+                    ],
+                )
+                cur.execute(
+                    """
+                    INSERT INTO trial_metrics (trial_id, duration_s, click_count, keypresses, corrections, metrics_json)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    (trial_id, 30.0 + n, n, 10 * n, n % 3, "{}"),
+                )
+
+        rebuild_rollups(cur, study_id)
+
+    cur.execute(
+        "ANALYZE TABLE study, task, factor, participant, participant_session, trial, session_data_instance, trial_metrics"
+    )
+    cur.fetchall()
+    conn.commit()
+    return study_ids
+
+
+@pytest.fixture(scope="module")
+def plan_db():
+    app = create_app(testing=True)
+    with app.app_context():
+        app.test_client().post("/api/testing_reset_db")
+        conn = get_db_connection()
+        study_ids = load_large_study_set(conn)
+        yield ExplainConnection(conn), study_ids[len(study_ids) // 2]
+
+
+def assert_no_scans(conn):
+    details = "\n".join(f"{plan}\n  {query}" for query, plan in conn.violations)
+    assert not conn.violations, f"Queries scanning large tables:\n{details}"
+
+
+def test_export_queries_use_indexes(plan_db):
+    conn, study_id = plan_db
+    cur = conn.cursor()
+
+    rows = get_all_study_csv_files(study_id, cur)
+    assert len(rows) == SESSIONS_PER_STUDY * TRIALS_PER_SESSION * len(MEASUREMENTS)
+
+    participant_session_id, trial_id = rows[0][-1], rows[0][3]
+    assert get_trial_order_for_folder(participant_session_id, cur)
+    sessions = get_participant_session_name_for_folder(study_id, cur)
+    assert len(get_trial_orders_for_folder(sessions, cur)) == len(rows) // len(
+        MEASUREMENTS
+    )
+    assert get_survey_files_for_folder(sessions, cur) == {}
+    assert get_participant_session_name_for_folder(study_id, cur)
+    assert get_participant_name_for_folder(study_id, cur)
+    assert get_file_name_for_folder(study_id, cur)
+    assert get_all_participant_session_csv_files(participant_session_id, cur)
+    assert get_one_trial(trial_id, cur)
+    assert len(verify_study_files(study_id, cur)) > 0
+
+    assert_no_scans(conn)
+
+
+def test_analytics_queries_use_indexes(plan_db):
+    conn, study_id = plan_db
+    cur = conn.cursor()
+
+    duration = get_study_rollup(cur, study_id)["duration_s"]
+    assert duration["count"] == SESSIONS_PER_STUDY * TRIALS_PER_SESSION
+    assert len(get_task_rollups(cur, study_id)) == TASKS_PER_STUDY
+
+    # Results cached by an earlier test would skip the queries
+    clear_cache()
+    get_study_summary(conn, study_id)
+    get_learning_curve_data(conn, study_id)
+    get_task_performance_data(conn, study_id)
+
+    calculate_summary_pvalue(cur, study_id)
+    average, _, count = calculate_study_average_time_from_csv(study_id, cursor=cur)
+    assert count == SESSIONS_PER_STUDY * TRIALS_PER_SESSION
+    assert average == pytest.approx(duration["mean"])
+
+    assert_no_scans(conn)
@@ -0,0 +1,66 @@
+import base64
+import os
+import sys
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.blob_store import BLOB_DIR
+from app.utility.studies import (
+    copy_consent_form,
+    copy_survey_form,
+    remove_study_consent_form,
+    save_study_consent_form,
+    save_study_survey_form,
+)
+
+
+def form_file(filename, content):
+    return {"filename": filename, "content": base64.b64encode(content).decode()}
+
+
+def stored_blobs(root):
+    return [
+        name
+        for _, _, names in os.walk(os.path.join(root, BLOB_DIR))
+        for name in names
+        if not name.endswith(".part")
+    ]
+
+
+def form_path(cur, table, study_id):
+    cur.execute(f"SELECT file_path FROM {table} WHERE study_id = %s", (study_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+# A duplicated study points at the same stored form, removing it from one study leaves the other's intact
+def test_duplicated_study_shares_its_forms(db, study, other_study, tmp_path):
+    root = str(tmp_path)
+    cur = db.cursor()
+
+    save_study_consent_form(
+        study.study_id, form_file("consent.pdf", b"%PDF-1.4 consent"), cur, root
+    )
+    save_study_survey_form(
+        study.study_id, form_file("pre.json", b'{"q1": "Age"}'), cur, root, "pre"
+    )
+    assert (
+        copy_consent_form(study.study_id, other_study.study_id, cur, root) == "success"
+    )
+    assert copy_survey_form(study.study_id, other_study.study_id, cur, root, "pre") == (
+        "success"
+    )
+    db.commit()
+
+    consent_path = form_path(cur, "consent_form", study.study_id)
+    assert form_path(cur, "consent_form", other_study.study_id) == consent_path
+    assert form_path(cur, "survey_form", other_study.study_id) == form_path(
+        cur, "survey_form", study.study_id
+    )
+    assert len(stored_blobs(root)) == 2
+
+    remove_study_consent_form(study.study_id, cur)
+    db.commit()
+    assert form_path(cur, "consent_form", study.study_id) is None
+    assert os.path.isfile(consent_path)
@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+import pandas as pd
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.analytics.metric_rollups import get_study_rollup
+from app.utility.analytics.trial_metrics import (
+    compute_trial_metrics,
+    store_trial_metrics,
+)
+
+
+@pytest.fixture
+def trial_files(tmp_path):
+    movement = tmp_path / "1.csv"
+    pd.DataFrame(
+        {"running_time": [0.0, 1.0, 2.0], "x": [0, 3, 3], "y": [0, 4, 8]}
+    ).to_csv(movement, index=False)
+
+    clicks = tmp_path / "2.csv"
+    pd.DataFrame(
+        {"running_time": [0.5, 0.7, 4.0], "x": [1, 1, 2], "y": [1, 1, 2]}
+    ).to_csv(clicks, index=False)
+
+    heatmap = tmp_path / "3.png"
+    heatmap.write_bytes(b"not parsed")
+
+    return [
+        ("Mouse Movement", str(movement)),
+        ("Mouse Clicks", str(clicks)),
+        ("Heat Map", str(heatmap)),
+    ]
+
+
+def test_compute_trial_metrics(trial_files):
+    metrics = compute_trial_metrics(trial_files)
+
+    # Longest stream sets the trial duration
+    assert metrics["duration_s"] == 4.0
+    assert metrics["video_length_s"] is None
+    assert metrics["mouse_movement"]["total_distance"] == pytest.approx(9.0)
+    assert metrics["mouse_clicks"]["total_clicks"] == 3
+    assert "keyboard" not in metrics
+
+
+def test_store_trial_metrics_upserts_one_row(db, study, trial_files):
+    trial_id = study.add_trial(study.add_session())
+    for measurement_option_name, results_path in trial_files:
+        study.add_file(trial_id, measurement_option_name, results_path)
+
+    # Computing twice replaces the row and the trial's rolled up values
+    store_trial_metrics(db, trial_id)
+    store_trial_metrics(db, trial_id)
+
+    cur = db.cursor()
+    cur.execute(
+        """
+        SELECT duration_s, video_length_s, mouse_distance, click_count, metrics_json
+        FROM trial_metrics WHERE trial_id = %s
+        """,
+        (trial_id,),
+    )
+    [(duration, video_length, mouse_distance, clicks, metrics_json)] = cur.fetchall()
+    assert (duration, video_length, clicks) == (4.0, None, 3)
+    assert mouse_distance == pytest.approx(9.0)
+    assert json.loads(metrics_json)["mouse_clicks"]["total_clicks"] == 3
+
+    rollup = get_study_rollup(cur, study.study_id)
+    assert rollup["duration_s"]["count"] == 1
+    assert rollup["click_count"]["mean"] == 3
@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+import numpy as np
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.trial_streams import (
+    COLUMN_ENTRY,
+    HEADER,
+    MAGIC,
+    SCHEMA_VERSION,
+    parse_trial_stream,
+    read_measurement_frame,
+    running_time_ns,
+    trial_stream_to_csv,
+)
+
+
+def build_stream(columns, metadata):
+    # Mirrors the local tracker's writer: header, metadata, column directory, 8-byte aligned data
+    meta = json.dumps(metadata).encode("utf-8")
+    align = lambda n: (n + 7) // 8 * 8
+    offset = align(HEADER.size + len(meta) + COLUMN_ENTRY.size * len(columns))
+    entries, data = b"", b""
+    for name, arr in columns.items():
+        entries += COLUMN_ENTRY.pack(name.encode(), arr.dtype.str.encode(), offset)
+        padded = arr.tobytes().ljust(align(arr.nbytes), b"\x00")
+        data += padded
+        offset += len(padded)
+
+    rows = len(next(iter(columns.values())))
+    header = HEADER.pack(MAGIC, SCHEMA_VERSION, len(columns), len(meta), rows)
+    head = header + meta + entries
+    return head.ljust(align(len(head)), b"\x00") + data
+
+
+@pytest.fixture
+def keyboard_stream():
+    return build_stream(
+        {
+            "t_ns": np.array([250_000_000, 1_500_000_000], dtype=np.int64),
+            "code": np.array([0, 1], dtype=np.int32),
+        },
+        {"keys": ["a", "Key.backspace"], "trial_start_wall": 0, "utc_offset_s": 0},
+    )
+
+
+def test_parse_trial_stream(keyboard_stream):
+    metadata, columns = parse_trial_stream(keyboard_stream)
+    assert metadata["keys"] == ["a", "Key.backspace"]
+    assert columns["t_ns"].tolist() == [250_000_000, 1_500_000_000]
+    assert columns["code"].dtype == np.int32
+
+
+def test_keyboard_stream_matches_legacy_columns(tmp_path, keyboard_stream):
+    path = tmp_path / "Keyboard Inputs.fcol"
+    path.write_bytes(keyboard_stream)
+
+    df = read_measurement_frame(str(path))
+    assert list(df.columns) == ["Time", "running_time", "keys"]
+    assert df["keys"].tolist() == ["a", "Key.backspace"]
+    assert df["running_time"].tolist() == [0.25, 1.5]
+
+
+def test_running_time_skips_pauses():
+    # Paused 1s-3s and 4s-4.5s on the trial clock
+    t_ns = np.array([500, 1_000, 3_000, 3_500, 5_000]) * 1_000_000
+    pauses = [[1_000_000_000, 3_000_000_000], [4_000_000_000, 4_500_000_000]]
+    assert (running_time_ns(t_ns, pauses) // 1_000_000).tolist() == [
+        500,
+        1_000,
+        1_000,
+        1_500,
+        2_500,
+    ]
+    assert running_time_ns(t_ns, None).tolist() == t_ns.tolist()
+
+
+def test_csv_export(keyboard_stream):
+    csv_text = trial_stream_to_csv(keyboard_stream).decode("utf-8").splitlines()
+    assert csv_text[0] == "Time,running_time,keys"
+    assert csv_text[2] == "00:00:01,1.50,Key.backspace"
+
+
+def test_rejects_non_stream():
+    with pytest.raises(ValueError):
+        parse_trial_stream(b"Time,running_time,x,y\n0,0,0,0\n")
@@ -0,0 +1,186 @@
+import hashlib
+import io
+import os
+import sys
+import pytest
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.uploads import (
+    check_upload_owner,
+    expire_uploads,
+    init_upload,
+    missing_chunks,
+    open_upload,
+    store_chunk,
+)
+
+OWNER = 7
+
+
+def build_manifest(data, chunk_size):
+    # Mirrors the local tracker's build_upload_manifest
+    chunks = []
+    for index, offset in enumerate(range(0, len(data), chunk_size)):
+        piece = data[offset : offset + chunk_size]
+        chunks.append(
+            {
+                "index": index,
+                "offset": offset,
+                "size": len(piece),
+                "sha256": hashlib.sha256(piece).hexdigest(),
+            }
+        )
+    return {
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "chunks": chunks,
+    }
+
+
+@pytest.fixture
+def payload():
+    data = os.urandom(10_000)
+    return data, build_manifest(data, 4096)
+
+
+def send(root, upload_id, data, chunk):
+    piece = data[chunk["offset"] : chunk["offset"] + chunk["size"]]
+    store_chunk(root, upload_id, chunk["sha256"], io.BytesIO(piece), OWNER)
+
+
+def test_upload_resumes_with_only_missing_chunks(tmp_path, payload):
+    data, manifest = payload
+    root = str(tmp_path)
+
+    upload_id, missing = init_upload(root, manifest, OWNER)
+    assert missing == [0, 1, 2]
+    send(root, upload_id, data, manifest["chunks"][1])
+
+    # Connection dropped, client initialises again
+    upload_id_again, missing = init_upload(root, manifest, OWNER)
+    assert upload_id_again == upload_id
+    assert missing == [0, 2]
+
+    for index in missing:
+        send(root, upload_id, data, manifest["chunks"][index])
+
+    assert missing_chunks(root, upload_id) == []
+    with open_upload(root, upload_id) as f:
+        assert f.read() == data
+
+
+def test_open_upload_reads_chunks_in_place(tmp_path, payload):
+    data, manifest = payload
+    root = str(tmp_path)
+    upload_id, missing = init_upload(root, manifest, OWNER)
+    for index in missing:
+        send(root, upload_id, data, manifest["chunks"][index])
+
+    with open_upload(root, upload_id) as f:
+        assert f.read() == data
+        f.seek(4000)
+        assert f.read(200) == data[4000:4200]  # spans the first chunk boundary
+        f.seek(-10, os.SEEK_END)
+        assert f.read() == data[-10:]
+
+
+def test_corrupt_chunk_rejected(tmp_path, payload):
+    data, manifest = payload
+    root = str(tmp_path)
+    upload_id, _ = init_upload(root, manifest, OWNER)
+
+    chunk = manifest["chunks"][0]
+    with pytest.raises(ValueError):
+        store_chunk(
+            root, upload_id, chunk["sha256"], io.BytesIO(b"x" * chunk["size"]), OWNER
+        )
+    assert 0 in missing_chunks(root, upload_id)
+
+    with pytest.raises(ValueError):
+        open_upload(root, upload_id)
+
+
+# A chunk has to be exactly the size its manifest entry gives, not just hash to the entry's sha256
+def test_chunk_size_must_match_manifest(tmp_path, payload):
+    data, manifest = payload
+    root = str(tmp_path)
+    upload_id, _ = init_upload(root, manifest, OWNER)
+
+    chunk = manifest["chunks"][0]
+    piece = data[: chunk["size"]]
+    with pytest.raises(ValueError):
+        store_chunk(root, upload_id, chunk["sha256"], io.BytesIO(piece[:-1]), OWNER)
+    with pytest.raises(ValueError):
+        store_chunk(root, upload_id, chunk["sha256"], io.BytesIO(piece + b"x"), OWNER)
+    assert 0 in missing_chunks(root, upload_id)
+
+    # Repeated chunks cannot disagree on their size
+    repeated = build_manifest(b"a" * 8192, 4096)
+    repeated["chunks"][1]["size"] = 4095
+    repeated["size"] -= 1
+    with pytest.raises(ValueError):
+        init_upload(root, repeated, OWNER)
+
+
+# Every chunk can match its own entry while the file they add up to is not the one the manifest (and upload id) names
+def test_upload_checked_against_its_sha256(tmp_path, payload):
+    data, manifest = payload
+    root = str(tmp_path)
+    manifest["sha256"] = hashlib.sha256(b"another file").hexdigest()
+    upload_id, missing = init_upload(root, manifest, OWNER)
+    for index in missing:
+        send(root, upload_id, data, manifest["chunks"][index])
+
+    assert missing_chunks(root, upload_id) == []
+    with pytest.raises(ValueError):
+        open_upload(root, upload_id)
+
+
+def test_invalid_manifest_and_upload_ids(tmp_path, payload):
+    _, manifest = payload
+    root = str(tmp_path)
+
+    manifest["chunks"][1]["offset"] += 1
+    with pytest.raises(ValueError):
+        init_upload(root, manifest, OWNER)
+
+    with pytest.raises(ValueError):
+        missing_chunks(root, "../../etc")
+    with pytest.raises(FileNotFoundError):
+        missing_chunks(root, "0" * 64)
+
+
+def test_upload_belongs_to_its_owner(tmp_path, payload):
+    data, manifest = payload
+    root = str(tmp_path)
+    upload_id, _ = init_upload(root, manifest, OWNER)
+
+    chunk = manifest["chunks"][0]
+    with pytest.raises(PermissionError):
+        init_upload(root, manifest, OWNER + 1)
+    with pytest.raises(PermissionError):
+        store_chunk(
+            root, upload_id, chunk["sha256"], io.BytesIO(data[:4096]), OWNER + 1
+        )
+    with pytest.raises(PermissionError):
+        check_upload_owner(root, upload_id, OWNER + 1)
+    check_upload_owner(root, upload_id, OWNER)
+    assert missing_chunks(root, upload_id) == [0, 1, 2]
+
+
+def test_abandoned_uploads_expire(tmp_path, payload):
+    data, manifest = payload
+    root = str(tmp_path)
+    upload_id, _ = init_upload(root, manifest, OWNER)
+    send(root, upload_id, data, manifest["chunks"][0])
+
+    assert expire_uploads(root) == []
+    assert expire_uploads(root, max_age=-1) == [upload_id]
+    with pytest.raises(FileNotFoundError):
+        missing_chunks(root, upload_id)
+
+    # Once expired anyone can upload the same file again
+    _, missing = init_upload(root, manifest, OWNER + 1)
+    assert missing == [0, 1, 2]
@@ -0,0 +1,101 @@
+import io
+import os
+import struct
+import sys
+import zipfile
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.analytics.data_processor import extract_session_data_from_zip
+from app.utility.mp4_header import read_mp4_duration
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def build_mp4(timescale, duration, version=0):
+    # ftyp, a media data box and the movie header at the end, as recorders write it
+    if version == 1:
+        mvhd = b"\x01\x00\x00\x00" + struct.pack(">QQIQ", 0, 0, timescale, duration)
+    else:
+        mvhd = b"\x00\x00\x00\x00" + struct.pack(">IIII", 0, 0, timescale, duration)
+    mdat = os.urandom(5000)
+    return (
+        box(b"ftyp", b"isom\x00\x00\x02\x00")
+        # 64-bit size form
+        + struct.pack(">I4sQ", 1, b"mdat", 16 + len(mdat))
+        + mdat
+        + box(b"moov", box(b"mvhd", mvhd + b"\x00" * 80) + box(b"trak", b""))
+    )
+
+
+def test_mp4_duration_from_movie_header():
+    assert read_mp4_duration(io.BytesIO(build_mp4(1000, 12500))) == 12.5
+    assert read_mp4_duration(io.BytesIO(build_mp4(600, 900, version=1))) == 1.5
+    assert read_mp4_duration(io.BytesIO(box(b"ftyp", b"isom"))) is None
+
+
+def test_zip_is_read_in_one_pass(tmp_path, monkeypatch):
+    zip_path = tmp_path / "session.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr("101_trial_id/Screen Recording.mp4", build_mp4(1000, 12500))
+        zipf.writestr(
+            "101_trial_id/Mouse Movement.csv",
+            "Time,running_time,x,y\n10:00:00,0.5,10,20\n10:00:01,1.5,12,24\n",
+        )
+        zipf.writestr(
+            "102_trial_id/Mouse Movement.csv",
+            "Time,running_time,x,y\n10:05:00,0.25,3,4\n",
+        )
+        # Named by id only, the header tells what it is
+        zipf.writestr("102_trial_id/55.csv", "Time,running_time,keys\n10:05:00,0.5,a\n")
+        zipf.writestr("102_trial_id/Mouse Clicks.csv", "")
+        zipf.writestr("102_trial_id/Heat Map.png", b"\x89PNG")
+
+    opened = []
+    open_member = zipfile.ZipFile.open
+
+    def counting_open(self, name, *args, **kwargs):
+        opened.append(getattr(name, "filename", name))
+        return open_member(self, name, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "open", counting_open)
+
+    data = extract_session_data_from_zip(str(zip_path))
+
+    # Every member that is read is opened once, nothing else is opened
+    assert sorted(opened) == [
+        "101_trial_id/Mouse Movement.csv",
+        "101_trial_id/Screen Recording.mp4",
+        "102_trial_id/55.csv",
+        "102_trial_id/Mouse Clicks.csv",
+        "102_trial_id/Mouse Movement.csv",
+    ]
+    assert sorted(data) == ["Keyboard Input", "Mouse Movement", "video_durations"]
+    assert data["video_durations"] == {"101": 12.5}
+
+    moves = data["Mouse Movement"]
+    assert moves["x"].tolist() == [10, 12, 3]
+    assert moves["x"].dtype == "float64"
+    assert moves["_source_file"].tolist() == ["Mouse Movement.csv"] * 3
+    assert data["Keyboard Input"]["keys"].dtype == "category"
+
+
+def test_data_type_filter_keeps_video_durations(tmp_path):
+    zip_path = tmp_path / "session.zip"
+    with zipfile.ZipFile(zip_path, "w") as zipf:
+        zipf.writestr("101_trial_id/Screen Recording.mp4", build_mp4(1000, 12500))
+        zipf.writestr(
+            "101_trial_id/Mouse Movement.csv",
+            "Time,running_time,x,y\n10:00:00,0.5,1,2\n",
+        )
+        zipf.writestr(
+            "101_trial_id/Keyboard Inputs.csv",
+            "Time,running_time,keys\n10:00:00,0.5,a\n",
+        )
+
+    data = extract_session_data_from_zip(str(zip_path), data_type="Mouse Movement")
+    assert sorted(data) == ["Mouse Movement", "video_durations"]
+    assert data["video_durations"] == {"101": 12.5}
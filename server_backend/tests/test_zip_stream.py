@@ -0,0 +1,86 @@
+import io
+import os
+import sys
+import zipfile
+
+# Set up import path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utility.sessions import get_all_study_csv_files, get_zip_entries
+from app.utility.zip_stream import stream_zip
+
+
+def test_streamed_archive_is_readable_and_chunked(tmp_path):
+    video = os.urandom(3 * 4096 + 17)
+    video_path = tmp_path / "screen.mp4"
+    video_path.write_bytes(video)
+    csv = b"running_time,x,y\n" + b"0.5,10,20\n" * 2000
+
+    video_file = open(video_path, "rb")
+    chunks = list(
+        stream_zip(
+            [
+                ("1_participant_session/Mouse Movement.csv", csv),
+                ("1_participant_session/Screen Recording.mp4", video_file),
+            ],
+            chunk_size=4096,
+        )
+    )
+
+    # No chunk holds more than a block of the file plus the zip headers around it
+    assert max(len(chunk) for chunk in chunks) < 4096 + 1024
+    assert video_file.closed
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zipf:
+        assert zipf.testzip() is None
+        csv_info, video_info = zipf.infolist()
+        assert csv_info.compress_type == zipfile.ZIP_DEFLATED
+        assert csv_info.compress_size < len(csv)
+        assert video_info.compress_type == zipfile.ZIP_STORED
+        assert zipf.read(csv_info) == csv
+        assert zipf.read(video_info) == video
+
+
+def test_export_entries_use_a_fixed_number_of_queries(counted_db, study, tmp_path):
+    for hours, trials in ((0, 3), (1, 2)):
+        participant_session_id = study.add_session(hours=hours)
+        for minutes in range(trials):
+            trial_id = study.add_trial(participant_session_id, minutes=minutes)
+            path = tmp_path / f"{trial_id}.csv"
+            path.write_bytes(b"running_time,x,y\n")
+            study.add_file(trial_id, "Mouse Clicks", path)
+
+    survey_path = tmp_path / "pre.csv"
+    survey_path.write_bytes(b"q1,a1\n")
+    cur = counted_db.cursor()
+    cur.execute(
+        "INSERT INTO survey_form (study_id, form_type, file_path) VALUES (%s, 'pre', %s)",
+        (study.study_id, str(survey_path)),
+    )
+    cur.execute(
+        """
+        INSERT INTO survey_results (survey_form_id, participant_session_id, file_path)
+        VALUES (%s, %s, %s)
+        """,
+        (cur.lastrowid, participant_session_id, str(survey_path)),
+    )
+    counted_db.commit()
+
+    rows = get_all_study_csv_files(study.study_id, cur)
+    counted_db.queries.clear()
+    entries = list(get_zip_entries(rows, study.study_id, counted_db, mode="study"))
+    assert len(counted_db.queries) == 3
+
+    # Trials are numbered latest first
+    names = [name for name, source in entries]
+    assert names == [
+        "1_participant_session/Typing_Quiet_trial_3/Mouse Clicks.csv",
+        "1_participant_session/Typing_Quiet_trial_2/Mouse Clicks.csv",
+        "1_participant_session/Typing_Quiet_trial_1/Mouse Clicks.csv",
+        "2_participant_session/Typing_Quiet_trial_2/Mouse Clicks.csv",
+        "2_participant_session/Typing_Quiet_trial_1/Mouse Clicks.csv",
+        "2_participant_session/pre_survey/pre_survey_results.csv",
+    ]
+
+    for _, source in entries:
+        source.close()
@@ -92,6 +92,7 @@ CREATE TABLE task (
     -- Tells participant what to do
     task_directions VARCHAR(255) NULL,
     duration DECIMAL(6, 3) NULL,
+    INDEX idx_task_study (study_id, task_name),
     FOREIGN KEY (study_id) REFERENCES study(study_id)
 );
 -- Different tracking types
@@ -112,6 +113,7 @@ CREATE TABLE factor (
     study_id INT,
     factor_name VARCHAR(255) NOT NULL,
     factor_description VARCHAR(255) NULL,
+    INDEX idx_factor_study (study_id, factor_name),
     FOREIGN KEY (study_id) REFERENCES study(study_id)
 );
 -- This assumes every task has the same factors. need to double-check
@@ -184,6 +186,9 @@ CREATE TABLE participant_session (
     session_setup_json_path VARCHAR(255),
     current_step_index TINYINT DEFAULT 0,
     started_at TIMESTAMP NULL,
+    -- Sessions of a study in creation order (folder numbering, time windows) and per participant
+    INDEX idx_participant_session_study_created (study_id, created_at),
+    INDEX idx_participant_session_study_participant (study_id, participant_id),
     FOREIGN KEY (participant_id) REFERENCES participant(participant_id),
     FOREIGN KEY (study_id) REFERENCES study(study_id),
     CHECK (is_valid IN (0, 1))
@@ -196,6 +201,9 @@ CREATE TABLE trial (
     factor_id INT,
     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL, -- THIS SHOULD BE INPUT EACH TIME A PROGRESSION IS MADE
     ended_at TIMESTAMP NULL,
+    -- Trials of a session in order, and of a task with their timings (completion time queries)
+    INDEX idx_trial_session_started (participant_session_id, started_at),
+    INDEX idx_trial_task_session (task_id, participant_session_id, started_at, ended_at),
     FOREIGN KEY (participant_session_id) REFERENCES participant_session(participant_session_id),
     FOREIGN KEY (task_id) REFERENCES task(task_id) ON DELETE CASCADE,
     FOREIGN KEY (factor_id) REFERENCES factor(factor_id) ON DELETE CASCADE
@@ -210,11 +218,59 @@ CREATE TABLE session_data_instance (
     session_data_instance_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
     trial_id INT,
     measurement_option_id INT,
-    -- This is where it is stored on hci
+    -- This is where it is stored on hci (content-addressed, identical files share a path)
     results_path VARCHAR(255) NULL,
+    -- Recorded at ingest, to check the stored file against without reading it
+    size_bytes BIGINT NULL,
+    sha256 CHAR(64) NULL,
+    -- Covers the file listing joins (trial -> option and path) without reading the rows
+    INDEX idx_sdi_trial_option (trial_id, measurement_option_id, results_path),
     FOREIGN KEY (trial_id) REFERENCES trial(trial_id),
     FOREIGN KEY (measurement_option_id) REFERENCES measurement_option(measurement_option_id) ON DELETE CASCADE
 );
+-- Metrics of each trial, computed once from its files by a background job after upload
+CREATE TABLE trial_metrics (
+    trial_id INT NOT NULL PRIMARY KEY,
+    duration_s DOUBLE NULL,
+    video_length_s DOUBLE NULL,
+    mouse_distance DOUBLE NULL,
+    mouse_avg_speed DOUBLE NULL,
+    mouse_path_efficiency DOUBLE NULL,
+    click_count INT NULL,
+    keypresses INT NULL,
+    corrections INT NULL,
+    typing_speed DOUBLE NULL,
+    -- Every computed metric, including the ones without a column
+    metrics_json JSON NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    FOREIGN KEY (trial_id) REFERENCES trial(trial_id) ON DELETE CASCADE
+);
+-- Running aggregates of trial_metrics columns per study and per task, updated with every trial_metrics write
+-- histogram holds bucket counts, the bucket edges are fixed in metric_rollups.py
+CREATE TABLE study_metric_rollup (
+    study_id INT NOT NULL,
+    metric VARCHAR(32) NOT NULL,
+    n INT NOT NULL DEFAULT 0,
+    total DOUBLE NOT NULL DEFAULT 0,
+    total_sq DOUBLE NOT NULL DEFAULT 0,
+    min_value DOUBLE NULL,
+    max_value DOUBLE NULL,
+    histogram JSON NOT NULL,
+    PRIMARY KEY (study_id, metric),
+    FOREIGN KEY (study_id) REFERENCES study(study_id)
+);
+CREATE TABLE task_metric_rollup (
+    task_id INT NOT NULL,
+    metric VARCHAR(32) NOT NULL,
+    n INT NOT NULL DEFAULT 0,
+    total DOUBLE NOT NULL DEFAULT 0,
+    total_sq DOUBLE NOT NULL DEFAULT 0,
+    min_value DOUBLE NULL,
+    max_value DOUBLE NULL,
+    histogram JSON NOT NULL,
+    PRIMARY KEY (task_id, metric),
+    FOREIGN KEY (task_id) REFERENCES task(task_id) ON DELETE CASCADE
+);
 CREATE TABLE deleted_study (
     study_id INT NOT NULL PRIMARY KEY,
     deleted_by_user_id INT NOT NULL,
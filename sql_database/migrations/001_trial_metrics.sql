@@ -0,0 +1,22 @@
+-- Per-trial metrics, computed once from each trial's files by a background job after upload
+-- create_tables.sql already has this table, run this once against databases created before it:
+--   mysql -u <user> -p <database> < sql_database/migrations/001_trial_metrics.sql
+-- Trials uploaded earlier get a row once precompute_trial_metrics is run for them, until
+-- then analytics reads their measurement files as before.
+
+CREATE TABLE IF NOT EXISTS trial_metrics (
+    trial_id INT NOT NULL PRIMARY KEY,
+    duration_s DOUBLE NULL,
+    video_length_s DOUBLE NULL,
+    mouse_distance DOUBLE NULL,
+    mouse_avg_speed DOUBLE NULL,
+    mouse_path_efficiency DOUBLE NULL,
+    click_count INT NULL,
+    keypresses INT NULL,
+    corrections INT NULL,
+    typing_speed DOUBLE NULL,
+    -- Every computed metric, including the ones without a column
+    metrics_json JSON NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    FOREIGN KEY (trial_id) REFERENCES trial(trial_id) ON DELETE CASCADE
+);
@@ -0,0 +1,33 @@
+-- Running aggregates of trial_metrics columns per study and per task, updated with every trial_metrics write
+-- create_tables.sql already has these tables, run this once against databases created before them,
+-- after 001_trial_metrics.sql:
+--   mysql -u <user> -p <database> < sql_database/migrations/002_metric_rollups.sql
+-- Studies that already have trial_metrics rows are filled in with
+-- metric_rollups.rebuild_rollups(cursor, study_id), committed once per study.
+
+-- histogram holds bucket counts, the bucket edges are fixed in metric_rollups.py
+CREATE TABLE IF NOT EXISTS study_metric_rollup (
+    study_id INT NOT NULL,
+    metric VARCHAR(32) NOT NULL,
+    n INT NOT NULL DEFAULT 0,
+    total DOUBLE NOT NULL DEFAULT 0,
+    total_sq DOUBLE NOT NULL DEFAULT 0,
+    min_value DOUBLE NULL,
+    max_value DOUBLE NULL,
+    histogram JSON NOT NULL,
+    PRIMARY KEY (study_id, metric),
+    FOREIGN KEY (study_id) REFERENCES study(study_id)
+);
+
+CREATE TABLE IF NOT EXISTS task_metric_rollup (
+    task_id INT NOT NULL,
+    metric VARCHAR(32) NOT NULL,
+    n INT NOT NULL DEFAULT 0,
+    total DOUBLE NOT NULL DEFAULT 0,
+    total_sq DOUBLE NOT NULL DEFAULT 0,
+    min_value DOUBLE NULL,
+    max_value DOUBLE NULL,
+    histogram JSON NOT NULL,
+    PRIMARY KEY (task_id, metric),
+    FOREIGN KEY (task_id) REFERENCES task(task_id) ON DELETE CASCADE
+);
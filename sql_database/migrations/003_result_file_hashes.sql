@@ -0,0 +1,9 @@
+-- Size and sha256 of each stored result file, recorded at ingest
+-- create_tables.sql already has these columns, run this once against databases created before them:
+--   mysql -u <user> -p <database> < sql_database/migrations/003_result_file_hashes.sql
+-- Rows of files ingested earlier keep NULLs, verify_study_files skips them. Their
+-- results_path still points at the per-trial folders they were extracted to.
+
+ALTER TABLE session_data_instance
+    ADD COLUMN size_bytes BIGINT NULL AFTER results_path,
+    ADD COLUMN sha256 CHAR(64) NULL AFTER size_bytes;
@@ -0,0 +1,28 @@
+-- Composite indexes for the analytics and export access paths
+-- create_tables.sql already has these, run this once against databases created before them:
+--   mysql -u <user> -p <database> < sql_database/migrations/004_analytics_indexes.sql
+-- The single column indexes InnoDB created for the foreign keys are dropped by MySQL
+-- once one of these can back the constraint instead.
+
+-- Study filters on tasks and factors (export folder names, per task analytics)
+ALTER TABLE task
+    ADD INDEX idx_task_study (study_id, task_name);
+
+ALTER TABLE factor
+    ADD INDEX idx_factor_study (study_id, factor_name);
+
+-- Sessions of a study in creation order (folder numbering, time windows) and per participant
+ALTER TABLE participant_session
+    ADD INDEX idx_participant_session_study_created (study_id, created_at),
+    ADD INDEX idx_participant_session_study_participant (study_id, participant_id);
+
+-- Trials of a session in order, and of a task with their timings (completion time queries)
+ALTER TABLE trial
+    ADD INDEX idx_trial_session_started (participant_session_id, started_at),
+    ADD INDEX idx_trial_task_session (task_id, participant_session_id, started_at, ended_at);
+
+-- Covers the file listing joins (trial -> option and path) without reading the rows
+ALTER TABLE session_data_instance
+    ADD INDEX idx_sdi_trial_option (trial_id, measurement_option_id, results_path);
+
+ANALYZE TABLE task, factor, participant_session, trial, session_data_instance;